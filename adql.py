@@ -0,0 +1,96 @@
+"""
+Build ADQL for gaiadr3.gaia_source with the pipeline's filters pushed down to the archive.
+
+Filters applied in pandas after the download make the archive ship rows that
+are thrown away: stars without a positive parallax (the pipeline keeps
+distance > 0 only), magnitudes outside the wanted bounds, stars outside the
+part of the sky that is drawn, and rows past the N that are used. gaia_query
+writes those filters into the WHERE, TOP and ORDER BY clauses instead:
+
+    gaia_query(positive_parallax=True, magnitude=(10, 15), cone=hemisphere(33, -20), top=100)
+
+Cone and hemisphere constraints are on the Sun-centred ra and dec, i.e. on
+the direction of the stars as seen from the Solar System, and TOP N ORDER BY
+phot_g_mean_mag keeps the N brightest as seen from the Sun. They are exact for
+queries about the sky seen from Earth; a selection by brightness seen from a
+distant planet cannot be pushed down that way. log_transfer records how many
+of the transferred rows a query's caller actually used.
+"""
+import logging
+
+# Columns pulled from gaiadr3.gaia_source
+GAIA_COLUMNS = ["source_id", "ra", "dec", "phot_g_mean_mag", "parallax", "pmra", "pmdec"]
+
+GAIA_TABLE = "gaiadr3.gaia_source"
+
+logger = logging.getLogger(__name__)
+
+
+def hemisphere(ra, dec):
+    """Cone of 90 degrees around a direction: the half of the sky centred on it, for gaia_query(cone=...)."""
+    return ra, dec, 90.0
+
+
+def gaia_query(columns=GAIA_COLUMNS, table=GAIA_TABLE, xp_sampled=True, random_index=None, source_id=None,
+               positive_parallax=False, magnitude=(None, None), cone=None, top=None, order_by="phot_g_mean_mag"):
+    """
+    Build a Gaia query with the given filters in ADQL.
+
+    Parameters:
+    - columns (list): Columns to select.
+    - table (str): Table to query.
+    - xp_sampled (bool): Keep only sources with sampled XP spectra (has_xp_sampled), as every query of the
+      project does.
+    - random_index (tuple): Inclusive (low, high) random_index window, None for no window.
+    - source_id (tuple): Inclusive (low, high) source_id range, None for no range.
+    - positive_parallax (bool): Keep only parallax > 0, the stars with a distance.
+    - magnitude (tuple): Exclusive (lower, upper) bounds on phot_g_mean_mag; None leaves a side open.
+    - cone (tuple): (ra, dec, radius) in degrees; only stars within the radius of that direction are kept.
+    - top (int): Keep the first `top` rows in `order_by` order, None for all rows.
+    - order_by (str): Sort column of a TOP query, ascending; brightest first for phot_g_mean_mag. None leaves
+      the query unsorted, so the archive returns whichever `top` matching rows it finds first.
+
+    Returns:
+    - str: The ADQL query.
+    """
+    predicates = []
+    if xp_sampled:
+        predicates.append("has_xp_sampled = 'True'")
+    if random_index is not None:
+        predicates.append(f"random_index BETWEEN {int(random_index[0])} AND {int(random_index[1])}")
+    if source_id is not None:
+        predicates.append(f"source_id BETWEEN {int(source_id[0])} AND {int(source_id[1])}")
+    if positive_parallax:
+        predicates.append("parallax > 0")
+
+    # Magnitude bounds, as the pandas filters of brightness.py
+    lower, upper = magnitude
+    if lower is not None:
+        predicates.append(f"phot_g_mean_mag > {float(lower)!r}")
+    if upper is not None:
+        predicates.append(f"phot_g_mean_mag < {float(upper)!r}")
+
+    if cone is not None:
+        ra, dec, radius = (float(value) for value in cone)
+        predicates.append(f"CONTAINS(POINT('ICRS', ra, dec), CIRCLE('ICRS', {ra!r}, {dec!r}, {radius!r})) = 1")
+
+    query = f"SELECT {f'TOP {int(top)} ' if top is not None else ''}{', '.join(columns)} FROM {table}"
+    if predicates:
+        query += "\nWHERE " + "\nAND ".join(predicates)
+    if top is not None and order_by is not None:
+        query += f"\nORDER BY {order_by}"
+    return query
+
+
+def log_transfer(query, transferred, used):
+    """
+    Log how many of the rows a query transferred were used.
+
+    Parameters:
+    - query (str): The ADQL query.
+    - transferred (int): Rows the archive returned.
+    - used (int): Rows the caller kept.
+    """
+    share = used / transferred if transferred else 1.0
+    logger.info("Gaia query transferred %d rows, %d used (%.1f%%): %s",
+                transferred, used, 100 * share, " ".join(query.split()))
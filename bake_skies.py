@@ -0,0 +1,199 @@
+"""
+Precompute the sky of every planet of an exoplanet table into a sky archive.
+
+Planets are split into chunks computed by a process pool. Every finished chunk
+is written to a part file next to the archive, so an interrupted bake picks up
+where it stopped; the parts are assembled into the single archive file at the
+end. Planets of the same system share their coordinates and distance, so their
+sky is computed once. Every planet with a known distance also gets the sky at
+unknown (infinite) distance, which is what a /star_positions/ request without
+planet_distance asks for.
+
+Usage:
+    python bake_skies.py exoplanets.csv catalog/ skies.archive --limit 1000
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from catalog_store import load_catalog
+from coordinate_kernels import celestial_to_cartesian
+from exoplanets import load_exoplanets
+from magnitude_selection import INDEX_DIR_NAME, MagnitudeBoundIndex, load_magnitude_index
+from response_cache import ResponseCache, grid_steps
+from sky_archive import INDEX_DTYPE, distance_key, write_archive
+from sky_batch import DEFAULT_PLANET_DISTANCE, skies_from_selections
+
+# Catalog store and selection index of a worker process
+_worker = {}
+
+
+def bake_plan(planets, limits, tolerance):
+    """
+    List the distinct skies to compute: each planet at its distance and, for requests that give none, at an
+    unknown distance.
+
+    Parameters:
+    - planets (pd.DataFrame): Exoplanet table from load_exoplanets.
+    - limits (list): Star counts to bake for every planet.
+    - tolerance (float): Angular quantization step in degrees, as used by the star API cache.
+
+    Returns:
+    - np.ndarray: INDEX_DTYPE records (offset and count unset), one per distinct sky.
+    - np.ndarray: (skies, 2) snapped RA and Dec the skies are computed at.
+    """
+    snapper = ResponseCache(tolerance=tolerance)
+    entries, coordinates, seen = [], [], set()
+    for ra, dec, distance in zip(planets["ra"].tolist(), planets["dec"].tolist(), planets["distance"].tolist()):
+        ra_step, dec_step = grid_steps(ra, dec, tolerance)
+        for limit in limits:
+            for sky_distance in ((distance, np.nan) if not np.isnan(distance) else (np.nan,)):
+                key = (ra_step, dec_step, limit, distance_key(sky_distance))
+                if key in seen:
+                    continue
+                seen.add(key)
+                entries.append((ra_step, dec_step, limit, sky_distance, 0, 0))
+                coordinates.append(snapper.snap(ra, dec))
+    return np.array(entries, dtype=INDEX_DTYPE), np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+
+
+def _init_worker(catalog_path):
+    catalog = load_catalog(catalog_path)
+    _worker["catalog"] = catalog
+    _worker["index"] = load_magnitude_index(catalog)
+
+
+def _bake_chunk(part_path, entries, coordinates):
+    """Compute the skies of one chunk and write them to `part_path`. Returns the number of skies."""
+    catalog, index = _worker["catalog"], _worker["index"]
+
+    # Same planet position and selection as the star API
+    distances = np.where(np.isnan(entries["distance"]), DEFAULT_PLANET_DISTANCE, entries["distance"])
+    planet_positions = np.column_stack(celestial_to_cartesian(coordinates[:, 0], coordinates[:, 1], distances))
+    selections = [index.select_brightest(position, limit)
+                  for position, limit in zip(planet_positions, entries["limit"].tolist())]
+    skies = skies_from_selections(catalog, selections)
+
+    counts = np.array([len(sky[0]) for sky in skies], dtype=np.int64)
+    columns = {
+        name: np.concatenate([sky[i] for sky in skies]) if skies else np.empty(0)
+        for i, name in enumerate(("source_id", "x", "y", "brightness"))
+    }
+
+    # Write then rename, so a part file is either complete or absent
+    tmp_path = f"{part_path}.tmp.npz"
+    np.savez(tmp_path, counts=counts, **columns)
+    os.replace(tmp_path, part_path)
+    return len(skies)
+
+
+def bake(exoplanet_path, catalog_path, archive_path, limits, tolerance=1e-4, workers=None, chunk_size=64):
+    """
+    Bake the skies of every planet of an exoplanet table.
+
+    Parameters:
+    - exoplanet_path (str): Exoplanet table CSV.
+    - catalog_path (str): Directory of the catalog store.
+    - archive_path (str): Archive file to write.
+    - limits (list): Star counts to bake for every planet.
+    - tolerance (float): Angular quantization step of the lookup keys, in degrees.
+    - workers (int): Worker processes; all CPUs by default.
+    - chunk_size (int): Skies per part file.
+
+    Returns:
+    - dict: The archive header.
+    """
+    catalog = load_catalog(catalog_path)
+    planets = load_exoplanets(exoplanet_path)
+    entries, coordinates = bake_plan(planets, limits, tolerance)
+
+    # Workers load the selection index from disk rather than each building it
+    if load_magnitude_index(catalog) is None:
+        logging.info("Building the magnitude index of %s", catalog_path)
+        MagnitudeBoundIndex.build(catalog).save(os.path.join(catalog_path, INDEX_DIR_NAME))
+
+    # Parts of a previous run are reused only if they were baked with the same plan
+    parts_dir = f"{archive_path}.parts"
+    os.makedirs(parts_dir, exist_ok=True)
+    plan = {
+        "catalog_version": catalog.version,
+        "tolerance": tolerance,
+        "chunk_size": chunk_size,
+        "plan_digest": hashlib.sha1(entries.tobytes() + coordinates.tobytes()).hexdigest(),
+    }
+    plan_path = os.path.join(parts_dir, "bake.json")
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            if json.load(f) != plan:
+                raise ValueError(f"{parts_dir} holds parts of a different bake; remove it to start over")
+    else:
+        with open(plan_path, "w") as f:
+            json.dump(plan, f)
+
+    chunks = [(start, min(start + chunk_size, len(entries))) for start in range(0, len(entries), chunk_size)]
+    part_paths = [os.path.join(parts_dir, f"part-{number:06d}.npz") for number in range(len(chunks))]
+    pending = [number for number, part_path in enumerate(part_paths) if not os.path.exists(part_path)]
+    logging.info("%d planets, %d skies in %d parts, %d left to bake",
+                 len(planets), len(entries), len(chunks), len(pending))
+
+    # Bake the missing parts, reporting throughput as they complete
+    start_time = time.perf_counter()
+    baked = 0
+    remaining = sum(chunks[number][1] - chunks[number][0] for number in pending)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(catalog_path,)) as executor:
+        futures = [
+            executor.submit(_bake_chunk, part_paths[number], entries[slice(*chunks[number])],
+                            coordinates[slice(*chunks[number])])
+            for number in pending
+        ]
+        for future in as_completed(futures):
+            baked += future.result()
+            elapsed = time.perf_counter() - start_time
+            rate = baked / elapsed if elapsed else 0.0
+            logging.info("Baked %d/%d planet skies, %.1f planets/sec, %.0f s left",
+                         baked, remaining, rate, (remaining - baked) / rate if rate else 0)
+
+    # Assemble the parts into the archive, one column and one part at a time
+    counts = np.concatenate([np.load(part_path)["counts"] for part_path in part_paths]) if part_paths else []
+    entries["count"] = counts
+    entries["offset"] = np.concatenate(([0], np.cumsum(entries["count"])[:-1])) if len(entries) else []
+    parts = [lambda part_path=part_path: np.load(part_path) for part_path in part_paths]
+    header = write_archive(archive_path, entries, parts,
+                           {"catalog_version": catalog.version, "tolerance": tolerance, "limits": list(limits)})
+
+    for part_path in part_paths:
+        os.remove(part_path)
+    os.remove(plan_path)
+    os.rmdir(parts_dir)
+
+    elapsed = time.perf_counter() - start_time
+    logging.info("Wrote %d skies (%d stars) to %s in %.1f s, %.1f planets/sec overall",
+                 header["entries"], header["stars"], archive_path, elapsed, baked / elapsed if elapsed else 0.0)
+    return header
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute exoplanet skies into a sky archive.")
+    parser.add_argument("exoplanets", help="Exoplanet table CSV from the NASA Exoplanet Archive.")
+    parser.add_argument("catalog", help="Directory of the catalog store.")
+    parser.add_argument("archive", help="Sky archive file to write.")
+    parser.add_argument("--limit", type=int, action="append", help="Stars per sky; repeat to bake several counts.")
+    parser.add_argument("--tolerance", type=float, default=float(os.environ.get("STAR_CACHE_TOLERANCE_DEG", 1e-4)),
+                        help="Angular quantization step in degrees; must match the API's STAR_CACHE_TOLERANCE_DEG.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    bake(args.exoplanets, args.catalog, args.archive, args.limit or [10],
+         tolerance=args.tolerance, workers=args.workers, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Memory and time of the chunked catalog scan against the chunk size and the number of workers.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_catalog_scan
+    python -m benchmarks.bench_catalog_scan --stars 10000000 --chunk-rows 65536 1048576 --workers 1 4
+
+A synthetic catalog store is written to a temporary directory and the --limit
+brightest stars seen from a planet are selected by scan_brightest for every
+combination of chunk size and workers. The peak memory allocated by the scan,
+traced with tracemalloc, grows with chunk_rows * workers and not with
+--stars; the memory-mapped columns are page cache and are not counted. Each
+selection is checked against the magnitude index.
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_executor_latency import synthetic_catalog
+from catalog_scan import scan_brightest
+from catalog_store import load_catalog
+from coordinate_kernels import celestial_to_cartesian
+from magnitude_selection import MagnitudeBoundIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=2_000_000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--chunk-rows", type=int, nargs="+", default=[1 << 16, 1 << 18, 1 << 20])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        synthetic_catalog(catalog_dir, args.stars)
+        catalog = load_catalog(catalog_dir)
+        planet_position = celestial_to_cartesian(33.0, -20.0, 80.0)
+        expected = MagnitudeBoundIndex.build(catalog).select_brightest(planet_position, args.limit)[0]
+
+        print(f"{'chunk rows':>10} {'workers':>8} {'peak (MB)':>10} {'B/chunk row':>12} {'seconds':>8} {'match':>6}")
+        for chunk_rows in args.chunk_rows:
+            for workers in args.workers:
+                tracemalloc.start()
+                start = time.perf_counter()
+                rows, _ = scan_brightest(catalog, planet_position, args.limit, chunk_rows=chunk_rows,
+                                         workers=workers)
+                seconds = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{chunk_rows:>10} {workers:>8} {peak / 2 ** 20:>10.1f} "
+                      f"{peak / (min(chunk_rows, args.stars) * workers):>12.0f} {seconds:>8.2f} "
+                      f"{str(np.array_equal(rows, expected)):>6}")
+
+
+if __name__ == "__main__":
+    main()
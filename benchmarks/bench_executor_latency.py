@@ -0,0 +1,139 @@
+"""
+Latency of /star_positions/ while some requests are slow, with and without the compute executor.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_executor_latency
+    python -m benchmarks.bench_executor_latency --requests 400 --slow-seconds 2
+
+A synthetic catalog store is written to a temporary directory and the API is
+served by uvicorn on a local port. Fast requests for distinct planets are sent
+from --concurrency client threads while a few requests take --slow-seconds of
+blocking time, standing in for a slow Gaia query. In
+"inline" mode the work runs on the event loop, as the endpoint did before the
+executor, so every slow request stalls the fast ones; with the executor the
+p99 of the fast requests should stay close to their p50.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def synthetic_catalog(path, n, seed=0):
+    """Write a catalog store of `n` uniformly distributed stars."""
+    from catalog_store import write_catalog
+
+    rng = np.random.default_rng(seed)
+    write_catalog(path, {
+        "source_id": np.arange(1, n + 1, dtype=np.int64),
+        "ra": rng.uniform(0, 360, n),
+        "dec": np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+        "phot_g_mean_mag": rng.uniform(3, 21, n).astype(np.float32),
+        "parallax": rng.uniform(0.05, 20, n),
+        "pmra": rng.normal(0, 5, n),
+        "pmdec": rng.normal(0, 5, n),
+    })
+
+
+def measure(api, requests, concurrency, slow_every, slow_seconds, limit):
+    """Serve the API on a local port, send the requests and return the fast latencies and the status counts."""
+    import httpx
+    import uvicorn
+
+    slow_ra = 359.5
+    compute = api.compute_star_arrays
+
+    def compute_with_slow_planets(planet_ra, planet_dec, *args, **kwargs):
+        if planet_ra == slow_ra:
+            time.sleep(slow_seconds)
+        return compute(planet_ra, planet_dec, *args, **kwargs)
+
+    jobs = []
+    for i in range(requests):
+        slow = bool(slow_every) and i % slow_every == slow_every // 2
+        jobs.append((slow, {"planet_ra": slow_ra if slow else (i * 0.37) % 359, "planet_dec": (i * 0.71) % 180 - 90,
+                            "limit": limit, "planet_distance": 100 + i}))
+    jobs.reverse()
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=0, log_level="warning"))
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    api.compute_star_arrays = compute_with_slow_planets
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    latencies, statuses, lock = [], {}, threading.Lock()
+
+    def client_loop():
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            while True:
+                with lock:
+                    if not jobs:
+                        return
+                    slow, params = jobs.pop()
+                start = time.perf_counter()
+                response = client.get("/star_positions/", params=params)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if not slow:
+                        latencies.append(elapsed)
+
+    clients = [threading.Thread(target=client_loop) for _ in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    server.should_exit = True
+    server_thread.join()
+    api.compute_star_arrays = compute
+    return np.array(latencies), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--slow-every", type=int, default=50)
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    parser.add_argument("--limit", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        synthetic_catalog(catalog_dir, args.stars)
+        os.environ["GAIA_CATALOG_DIR"] = catalog_dir
+        os.environ.pop("STAR_CACHE_DIR", None)
+        os.environ.pop("STAR_ARCHIVE_PATH", None)
+        import gaia_proj_json6_api as api
+
+        # Load the catalog and build the selection index before timing
+        api.get_magnitude_index()
+        executor_run_blocking = api.run_blocking
+
+        async def inline_run_blocking(function, *function_args):
+            return function(*function_args)
+
+        print(f"{'mode':>10} {'fast reqs':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}   statuses")
+        for mode, run_blocking in (("inline", inline_run_blocking), ("executor", executor_run_blocking)):
+            api.run_blocking = run_blocking
+            api.response_cache.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, statuses = measure(
+                    api, args.requests, args.concurrency, args.slow_every, args.slow_seconds, args.limit
+                )
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{mode:>10} {len(latencies):>10} {p50:>10.1f} {p99:>10.1f} {latencies.max() * 1000:>10.1f}   {statuses}")
+        api.run_blocking = executor_run_blocking
+        print("executor:", api.compute_executor.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark the fused horizon-frame kernel against the multi-step projection paths.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_horizon
+    python -m benchmarks.bench_horizon --sizes 1000 100000 1000000 --distance 80
+
+For each size a synthetic sky of stars around a planet at --distance parsecs is
+projected three ways:
+- dataframe: recalculate_star_positions, the DataFrame pipeline of the live
+  Gaia path (shift, planar_projection, normalization, brightness, each a pass
+  over new columns);
+- block: project_block, the kernels the catalog store path runs (projection
+  through the ICRS z axis, then normalization and brightness);
+- horizon: project_block_horizon, one rotation matmul, the horizon cull and
+  the projection and normalization of the survivors.
+Times are the best of --repeat runs. The horizon path also reports the share
+of stars it kept, since it returns the visible stars only.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_kernels import best_of
+from coordinate_kernels import celestial_to_cartesian
+
+PLANET_RA, PLANET_DEC = 33.0, -20.0
+
+
+def synthetic_block(n, seed=0):
+    """A StarBlock of `n` uniformly distributed stars with Gaia-like distances, and the same stars as a DataFrame."""
+    from star_block import StarBlock
+
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    distance = 1000 / rng.uniform(0.05, 20, n)
+    x, y, z = celestial_to_cartesian(ra, dec, distance)
+    magnitude = np.sort(rng.uniform(3, 15, n))
+    source_id = np.arange(1, n + 1, dtype=np.int64)
+    df = pd.DataFrame({"SOURCE_ID": source_id, "ra": ra, "dec": dec, "distance": distance, "x": x, "y": y, "z": z,
+                       "apparent_mag": magnitude})
+    return StarBlock(source_id, x, y, z, distance, magnitude), df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--distance", type=float, default=80.0, help="Planet distance in parsecs.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    import gaia_proj_json6_api as api
+    from star_block import project_block, project_block_horizon
+
+    planet_position = celestial_to_cartesian(PLANET_RA, PLANET_DEC, args.distance)
+    print(f"{'stars':>10} {'dataframe (s)':>14} {'block (s)':>10} {'horizon (s)':>12} {'vs block':>9} "
+          f"{'vs dataframe':>13} {'kept':>6}")
+    for n in args.sizes:
+        block, df = synthetic_block(n)
+        dataframe_seconds = best_of(lambda: api.recalculate_star_positions(
+            PLANET_RA, PLANET_DEC, df.copy(), args.distance, magnitude_column="apparent_mag"), args.repeat)
+        block_seconds = best_of(lambda: project_block(block), args.repeat)
+        horizon_seconds = best_of(lambda: project_block_horizon(block, planet_position, PLANET_RA, PLANET_DEC),
+                                  args.repeat)
+        kept = len(project_block_horizon(block, planet_position, PLANET_RA, PLANET_DEC)[0]) / n
+        print(f"{n:>10} {dataframe_seconds:>14.4f} {block_seconds:>10.4f} {horizon_seconds:>12.4f} "
+              f"{block_seconds / horizon_seconds:>8.1f}x {dataframe_seconds / horizon_seconds:>12.1f}x {kept:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark the vectorized coordinate kernels against the row-wise DataFrame.apply
+they replaced.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_kernels
+    python -m benchmarks.bench_kernels --sizes 1000 100000 10000000
+
+DataFrame.apply is only timed up to --max-apply-rows stars; beyond that its time
+is extrapolated linearly (it is a plain Python loop) and marked with a "~".
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from coordinate_kernels import (
+    celestial_to_cartesian,
+    cartesian_to_celestial,
+    planar_projection,
+    normalize_projection,
+)
+
+
+def scalar_celestial_to_cartesian(ra, dec, distance):
+    """The per-row conversion the scripts used with DataFrame.apply."""
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+    x = distance * np.cos(dec_rad) * np.cos(ra_rad)
+    y = distance * np.cos(dec_rad) * np.sin(ra_rad)
+    z = distance * np.sin(dec_rad)
+    return x, y, z
+
+
+def synthetic_stars(n, seed=0):
+    """Uniformly distributed stars with Gaia-like distances."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "ra": rng.uniform(0, 360, n),
+        "dec": np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+        "distance": 1000 / rng.uniform(0.05, 20, n),
+    })
+
+
+def best_of(function, repeat):
+    """Best wall-clock time of `repeat` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_apply(df):
+    return best_of(lambda: df.apply(
+        lambda row: scalar_celestial_to_cartesian(row['ra'], row['dec'], row['distance']),
+        axis=1,
+        result_type='expand'
+    ), repeat=1)
+
+
+def time_kernels(df, repeat):
+    ra, dec, distance = df["ra"].to_numpy(), df["dec"].to_numpy(), df["distance"].to_numpy()
+    xyz = np.empty((3, len(df)))
+    projected = np.empty((2, len(df)))
+    normalized = np.empty((2, len(df)))
+    celestial = np.empty((2, len(df)))
+
+    def pipeline():
+        x, y, z = celestial_to_cartesian(ra, dec, distance, out=xyz)
+        x_projected, y_projected = planar_projection(x, y, z, distance.max(), out=projected)
+        normalize_projection(x_projected, y_projected, out=normalized)
+
+    return {
+        "celestial_to_cartesian": best_of(lambda: celestial_to_cartesian(ra, dec, distance, out=xyz), repeat),
+        "cartesian_to_celestial": best_of(lambda: cartesian_to_celestial(*xyz, out=celestial), repeat),
+        "projection+normalization": best_of(pipeline, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 10_000_000])
+    parser.add_argument("--max-apply-rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'stars':>10} {'apply (s)':>12} {'kernel (s)':>12} {'speedup':>10}   other kernels (s)")
+    for n in args.sizes:
+        df = synthetic_stars(n)
+
+        # Time the row-wise apply on at most max_apply_rows rows
+        apply_rows = min(n, args.max_apply_rows)
+        apply_seconds = time_apply(df.iloc[:apply_rows]) * n / apply_rows
+        apply_label = f"{'~' if apply_rows < n else ''}{apply_seconds:.4f}"
+
+        timings = time_kernels(df, args.repeat)
+        kernel_seconds = timings["celestial_to_cartesian"]
+        others = ", ".join(f"{name} {seconds:.4f}" for name, seconds in timings.items() if name != "celestial_to_cartesian")
+        print(f"{n:>10} {apply_label:>12} {kernel_seconds:>12.4f} {apply_seconds / kernel_seconds:>9.0f}x   {others}")
+
+
+if __name__ == "__main__":
+    main()
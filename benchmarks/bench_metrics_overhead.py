@@ -0,0 +1,94 @@
+"""
+Cost of the /metrics instrumentation of the star API.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_metrics_overhead
+    python -m benchmarks.bench_metrics_overhead --stars 1000000 --limit 5000
+
+First the primitives are timed on their own: a stage lap, a counter increment
+and a scrape. Then star_response_body, the work behind one /star_positions/
+request, is timed with recording on and off (STAR_METRICS=0), once for skies
+computed from a synthetic catalog store and once for cached skies, where the
+instrumentation is the largest share of the work. A request records about ten
+values, so the primitive timings bound the overhead at tens of microseconds; an
+overhead within the run-to-run noise, negative or positive, means it is not
+measurable at the request level.
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from benchmarks.bench_executor_latency import synthetic_catalog
+from benchmarks.bench_kernels import best_of
+from metrics import MetricsRegistry, StageClock
+
+
+def time_primitives(calls):
+    """Return nanoseconds per lap, per counter increment and per scrape of a populated registry."""
+    registry = MetricsRegistry()
+    stages = registry.histogram("stage_seconds", "Stage time.", ["stage"])
+    counter = registry.counter("lookups_total", "Lookups.", ["source"])
+    clock = StageClock(stages)
+    series = counter.labels("cache")
+
+    lap = best_of(lambda: [clock.lap("projection") for _ in range(calls)], repeat=5) / calls
+    inc = best_of(lambda: [series.inc() for _ in range(calls)], repeat=5) / calls
+    for stage in range(20):
+        stages.labels(f"stage{stage}").observe(0.01)
+    scrape = best_of(registry.render, repeat=20)
+    return lap * 1e9, inc * 1e9, scrape * 1e9
+
+
+def time_requests(api, planets, limit, cached):
+    """Best seconds per star_response_body call over `planets`, computing every sky unless `cached`."""
+    def run():
+        if not cached:
+            api.response_cache.clear()
+        for planet_ra, planet_dec in planets:
+            key = api.response_cache.key(planet_ra, planet_dec, limit, api.catalog_version(), None)
+            api.star_response_body(planet_ra, planet_dec, limit, None, key, None)
+
+    run()
+    return best_of(run, repeat=5) / len(planets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--planets", type=int, default=50)
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    lap, inc, scrape = time_primitives(args.calls)
+    print(f"stage lap {lap:.0f} ns, counter increment {inc:.0f} ns, scrape of 20 series {scrape / 1000:.0f} us")
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        synthetic_catalog(catalog_dir, args.stars)
+        os.environ["GAIA_CATALOG_DIR"] = catalog_dir
+        os.environ.pop("STAR_CACHE_DIR", None)
+        os.environ.pop("STAR_ARCHIVE_PATH", None)
+        import gaia_proj_json6_api as api
+
+        api.get_magnitude_index()
+        planets = [((i * 7.3) % 360, (i * 3.1) % 180 - 90) for i in range(args.planets)]
+
+        print(f"{'sky':>10} {'off (ms)':>10} {'on (ms)':>10} {'overhead':>10}")
+        for name, cached in (("computed", False), ("cached", True)):
+            # Alternate the two modes so that drift in machine load hits both alike
+            timings = {False: float("inf"), True: float("inf")}
+            for _ in range(args.rounds):
+                for enabled in (False, True):
+                    api.metrics_registry.enabled = enabled
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        timings[enabled] = min(timings[enabled], time_requests(api, planets, args.limit, cached))
+            overhead = timings[True] / timings[False] - 1
+            print(f"{name:>10} {timings[False] * 1000:>10.3f} {timings[True] * 1000:>10.3f} {overhead:>9.1%}")
+        api.metrics_registry.enabled = True
+
+
+if __name__ == "__main__":
+    main()
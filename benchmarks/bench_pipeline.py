@@ -0,0 +1,296 @@
+"""
+Stage-by-stage benchmark of the projection pipeline on synthetic Gaia-like catalogs.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes 1000 100000 10000000 100000000
+    python -m benchmarks.bench_pipeline --check            # exit 1 on a regression
+    python -m benchmarks.bench_pipeline --update-baseline  # record this machine's timings
+    python -m benchmarks.bench_pipeline --update-golden    # after an intended output change
+
+Catalogs are generated from a seed, without network access, with Gaia-like
+magnitude and parallax distributions (including negative parallaxes, which
+the pipeline drops as the API does). Every stage of recalculate_star_positions
+is timed on its own: conversion, shift, projection, normalization, brightness,
+then the JSON and binary serialization of the response. The whole DataFrame
+pipeline is timed as "dataframe" up to --max-dataframe-rows. For each stage the
+table shows the best of --repeat runs, the throughput and the peak memory the
+stage allocated, traced with tracemalloc in one extra, untimed run.
+
+Catalogs larger than --chunk-rows are generated and processed chunk by chunk,
+and each chunk is then its own sky: the reductions (R, mean modulus,
+brightness range) cost the same as global ones, but the values differ, so
+outputs are only checked below that size. Serialization is timed on at most
+--serialize-rows stars.
+
+Outputs are checked three ways before timing: against a row-by-row reference
+implementation of the original formulas, against the golden output stored in
+benchmarks/golden/, and res.json against the invariants of the pipeline (mean
+modulus 200, brightness between 0 and 1).
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from coordinate_kernels import celestial_to_cartesian, planar_projection, normalize_projection, normalized_brightness
+from star_format import to_json_dict, encode_binary
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PATH = os.path.join(BENCHMARK_DIR, "golden", "pipeline_n1000_seed0.json")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+RES_JSON_PATH = os.path.join(os.path.dirname(BENCHMARK_DIR), "res.json")
+
+STAGES = ["conversion", "shift", "projection", "normalization", "brightness", "json", "binary", "dataframe"]
+
+# Planet the skies are computed for
+PLANET = {"ra": 83.82, "dec": -5.39, "distance": 412.0}
+
+
+def synthetic_chunk(n, seed=0, chunk=0):
+    """
+    Deterministic Gaia-like catalog rows.
+
+    Parameters:
+    - n (int): Number of rows.
+    - seed (int): Catalog seed.
+    - chunk (int): Chunk number; chunks of the same seed are independent streams.
+
+    Returns:
+    - dict: The GAIA_COLUMNS arrays plus distance, for the stars with a positive parallax.
+    """
+    rng = np.random.default_rng([seed, chunk])
+
+    # Star counts grow about 10^(0.3 m) up to the survey limit at G = 21
+    magnitude = np.maximum(21 + np.log10(rng.uniform(0, 1, n)) / 0.3, 3).astype(np.float32)
+
+    # Parallaxes in mas, log-normal around 0.5 mas with Gaussian errors that make some negative
+    parallax = rng.lognormal(np.log(0.5), 1.0, n) + rng.normal(0, 0.3, n)
+    columns = {
+        "source_id": np.sort(rng.integers(1 << 40, 1 << 62, n, dtype=np.int64)),
+        "ra": rng.uniform(0, 360, n),
+        "dec": np.degrees(np.arcsin(rng.uniform(-1, 1, n))),
+        "phot_g_mean_mag": magnitude,
+        "parallax": parallax,
+        "pmra": rng.normal(0, 5, n),
+        "pmdec": rng.normal(0, 5, n),
+    }
+
+    # Keep only visible stars, as query_gaia_stars does, brightest first as the API selects them
+    visible = parallax > 0
+    order = np.argsort(magnitude[visible], kind="stable")
+    columns = {name: values[visible][order] for name, values in columns.items()}
+    columns["distance"] = 1000 / columns["parallax"]
+    return columns
+
+
+def iter_catalog(n, seed, chunk_rows):
+    """Yield the catalog of `n` generated rows in chunks of at most `chunk_rows`."""
+    for chunk, start in enumerate(range(0, n, chunk_rows)):
+        yield synthetic_chunk(min(chunk_rows, n - start), seed, chunk)
+
+
+def pipeline(columns):
+    """Run the vectorized stages on one sky; returns source_id, x_normalized, y_normalized, brightness."""
+    x, y, z = celestial_to_cartesian(columns["ra"], columns["dec"], columns["distance"])
+    x_projected, y_projected = planar_projection(x, y, z, np.nanmax(columns["distance"]))
+    x_normalized, y_normalized, _ = normalize_projection(x_projected, y_projected)
+    brightness = normalized_brightness(columns["phot_g_mean_mag"], columns["phot_g_mean_mag"][0])
+    return columns["source_id"], x_normalized, y_normalized, brightness
+
+
+def reference_pipeline(columns):
+    """The original formulas, one star at a time with the math module."""
+    R = max(columns["distance"])
+    projected = []
+    for ra, dec, distance in zip(columns["ra"].tolist(), columns["dec"].tolist(), columns["distance"].tolist()):
+        ra_rad, dec_rad = math.radians(ra), math.radians(dec)
+        x = distance * math.cos(dec_rad) * math.cos(ra_rad)
+        y = distance * math.cos(dec_rad) * math.sin(ra_rad)
+        z = distance * math.sin(dec_rad)
+        projected.append((x * (R / z), y * (R / z)))
+    normalization_value = sum(math.hypot(x, y) for x, y in projected) / len(projected)
+
+    reference_magnitude = float(columns["phot_g_mean_mag"][0])
+    relative = [10 ** (0.4 * (reference_magnitude - m)) for m in columns["phot_g_mean_mag"].tolist()]
+    low, high = min(relative), max(relative)
+    return np.array([
+        [x / normalization_value * 200, y / normalization_value * 200, (b - low) / (high - low)]
+        for (x, y), b in zip(projected, relative)
+    ])
+
+
+def check_outputs(seed, update_golden):
+    """Check the pipeline against the reference, the golden output and res.json; returns a list of failures."""
+    failures = []
+    columns = synthetic_chunk(1000, seed)
+    source_id, x, y, brightness = pipeline(columns)
+    values = np.column_stack((x, y, brightness))
+
+    # Brightness is computed in float32 like pandas does, hence the looser tolerance on that column
+    reference = reference_pipeline(columns)
+    if not (np.allclose(values[:, :2], reference[:, :2], rtol=1e-9, atol=1e-9)
+            and np.allclose(values[:, 2], reference[:, 2], rtol=1e-5, atol=1e-6)):
+        failures.append("pipeline differs from the row-by-row reference")
+
+    if update_golden or not os.path.exists(GOLDEN_PATH):
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+        with open(GOLDEN_PATH, "w") as f:
+            json.dump({"seed": seed, "source_id": source_id.tolist(), "values": values.tolist()}, f)
+        print(f"Wrote golden output {os.path.relpath(GOLDEN_PATH)}")
+    else:
+        with open(GOLDEN_PATH) as f:
+            golden = json.load(f)
+        if golden["seed"] != seed:
+            print(f"Golden output is for seed {golden['seed']}, skipping it")
+        elif golden["source_id"] != source_id.tolist() or not np.allclose(values, golden["values"], rtol=1e-12, atol=1e-12):
+            failures.append(f"pipeline differs from {os.path.relpath(GOLDEN_PATH)}")
+
+    # res.json was recorded from the real Gaia slice, only the invariants can be checked
+    if os.path.exists(RES_JSON_PATH):
+        with open(RES_JSON_PATH) as f:
+            recorded = np.array(json.load(f), dtype=np.float64)
+        if not (np.isclose(np.nanmean(np.hypot(recorded[:, 0], recorded[:, 1])), 200)
+                and np.nanmin(recorded[:, 2]) == 0 and np.nanmax(recorded[:, 2]) == 1):
+            failures.append("res.json does not have mean modulus 200 and brightness in [0, 1]")
+    return failures
+
+
+def run_stages(columns, serialize_rows, dataframe, timings, peaks):
+    """Time every stage on one sky, adding seconds to `timings` and keeping the largest peak in `peaks`."""
+    def stage(name, function):
+        # Tracing slows down Python allocations, so a traced run only records memory
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = function()
+            peaks[name] = max(peaks.get(name, 0), tracemalloc.get_traced_memory()[1] - before)
+            return result
+        start = time.perf_counter()
+        result = function()
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        return result
+
+    x, y, z = stage("conversion", lambda: celestial_to_cartesian(columns["ra"], columns["dec"], columns["distance"]))
+    exo_x, exo_y, exo_z = celestial_to_cartesian(PLANET["ra"], PLANET["dec"], PLANET["distance"])
+    stage("shift", lambda: (x - exo_x, y - exo_y, z - exo_z))
+    x_projected, y_projected = stage(
+        "projection", lambda: planar_projection(x, y, z, np.nanmax(columns["distance"]))
+    )
+    x_normalized, y_normalized, _ = stage("normalization", lambda: normalize_projection(x_projected, y_projected))
+    brightness = stage("brightness", lambda: normalized_brightness(
+        columns["phot_g_mean_mag"], columns["phot_g_mean_mag"][0]
+    ))
+
+    head = slice(0, serialize_rows)
+    sky = (columns["source_id"][head], x_normalized[head], y_normalized[head], brightness[head])
+    stage("json", lambda: json.dumps(to_json_dict(*sky), separators=(",", ":")).encode())
+    stage("binary", lambda: encode_binary(*sky))
+
+    if dataframe:
+        import pandas as pd
+        from gaia_proj_json6_api import recalculate_star_positions
+
+        df = pd.DataFrame(columns).rename(columns={"source_id": "SOURCE_ID"})
+        with contextlib.redirect_stdout(io.StringIO()):
+            stage("dataframe", lambda: recalculate_star_positions(PLANET["ra"], PLANET["dec"], df, PLANET["distance"]))
+
+
+def benchmark(n, seed, chunk_rows, serialize_rows, max_dataframe_rows, repeat):
+    """
+    Time the stages on a catalog of `n` generated rows.
+
+    Returns:
+    - dict: Stage -> best seconds.
+    - dict: Stage -> peak bytes.
+    - int: Number of visible stars processed.
+    """
+    best, peaks, stars = {}, {}, 0
+    chunked = n > chunk_rows
+
+    # Timed runs, then one traced run for the peak memory of every stage
+    runs = [False] * (1 if chunked else repeat) + [True]
+    for traced in runs:
+        timings, serialize_left, stars = {}, serialize_rows, 0
+        if traced:
+            tracemalloc.start()
+        for columns in iter_catalog(n, seed, chunk_rows):
+            stars += len(columns["ra"])
+            run_stages(columns, max(serialize_left, 0), n <= max_dataframe_rows, timings, peaks)
+            serialize_left -= len(columns["ra"])
+        if traced:
+            tracemalloc.stop()
+        for name, seconds in timings.items():
+            best[name] = min(best.get(name, math.inf), seconds)
+    return best, peaks, stars
+
+
+def compare_to_baseline(results, baseline, tolerance, min_seconds):
+    """List the stages slower than the baseline by more than `tolerance` (and `min_seconds`)."""
+    regressions = []
+    for size, stages in results.items():
+        for name, seconds in stages.items():
+            reference = baseline.get("seconds", {}).get(size, {}).get(name)
+            if reference is not None and seconds > reference * (1 + tolerance) and seconds - reference > min_seconds:
+                regressions.append(f"{name} at {size} rows: {seconds:.4f} s, baseline {reference:.4f} s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-rows", type=int, default=4_000_000)
+    parser.add_argument("--serialize-rows", type=int, default=100_000)
+    parser.add_argument("--max-dataframe-rows", type=int, default=1_000_000)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a stage regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown over the baseline (0.5 = 50%%).")
+    parser.add_argument("--min-seconds", type=float, default=0.002, help="Ignore slowdowns smaller than this.")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--update-golden", action="store_true")
+    args = parser.parse_args()
+
+    failures = check_outputs(args.seed, args.update_golden)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    results = {}
+    print(f"{'rows':>11} {'stars':>11} {'stage':>14} {'seconds':>10} {'Mstars/s':>10} {'peak MB':>9}")
+    for n in args.sizes:
+        seconds, peaks, stars = benchmark(n, args.seed, args.chunk_rows, args.serialize_rows,
+                                          args.max_dataframe_rows, args.repeat)
+        results[str(n)] = seconds
+        for name in STAGES:
+            if name not in seconds:
+                continue
+            processed = min(stars, args.serialize_rows) if name in ("json", "binary") else stars
+            rate = processed / seconds[name] / 1e6 if seconds[name] else math.inf
+            print(f"{n:>11} {processed:>11} {name:>14} {seconds[name]:>10.4f} {rate:>10.2f} {peaks[name] / 2**20:>9.1f}")
+
+    if args.update_baseline:
+        baseline = {"seconds": results, "seed": args.seed, "python": sys.version.split()[0], "numpy": np.__version__}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Wrote baseline {os.path.relpath(args.baseline)}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        failures += regressions
+
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Per-frame cost of a fly-through with /star_sessions/ deltas against full /star_positions/ recomputes.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_sessions
+    python -m benchmarks.bench_sessions --limit 5000 --frames 500 --step 0.01
+
+The observer moves by --step degrees in RA and half of that in Dec per frame.
+Each frame is computed and serialized the way the two endpoints do it, without
+the HTTP layer: a full recompute of the sky (cache cleared) against a session
+frame. The session's state is applied like a client would and checked against
+the full recompute at the last frame.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_executor_latency import synthetic_catalog
+
+
+def apply_frame(state, frame):
+    """Apply a decoded session frame to a client's {source_id: [x, y, brightness]} state."""
+    if frame["full"]:
+        state.clear()
+    for source_id in frame["removed"]:
+        del state[str(source_id)]
+    state.update(frame["added"])
+    for source_id, brightness in frame["brightness"].items():
+        state[source_id][2] = brightness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--step", type=float, default=0.02)
+    parser.add_argument("--planet-distance", type=float, default=80.0)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        synthetic_catalog(catalog_dir, args.stars)
+        os.environ["GAIA_CATALOG_DIR"] = catalog_dir
+        os.environ.pop("STAR_CACHE_DIR", None)
+        os.environ.pop("STAR_ARCHIVE_PATH", None)
+        import gaia_proj_json6_api as api
+        from sky_session import SkySession
+
+        api.get_magnitude_index()
+        path = [(33.0 + i * args.step, -20.0 + i * args.step / 2) for i in range(args.frames)]
+
+        # Full recompute of every frame, as /star_positions/ does on a cache miss
+        full_seconds, full_bytes = 0.0, 0
+        for planet_ra, planet_dec in path:
+            api.response_cache.clear()
+            start = time.perf_counter()
+            body = api.JSONResponse(api.to_json_dict(
+                *api.compute_star_arrays(planet_ra, planet_dec, args.limit, args.planet_distance)
+            )).body
+            full_seconds += time.perf_counter() - start
+            full_bytes += len(body)
+
+        # Session frames, serialized like /star_sessions/{id}/frame
+        session = SkySession(api.session_pool_builder(), limit=args.limit, tolerance=args.tolerance,
+                             planet_distance=args.planet_distance)
+        session_seconds, session_bytes, first_frame_seconds, state = 0.0, 0, 0.0, {}
+        for planet_ra, planet_dec in path:
+            start = time.perf_counter()
+            body = api.session_frame_response(session, planet_ra, planet_dec, False).body
+            elapsed = time.perf_counter() - start
+            if session.frames == 1:
+                first_frame_seconds = elapsed
+            session_seconds += elapsed
+            session_bytes += len(body)
+            frame = json.loads(body)
+            apply_frame(state, frame)
+
+        # The client's state must match a full recompute at the last position, within the tolerance
+        source_id, x, y, brightness = api.compute_star_arrays(*path[-1], args.limit, args.planet_distance)
+        expected = dict(zip(map(str, source_id.tolist()), np.column_stack((x, y, brightness))))
+        missing = set(expected) ^ set(state)
+        scaling = np.array([frame["scale"], frame["scale"], 1.0])
+        error = max((np.abs(np.array(state[key]) * scaling - value).max()
+                     for key, value in expected.items() if key in state), default=0.0)
+        print(f"last frame: {len(state)} stars, {len(missing)} differ from a full recompute, "
+              f"largest difference {error:.2g}")
+
+        frames = len(path)
+        print(f"{'mode':>10} {'ms/frame':>10} {'KB/frame':>10}")
+        print(f"{'full':>10} {full_seconds / frames * 1000:>10.2f} {full_bytes / frames / 1024:>10.1f}")
+        print(f"{'session':>10} {session_seconds / frames * 1000:>10.2f} {session_bytes / frames / 1024:>10.1f}")
+        print(f"first session frame {first_frame_seconds * 1000:.1f} ms, {session.rebuilds} pool builds "
+              f"over {session.frames} frames")
+
+
+if __name__ == "__main__":
+    main()
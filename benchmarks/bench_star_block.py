@@ -0,0 +1,124 @@
+"""
+Peak memory of one sky computed with the DataFrame pipeline against the StarBlock pipeline.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_star_block
+    python -m benchmarks.bench_star_block --stars 1000000 --limit 1000000 --requests 5
+
+A synthetic catalog store of --stars stars is written to a temporary
+directory and the --limit brightest stars seen from a planet are selected once.
+Each pipeline then runs in a fresh interpreter, so that its peak resident set
+size (ru_maxrss, Linux) is its own: the process imports the API, opens the
+catalog and loads the selection, and the peak is reported above the resident
+size at that point, in total and per star. The first request of the StarBlock
+pipeline allocates its scratch buffers; the following --requests - 1 reuse
+them, which the tracemalloc peak of the last request shows.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_executor_latency import synthetic_catalog
+
+PLANET = (33.0, -20.0, 80.0)
+
+
+def resident_bytes():
+    """Current resident set size of the process in bytes (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def select(catalog_dir, limit):
+    """Save the rows and apparent magnitudes of the `limit` brightest stars seen from PLANET."""
+    from catalog_store import load_catalog
+    from coordinate_kernels import celestial_to_cartesian
+    from magnitude_selection import absolute_magnitude, apparent_magnitude, brightest
+
+    catalog = load_catalog(catalog_dir)
+    distance = np.asarray(catalog["distance"])
+    points = np.column_stack((catalog["x"], catalog["y"], catalog["z"]))
+    magnitudes = apparent_magnitude(absolute_magnitude(np.asarray(catalog["phot_g_mean_mag"]), distance), points,
+                                    celestial_to_cartesian(*PLANET))
+    rows = brightest(magnitudes, limit)
+    np.save(os.path.join(catalog_dir, "rows.npy"), rows)
+    np.save(os.path.join(catalog_dir, "magnitudes.npy"), magnitudes[rows].astype(np.float64))
+
+
+def run(mode, catalog_dir, requests):
+    """Compute the sky `requests` times with one pipeline and print its measurements."""
+    import gaia_proj_json6_api as api
+    from catalog_store import load_catalog
+    from star_block import StarBlock, project_block
+
+    catalog = load_catalog(catalog_dir)
+    rows = np.load(os.path.join(catalog_dir, "rows.npy"))
+    magnitudes = np.load(os.path.join(catalog_dir, "magnitudes.npy"))
+
+    def dataframe():
+        df = catalog.to_pandas(rows)
+        df['apparent_mag'] = magnitudes
+        star_data = api.recalculate_star_positions(PLANET[0], PLANET[1], df, PLANET[2],
+                                                   magnitude_column='apparent_mag')
+        return [star_data[name].to_numpy() for name in
+                ('source_id', 'x_normalized', 'y_normalized', 'relative_brightness')]
+
+    def block():
+        return project_block(StarBlock.from_catalog(catalog, rows, magnitudes))
+
+    compute = dataframe if mode == "dataframe" else block
+    baseline = resident_bytes()
+    seconds = []
+    for request in range(requests):
+        if request == requests - 1:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = compute()
+        seconds.append(time.perf_counter() - start)
+        del result
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(max(peak - baseline, 0), traced_peak, min(seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--run", choices=["dataframe", "block"], help=argparse.SUPPRESS)
+    parser.add_argument("--catalog", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.catalog, args.requests)
+        return
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        synthetic_catalog(catalog_dir, args.stars)
+        select(catalog_dir, args.limit)
+        stars = len(np.load(os.path.join(catalog_dir, "rows.npy")))
+        print(f"{stars} stars selected out of {args.stars}")
+
+        print(f"{'pipeline':>10} {'peak RSS (MB)':>14} {'B/star':>8} {'traced (MB)':>12} {'ms':>8}")
+        for mode in ("dataframe", "block"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_star_block", "--run", mode, "--catalog", catalog_dir,
+                 "--requests", str(args.requests)],
+                check=True, capture_output=True, text=True,
+            ).stdout.split()
+            peak, traced, seconds = int(output[-3]), int(output[-2]), float(output[-1])
+            print(f"{mode:>10} {peak / 2 ** 20:>14.1f} {peak / max(stars, 1):>8.0f} {traced / 2 ** 20:>12.1f} "
+                  f"{seconds * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
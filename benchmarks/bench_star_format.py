@@ -0,0 +1,53 @@
+"""
+Compare the size and serialization time of the JSON and binary star position formats.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_star_format
+    python -m benchmarks.bench_star_format --sizes 1000 10000 100000
+
+JSON is timed as the API produces it: building the {source_id: [x, y, brightness]}
+dictionary and encoding it with json.dumps.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from star_format import to_json_dict, encode_binary, decode_binary
+from benchmarks.bench_kernels import best_of
+
+
+def synthetic_sky(n, seed=0):
+    """Gaia-like source IDs with normalized positions (mean modulus 200) and brightness."""
+    rng = np.random.default_rng(seed)
+    source_id = rng.integers(1 << 40, 1 << 62, n, dtype=np.int64)
+    angle = rng.uniform(0, 2 * np.pi, n)
+    modulus = rng.exponential(200, n)
+    brightness = rng.power(0.1, n)
+    return source_id, modulus * np.cos(angle), modulus * np.sin(angle), brightness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'stars':>8} {'format':>8} {'bytes':>10} {'ratio':>7} {'encode (ms)':>12} {'max error':>12}")
+    for n in args.sizes:
+        sky = synthetic_sky(n)
+        json_bytes = len(json.dumps(to_json_dict(*sky)).encode())
+        json_seconds = best_of(lambda: json.dumps(to_json_dict(*sky)).encode(), args.repeat)
+        print(f"{n:>8} {'json':>8} {json_bytes:>10} {1:>6.1f}x {json_seconds * 1000:>12.2f} {'':>12}")
+
+        for encoding in ("float32", "int16"):
+            payload = encode_binary(*sky, encoding=encoding)
+            seconds = best_of(lambda: encode_binary(*sky, encoding=encoding), args.repeat)
+            decoded = decode_binary(payload)
+            error = max(np.abs(decoded[name] - values).max() for name, values in zip(("x", "y", "brightness"), sky[1:]))
+            print(f"{n:>8} {encoding:>8} {len(payload):>10} {json_bytes / len(payload):>6.1f}x "
+                  f"{seconds * 1000:>12.2f} {error:>12.3g}")
+
+
+if __name__ == "__main__":
+    main()
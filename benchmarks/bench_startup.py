@@ -0,0 +1,107 @@
+"""
+Cold start of the star API: import time, time to /ready and time to the first response.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --stars 1000000 --runs 5
+
+A synthetic catalog store, with its magnitude index saved, is written to a
+temporary directory. The app is imported in fresh interpreters to time the
+import and to list the heavy optional modules it loaded (none of pandas,
+astropy, astroquery or matplotlib should be). Then serve.py is started --runs
+times, and the time from spawning the process until /ready answers 200 and
+until a first /star_positions/ response arrives is measured by polling every
+5 ms. Times are the best of the runs.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_executor_latency import synthetic_catalog
+
+HEAVY_MODULES = ("pandas", "astropy", "astroquery", "matplotlib")
+
+IMPORT_SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import gaia_proj_json6_api
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+
+def free_port():
+    """Return a TCP port nothing listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    """Poll `url` until it answers 200; return the body."""
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return response.read()
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    raise TimeoutError(url)
+
+
+def time_server(catalog_dir, timeout):
+    """Start serve.py and return the seconds until /ready is 200 and until the first sky is served."""
+    port = free_port()
+    start = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--catalog", catalog_dir, "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        wait_for(f"{base}/ready", start + timeout)
+        ready = time.monotonic() - start
+        wait_for(f"{base}/star_positions/?planet_ra=33&planet_dec=-20&limit=1000", start + timeout)
+        first_response = time.monotonic() - start
+    finally:
+        server.terminate()
+        server.wait()
+    return ready, first_response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as catalog_dir:
+        from catalog_store import load_catalog
+        from magnitude_selection import INDEX_DIR_NAME, MagnitudeBoundIndex
+
+        synthetic_catalog(catalog_dir, args.stars)
+        MagnitudeBoundIndex.build(load_catalog(catalog_dir)).save(os.path.join(catalog_dir, INDEX_DIR_NAME))
+        env = dict(os.environ, GAIA_CATALOG_DIR=catalog_dir)
+        env.pop("STAR_CACHE_DIR", None)
+        env.pop("STAR_ARCHIVE_PATH", None)
+
+        imports = [json.loads(subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], env=env, check=True,
+                                             capture_output=True, text=True).stdout)
+                   for _ in range(args.runs)]
+        print(f"import: {min(run['seconds'] for run in imports) * 1000:.0f} ms, "
+              f"heavy modules loaded: {imports[0]['loaded'] or 'none'}")
+
+        timings = [time_server(catalog_dir, args.timeout) for _ in range(args.runs)]
+        print(f"serve.py with {args.stars} stars: /ready after {min(t[0] for t in timings) * 1000:.0f} ms, "
+              f"first sky after {min(t[1] for t in timings) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Memory of the star API per uvicorn worker, serving a published catalog version.
+
+Usage (from the repository root; Linux only, reads /proc):
+    python -m benchmarks.bench_worker_memory
+    python -m benchmarks.bench_worker_memory --stars 2000000 --workers 1 2 4
+
+A synthetic catalog store is published into a catalog root (which builds and
+saves its indexes) and serve.py is started with each worker count. After
+/ready and a few requests per worker, the private and proportional (Pss)
+memory of every worker process is read from /proc/<pid>/smaps_rollup. The
+catalog pages are mapped read-only from the same files by every worker, so
+they are counted as shared: private memory per worker should stay far below
+the size of the store, and total Pss should grow by much less than one store
+per added worker.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.bench_executor_latency import synthetic_catalog
+from benchmarks.bench_startup import free_port, wait_for
+
+
+def children(pid):
+    """Return the pids of the child processes of `pid`."""
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    return pids
+
+
+def memory(pid):
+    """Return the private and proportional resident memory of a process in bytes."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return fields["Private_Clean"] + fields["Private_Dirty"], fields["Pss"]
+
+
+def measure(root, workers, requests, timeout):
+    """Serve `root` with `workers` processes and return (private, pss) of every worker."""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--catalog", root, "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + timeout
+        wait_for(f"{base}/ready", deadline)
+        # Distinct planets, so that every worker selects and projects stars from the catalog
+        for i in range(requests * workers):
+            with urllib.request.urlopen(f"{base}/star_positions/?planet_ra={i * 7.3 % 360}&planet_dec="
+                                        f"{i * 3.1 % 180 - 90}&limit=5000", timeout=timeout) as response:
+                response.read()
+        # uvicorn's supervisor process is the parent of the workers; a single worker runs in the server itself
+        pids = children(server.pid) if workers > 1 else [server.pid]
+        return [memory(pid) for pid in pids]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=8, help="Requests sent per worker before measuring.")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from catalog_versions import publish, resolve_store
+
+        store, root = os.path.join(tmp, "store"), os.path.join(tmp, "root")
+        synthetic_catalog(store, args.stars)
+        publish(root, store, move=True)
+        live = resolve_store(root)
+        store_bytes = sum(os.path.getsize(os.path.join(directory, name))
+                          for directory, _, names in os.walk(live) for name in names)
+        os.environ.pop("STAR_CACHE_DIR", None)
+        os.environ.pop("STAR_ARCHIVE_PATH", None)
+        print(f"catalog version with indexes: {store_bytes / 2**20:.0f} MiB on disk")
+
+        for workers in args.workers:
+            usage = measure(root, workers, args.requests, args.timeout)
+            private = sum(u[0] for u in usage)
+            pss = sum(u[1] for u in usage)
+            print(f"{workers} worker(s): private {private / workers / 2**20:.0f} MiB per worker, "
+                  f"total Pss {pss / 2**20:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import astropy.units as u
 from astropy.coordinates.sky_coordinate import SkyCoord
 from astropy.units import Quantity
-from astroquery.gaia import Gaia
+from gaia_cache import Gaia
 
 import pandas as pd
 
+from adql import gaia_query, log_transfer
+
 #matplotlib inline
 import matplotlib.pyplot as plt
 import numpy as np
@@ -63,15 +65,16 @@ pd.set_option('display.max_columns', None)  # Display all columns
 # Define additional columns you want to select
 columns_to_select = ["ra", "dec", "phot_g_mean_mag", "parallax", "pmra", "pmdec"]  # Add any other columns you want
 
-# Create a string for the column names to use in the SQL query
-columns_string = ", ".join(columns_to_select)
+##### filtering by brightness
+# Define the brightness lower and upper bounds
+lower_bound = 10.0  # Example: stars brighter than magnitude 10
+upper_bound = 15.0  # Example: stars fainter than magnitude 15
 
-# Your updated SQL query using the specified columns
-query = f"""
-SELECT TOP 100 {columns_string} FROM gaiadr3.gaia_source  
-WHERE has_xp_sampled = 'True'
-"""  
-# SELECT TOP {} - here you can choose the number of rows shown
+# The archive applies the brightness bounds, so only the rows we keep are downloaded. Unsorted, as before:
+# this returns up to 100 arbitrary stars between the bounds, where filtering 100 arbitrary rows afterwards
+# kept only those of them that happened to be between the bounds
+# top - here you can choose the number of rows shown
+query = gaia_query(columns=columns_to_select, magnitude=(lower_bound, upper_bound), top=100, order_by=None)
 
 # Launch the asynchronous job
 job = Gaia.launch_job_async(query)
@@ -90,13 +93,9 @@ df["distance"] = 1000 / df["parallax"]
 # Display the DataFrame
 print(df)
 
-##### filtering by brightness
-# Define the brightness lower and upper bounds
-lower_bound = 10.0  # Example: stars brighter than magnitude 10
-upper_bound = 15.0  # Example: stars fainter than magnitude 15
-
-# Filter the DataFrame for rows where 'phot_g_mean_mag' is between the bounds
-filtered_stars_df = df[(df["phot_g_mean_mag"] > lower_bound) & (df["phot_g_mean_mag"] < upper_bound)]
+# Every row is already between the bounds
+filtered_stars_df = df
+log_transfer(query, len(results), len(filtered_stars_df))
 
 # Display the filtered DataFrame
 print(filtered_stars_df)
@@ -0,0 +1,254 @@
+"""
+Parallel, resumable ingestion of a Gaia range into a local catalog store.
+
+catalog_store.py ingest pulls its slice with a single launch_job_async call,
+so one failure loses the whole download. Here the target random_index (or
+source_id) range is split into shards of consecutive key values, and up to
+--parallel shards are queried at a time, each retried with exponential
+backoff. Every completed shard is saved next to the store and recorded in a
+checkpoint, so an interrupted or partly failed run is resumed by running the
+same command again: only the missing shards are queried. When every shard is
+present they are assembled into the store, one column at a time, so the store
+can be larger than memory.
+
+Queries go through TapPlus to the TAP service at --tap-url, the Gaia archive by
+default; pointing it at a local TAP stand-in server exercises the whole tool
+without the archive. Code can instead pass any query(adql) callable returning
+a dict of columns or a DataFrame to ingest().
+
+Usage:
+    python bulk_ingest.py catalog/ --start 0 --stop 1000000 --shard-size 50000 --parallel 4
+    python bulk_ingest.py catalog/ --key source_id --start 0 --stop 100000000000 --shard-size 1000000000
+    python bulk_ingest.py catalog/ --start 0 --stop 20000 --tap-url http://localhost:8080/tap
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from adql import GAIA_COLUMNS, gaia_query
+from catalog_store import derive_columns, write_catalog_parts
+
+GAIA_TAP_URL = "https://gea.esac.esa.int/tap-server/tap"
+
+# Columns a shard can be cut on; both are indexed in gaiadr3.gaia_source
+SHARD_KEYS = ("random_index", "source_id")
+
+INGEST_DIR_NAME = "ingest"
+CHECKPOINT_NAME = "checkpoint.json"
+
+logger = logging.getLogger(__name__)
+
+
+def plan_shards(start, stop, shard_size):
+    """
+    Split the key range start..stop (inclusive) into shards.
+
+    Parameters:
+    - start (int): First key value.
+    - stop (int): Last key value.
+    - shard_size (int): Key values per shard.
+
+    Returns:
+    - list: (low, high) inclusive bounds of every shard, increasing.
+    """
+    return [(low, min(low + shard_size - 1, stop)) for low in range(start, stop + 1, shard_size)]
+
+
+def shard_query(key, low, high):
+    """Return the ADQL of one shard, with the filter of catalog_store.fetch_gaia_slice."""
+    return gaia_query(**{key: (low, high)})
+
+
+def tap_query(url=GAIA_TAP_URL):
+    """
+    Build a query function running ADQL as asynchronous jobs of a TAP service.
+
+    Parameters:
+    - url (str): Base URL of the TAP service.
+
+    Returns:
+    - callable: query(adql) returning the result as a DataFrame.
+    """
+    # Imported here so that ingesting with an injected query function never loads astroquery
+    from astroquery.utils.tap.core import TapPlus
+
+    tap = TapPlus(url=url, verbose=False)
+
+    def query(adql):
+        return tap.launch_job_async(adql, verbose=False).get_results().to_pandas()
+    return query
+
+
+def shard_columns(result):
+    """Turn a query result into sorted store columns, with the derived columns added."""
+    if hasattr(result, "to_numpy"):
+        # Gaia returns SOURCE_ID in upper case, the store uses lower case names
+        result = {column.lower(): result[column].to_numpy() for column in result.columns}
+    else:
+        result = {column.lower(): np.asarray(values) for column, values in result.items()}
+
+    # Rows come back in no particular order; sorting them keeps the store version reproducible
+    order = np.argsort(result["source_id"], kind="stable")
+    return derive_columns({name: result[name][order] for name in GAIA_COLUMNS})
+
+
+class Checkpoint:
+    """
+    Completed shards of an ingestion, saved after every shard.
+
+    Parameters:
+    - path (str): Directory of the shards and of the checkpoint file.
+    - plan (dict): Key, range and shard size; a checkpoint of another plan is not resumed.
+    """
+
+    def __init__(self, path, plan):
+        self.path = path
+        self.plan = plan
+        self.done = {}
+        self._lock = threading.Lock()
+
+        checkpoint_path = os.path.join(path, CHECKPOINT_NAME)
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                saved = json.load(f)
+            if saved["plan"] != plan:
+                raise ValueError(f"{checkpoint_path} belongs to another ingestion ({saved['plan']}); "
+                                 f"remove {path} or rerun with the same range and shard size")
+            # A shard counts as done only if its file is still there
+            self.done = {name: rows for name, rows in saved["done"].items()
+                         if os.path.exists(os.path.join(path, name))}
+
+    @staticmethod
+    def shard_name(low, high):
+        return f"shard-{low}-{high}.npz"
+
+    def save_shard(self, low, high, columns):
+        """Write a shard atomically and record it as done."""
+        name = self.shard_name(low, high)
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        with self._lock:
+            self.done[name] = int(len(columns["source_id"]))
+            self._write()
+
+    def _write(self):
+        checkpoint_path = os.path.join(self.path, CHECKPOINT_NAME)
+        with open(checkpoint_path + ".tmp", "w") as f:
+            json.dump({"plan": self.plan, "done": self.done}, f, indent=2)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def fetch_shard(query, key, low, high, retries=3, retry_delay=5.0):
+    """
+    Run the query of one shard, retrying failures with exponential backoff.
+
+    Parameters:
+    - query (callable): query(adql) returning a dict of columns or a DataFrame.
+    - key (str): Shard column.
+    - low, high (int): Inclusive key bounds.
+    - retries (int): Attempts after the first one.
+    - retry_delay (float): Seconds before the first retry, doubled after every failure.
+
+    Returns:
+    - dict: The shard's store columns.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return shard_columns(query(shard_query(key, low, high)))
+        except Exception as error:
+            if attempt == retries:
+                raise
+            delay = retry_delay * 2 ** attempt
+            logger.warning("Shard %s %d-%d failed (%s), retrying in %.0f s", key, low, high, error, delay)
+            time.sleep(delay)
+
+
+def ingest(path, start, stop, shard_size, key="random_index", query=None, parallel=4, retries=3, retry_delay=5.0):
+    """
+    Download a key range shard by shard and write it into a catalog store.
+
+    Parameters:
+    - path (str): Directory of the catalog store; shards and the checkpoint go into its ingest/ subdirectory.
+    - start, stop (int): Inclusive key range.
+    - shard_size (int): Key values per shard.
+    - key (str): "random_index" or "source_id".
+    - query (callable): query(adql) returning a dict of columns or a DataFrame; TapPlus on the Gaia archive
+      by default.
+    - parallel (int): Shards queried at a time.
+    - retries (int): Attempts after the first one for every shard.
+    - retry_delay (float): Seconds before the first retry of a shard, doubled after every failure.
+
+    Returns:
+    - dict: The manifest of the store, or None if some shards failed; rerunning resumes them.
+    """
+    if key not in SHARD_KEYS:
+        raise ValueError(f"Unknown shard key {key!r}, expected one of {SHARD_KEYS}")
+    query = query if query is not None else tap_query()
+
+    ingest_dir = os.path.join(path, INGEST_DIR_NAME)
+    os.makedirs(ingest_dir, exist_ok=True)
+    checkpoint = Checkpoint(ingest_dir, {"key": key, "start": start, "stop": stop, "shard_size": shard_size})
+    shards = plan_shards(start, stop, shard_size)
+    missing = [(low, high) for low, high in shards if Checkpoint.shard_name(low, high) not in checkpoint.done]
+    logger.info("%d of %d shards to download", len(missing), len(shards))
+
+    def run(shard):
+        low, high = shard
+        checkpoint.save_shard(low, high, fetch_shard(query, key, low, high, retries, retry_delay))
+        logger.info("Shard %s %d-%d done (%d/%d)", key, low, high, len(checkpoint.done), len(shards))
+
+    # Every shard runs to the end even if another one failed, so a rerun has less left to do
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(parallel, 1), thread_name_prefix="ingest") as executor:
+        for shard, future in [(shard, executor.submit(run, shard)) for shard in missing]:
+            try:
+                future.result()
+            except Exception as error:
+                logger.error("Shard %s %d-%d failed after %d retries: %s", key, *shard, retries, error)
+                failed.append(shard)
+    if failed:
+        logger.error("%d shards failed; run the same command again to resume", len(failed))
+        return None
+
+    # Assemble in key order; the shards stay in place until the store is written
+    parts = [np.load(os.path.join(ingest_dir, Checkpoint.shard_name(low, high))) for low, high in shards]
+    try:
+        manifest = write_catalog_parts(path, parts, query=shard_query(key, start, stop))
+    finally:
+        for part in parts:
+            part.close()
+    logger.info("Wrote %d stars to %s (version %s)", manifest["rows"], path, manifest["version"])
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download a Gaia range into a local catalog store, in parallel "
+                                                 "shards that can be resumed.")
+    parser.add_argument("path", help="Directory of the catalog store.")
+    parser.add_argument("--key", choices=SHARD_KEYS, default="random_index", help="Column the range is on.")
+    parser.add_argument("--start", type=int, required=True, help="First key value.")
+    parser.add_argument("--stop", type=int, required=True, help="Last key value (inclusive).")
+    parser.add_argument("--shard-size", type=int, default=50000, help="Key values per shard.")
+    parser.add_argument("--parallel", type=int, default=4, help="Shards queried at a time.")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a failed shard.")
+    parser.add_argument("--retry-delay", type=float, default=5.0, help="Seconds before the first retry.")
+    parser.add_argument("--tap-url", default=GAIA_TAP_URL, help="TAP service, e.g. a local stand-in server.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    manifest = ingest(args.path, args.start, args.stop, args.shard_size, key=args.key,
+                      query=tap_query(args.tap_url), parallel=args.parallel, retries=args.retries,
+                      retry_delay=args.retry_delay)
+    raise SystemExit(0 if manifest is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
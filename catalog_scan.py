@@ -0,0 +1,214 @@
+"""
+Select the N brightest stars seen from a planet by streaming a catalog store chunk by chunk.
+
+The magnitude index answers a selection by opening a few blocks, but it is
+built with every star in memory, and the full gaiadr3.gaia_source holds about
+1.8 billion rows. A scan needs no index: the columns of the store are
+memory-mapped and read in chunks of consecutive rows, and every chunk goes
+through a generator pipeline
+
+    read -> convert -> shift -> cull -> magnitude -> chunk top-N
+
+whose output, at most N stars per chunk, is merged into the N brightest seen
+so far. Peak memory is therefore set by the chunk size (about 90 bytes per
+row, per worker) plus the 2 N stars of the merge, not by the catalog size.
+
+Convert uses the Cartesian columns stored at ingest and falls back to ra, dec
+and parallax for stores without them. Shift moves the stars into the planet
+frame, where the distance modulus is computed. Cull optionally drops the stars
+behind the observer, i.e. outside the hemisphere centred on a viewing
+direction; /star_positions/ projects the whole sky, so the API scans without
+it.
+
+With several workers, chunks are processed on a thread pool: the NumPy stages
+release the GIL, and the threads share the memory-mapped columns, so no data
+is copied between processes. At most two chunks per worker are in flight.
+
+Usage:
+    python catalog_scan.py catalog/ --ra 33 --dec -20 --distance 80 --limit 1000 --workers 4
+    python catalog_scan.py catalog/ --ra 33 --dec -20 --distance 80 --facing 120 10
+"""
+import argparse
+import json
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from coordinate_kernels import celestial_to_cartesian
+from magnitude_selection import absolute_magnitude, brightest
+
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+
+def read_chunks(catalog, chunk_rows=DEFAULT_CHUNK_ROWS, start=0, stop=None):
+    """
+    Read a catalog store in chunks of consecutive rows.
+
+    Parameters:
+    - catalog (Catalog): The catalog store.
+    - chunk_rows (int): Rows per chunk.
+    - start, stop (int): Range of rows to read, the whole store by default.
+
+    Yields:
+    - dict: "rows" (catalog row numbers) and the views of the columns the pipeline reads.
+    """
+    stop = len(catalog) if stop is None else stop
+    names = ["phot_g_mean_mag"] + (["x", "y", "z", "distance"] if "x" in catalog else ["ra", "dec", "parallax"])
+    for chunk_start in range(start, stop, chunk_rows):
+        chunk_stop = min(chunk_start + chunk_rows, stop)
+        chunk = {name: np.asarray(catalog[name][chunk_start:chunk_stop]) for name in names}
+        chunk["rows"] = np.arange(chunk_start, chunk_stop)
+        yield chunk
+
+
+def convert(chunks):
+    """Add the Cartesian positions (n, 3) and the distances from the Sun of every star."""
+    for chunk in chunks:
+        if "x" not in chunk:
+            # Calculate distance from parallax (in parsecs), as at ingest
+            with np.errstate(divide='ignore', invalid='ignore'):
+                chunk["distance"] = 1000 / chunk["parallax"].astype(np.float64)
+            chunk["x"], chunk["y"], chunk["z"] = celestial_to_cartesian(chunk["ra"], chunk["dec"], chunk["distance"])
+        chunk["points"] = np.column_stack((chunk.pop("x"), chunk.pop("y"), chunk.pop("z")))
+        yield chunk
+
+
+def shift(chunks, planet_position):
+    """Add the offsets of the stars from the planet, the planet frame of the later stages."""
+    planet_position = np.asarray(planet_position, dtype=np.float64)
+    for chunk in chunks:
+        chunk["offset"] = chunk.pop("points") - planet_position
+        yield chunk
+
+
+def cull(chunks, facing):
+    """Keep the stars in front of the observer looking along the unit vector `facing`; all if it is None."""
+    for chunk in chunks:
+        if facing is not None:
+            front = chunk["offset"] @ facing > 0
+            chunk = {name: values[front] for name, values in chunk.items()}
+        yield chunk
+
+
+def magnitude(chunks):
+    """Add the apparent magnitude of every star from the planet, as apparent_magnitude computes it."""
+    for chunk in chunks:
+        abs_mag = absolute_magnitude(chunk.pop("phot_g_mean_mag"), chunk.pop("distance"))
+        distance = np.sqrt(np.square(chunk.pop("offset")).sum(axis=-1))
+        with np.errstate(divide='ignore'):
+            chunk["magnitude"] = abs_mag + 5 * np.log10(distance / 10)
+        yield chunk
+
+
+def chunk_brightest(chunks, n):
+    """Reduce every chunk to its `n` brightest stars, as (rows, magnitudes)."""
+    for chunk in chunks:
+        top = brightest(chunk["magnitude"], n)
+        yield chunk["rows"][top], chunk["magnitude"][top]
+
+
+def merge_brightest(selections, n):
+    """
+    Merge per-chunk selections into the `n` brightest stars overall.
+
+    Parameters:
+    - selections (iterable): (rows, magnitudes) pairs, in any order.
+    - n (int): Number of stars to keep.
+
+    Returns:
+    - np.ndarray: Catalog rows of the selected stars, brightest first; equal magnitudes by row.
+    - np.ndarray: Their apparent magnitudes.
+    """
+    rows, magnitudes = np.empty(0, dtype=np.int64), np.empty(0)
+    for chunk_rows, chunk_magnitudes in selections:
+        # Once n stars are kept, only brighter ones can enter
+        if len(rows) == n:
+            entering = chunk_magnitudes <= magnitudes[-1]
+            chunk_rows, chunk_magnitudes = chunk_rows[entering], chunk_magnitudes[entering]
+            if len(chunk_rows) == 0:
+                continue
+        rows = np.concatenate((rows, chunk_rows))
+        magnitudes = np.concatenate((magnitudes, chunk_magnitudes))
+        keep = np.lexsort((rows, magnitudes))[:n]
+        rows, magnitudes = rows[keep], magnitudes[keep]
+    return rows, magnitudes
+
+
+def scan_range(catalog, planet_position, n, start, stop, chunk_rows=DEFAULT_CHUNK_ROWS, facing=None):
+    """Run the chunk pipeline over rows start..stop and return their `n` brightest stars."""
+    chunks = read_chunks(catalog, chunk_rows, start, stop)
+    chunks = magnitude(cull(shift(convert(chunks), planet_position), facing))
+    return merge_brightest(chunk_brightest(chunks, n), n)
+
+
+def scan_brightest(catalog, planet_position, n, chunk_rows=DEFAULT_CHUNK_ROWS, facing=None, workers=1):
+    """
+    Find the `n` stars with the smallest apparent magnitude seen from `planet_position` by scanning the store.
+
+    Parameters:
+    - catalog (Catalog): The catalog store.
+    - planet_position (array-like): Observer position (x, y, z) in parsecs.
+    - n (int): Number of stars to return.
+    - chunk_rows (int): Rows read and processed at a time.
+    - facing (array-like): Unit viewing direction; only the stars in front of the observer are kept. None keeps
+      the whole sky.
+    - workers (int): Chunks processed in parallel.
+
+    Returns:
+    - np.ndarray: Catalog rows of the selected stars, brightest first.
+    - np.ndarray: Their apparent magnitudes from the vantage point.
+    """
+    planet_position = np.asarray(planet_position, dtype=np.float64)
+    facing = None if facing is None else np.asarray(facing, dtype=np.float64)
+    if n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    if workers <= 1:
+        return scan_range(catalog, planet_position, n, 0, len(catalog), chunk_rows, facing)
+
+    def selections(executor):
+        # Keep at most two chunks per worker in flight, so memory stays bounded by the chunk size
+        pending = deque()
+        for start in range(0, len(catalog), chunk_rows):
+            pending.append(executor.submit(scan_range, catalog, planet_position, n, start,
+                                           min(start + chunk_rows, len(catalog)), chunk_rows, facing))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="catalog-scan") as executor:
+        return merge_brightest(selections(executor), n)
+
+
+def main():
+    from catalog_store import load_catalog
+
+    parser = argparse.ArgumentParser(description="Select the brightest stars seen from a planet by scanning a "
+                                                 "catalog store chunk by chunk.")
+    parser.add_argument("path", help="Directory of the catalog store.")
+    parser.add_argument("--ra", type=float, required=True, help="Planet's right ascension in degrees.")
+    parser.add_argument("--dec", type=float, required=True, help="Planet's declination in degrees.")
+    parser.add_argument("--distance", type=float, required=True, help="Planet's distance in parsecs.")
+    parser.add_argument("--limit", type=int, default=10, help="Number of stars to select.")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Rows per chunk.")
+    parser.add_argument("--workers", type=int, default=1, help="Chunks processed in parallel.")
+    parser.add_argument("--facing", type=float, nargs=2, metavar=("RA", "DEC"),
+                        help="Viewing direction; only the hemisphere around it is kept.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    catalog = load_catalog(args.path)
+    facing = None if args.facing is None else celestial_to_cartesian(*args.facing, 1.0)
+    rows, magnitudes = scan_brightest(catalog, celestial_to_cartesian(args.ra, args.dec, args.distance),
+                                      args.limit, chunk_rows=args.chunk_rows, facing=facing, workers=args.workers)
+    logging.info("Scanned %d stars in chunks of %d rows", len(catalog), args.chunk_rows)
+    print(json.dumps({
+        "source_id": np.asarray(catalog["source_id"][rows]).tolist(),
+        "apparent_magnitude": magnitudes.tolist(),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Local columnar copy of the Gaia catalog slice served by the star API.
+
+A catalog store is a directory holding one raw NumPy ``.npy`` file per column
+plus a ``manifest.json`` that lists the columns, the row count and a content
+version. Every column can be memory-mapped, so serving from the store needs no
+network access and no parsing at request time.
+
+Usage:
+    python catalog_store.py ingest catalog/ --min-index 50000 --max-index 70000
+    python catalog_store.py info catalog/
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from adql import GAIA_COLUMNS, gaia_query
+from coordinate_kernels import celestial_to_cartesian
+
+# Columns computed once at ingest time
+DERIVED_COLUMNS = ["distance", "x", "y", "z"]
+
+MANIFEST_NAME = "manifest.json"
+
+
+def fetch_gaia_slice(min_index=50000, max_index=70000):
+    """
+    Query the Gaia archive for the random_index slice served by the API.
+
+    Parameters:
+    - min_index (int): Lower bound of the random_index window (inclusive).
+    - max_index (int): Upper bound of the random_index window (inclusive).
+
+    Returns:
+    - dict: Column name -> NumPy array for every name in GAIA_COLUMNS.
+    - str: The ADQL query that was run.
+    """
+    # Imported here so that serving from a local store never loads astroquery
+    from astroquery.gaia import Gaia
+    Gaia.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"  # Data Release 3, default
+
+    query = gaia_query(random_index=(min_index, max_index))
+
+    job = Gaia.launch_job_async(query)
+    df = job.get_results().to_pandas()
+
+    # Gaia returns SOURCE_ID in upper case, the store uses lower case names
+    df.columns = [column.lower() for column in df.columns]
+
+    return {column: df[column].to_numpy() for column in GAIA_COLUMNS}, query
+
+
+def derive_columns(columns):
+    """
+    Add the derived distance and ICRS Cartesian columns to Gaia columns.
+
+    Parameters:
+    - columns (dict): Column name -> array for every name in GAIA_COLUMNS.
+
+    Returns:
+    - dict: Contiguous arrays for every name in GAIA_COLUMNS and DERIVED_COLUMNS.
+    """
+    columns = {name: np.ascontiguousarray(columns[name]) for name in GAIA_COLUMNS}
+
+    # Calculate distance from parallax (in parsecs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns["distance"] = 1000 / columns["parallax"].astype(np.float64)
+
+    # Precompute the ICRS Cartesian position of every star
+    columns["x"], columns["y"], columns["z"] = celestial_to_cartesian(
+        columns["ra"], columns["dec"], columns["distance"]
+    )
+    return columns
+
+
+def write_catalog(path, columns, query=None):
+    """
+    Write a catalog store, adding the derived distance and ICRS Cartesian columns.
+
+    Parameters:
+    - path (str): Directory of the store. Created if missing.
+    - columns (dict): Column name -> array for every name in GAIA_COLUMNS.
+    - query (str): Optional description of where the rows came from.
+
+    Returns:
+    - dict: The manifest that was written.
+    """
+    return write_catalog_parts(path, [derive_columns(columns)], query=query)
+
+
+def write_catalog_parts(path, parts, query=None):
+    """
+    Write a catalog store from consecutive parts, one column at a time.
+
+    Only one column of one part is in memory at a time, so a store larger than
+    memory can be assembled from parts saved on disk. The store and its version
+    are the same as write_catalog would produce from the concatenated parts.
+
+    Parameters:
+    - path (str): Directory of the store. Created if missing.
+    - parts (list): Mappings (e.g. dicts or loaded .npz files) of every name in GAIA_COLUMNS and
+      DERIVED_COLUMNS to arrays, as derive_columns returns them.
+    - query (str): Optional description of where the rows came from.
+
+    Returns:
+    - dict: The manifest that was written.
+    """
+    os.makedirs(path, exist_ok=True)
+    rows = sum(len(part["source_id"]) for part in parts)
+
+    # The version is a digest of the content, so re-ingesting the same rows keeps it
+    digest = hashlib.sha1()
+    manifest_columns = {}
+    for name in GAIA_COLUMNS + DERIVED_COLUMNS:
+        dtype = np.result_type(*[part[name].dtype for part in parts]) if parts else np.dtype(np.float64)
+        digest.update(name.encode())
+        file_name = f"{name}.npy"
+        # Replace rather than overwrite, so workers that mapped the old file keep a valid view
+        with open(os.path.join(path, file_name + ".tmp"), "wb") as f:
+            np.lib.format.write_array_header_1_0(f, {
+                "descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (rows,),
+            })
+            for part in parts:
+                array = np.ascontiguousarray(part[name], dtype=dtype)
+                digest.update(array.data)
+                f.write(array.data)
+        os.replace(os.path.join(path, file_name + ".tmp"), os.path.join(path, file_name))
+        manifest_columns[name] = {"file": file_name, "dtype": dtype.str}
+
+    manifest = {
+        "version": digest.hexdigest()[:16],
+        "rows": int(rows),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "query": query,
+        "columns": manifest_columns,
+    }
+
+    # Write the manifest last and atomically so readers never see a partial store
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return manifest
+
+
+class Catalog:
+    """
+    Read-only view of a catalog store.
+
+    Columns are memory-mapped on first access, so opening a store is cheap and
+    only the pages that are actually read are loaded from disk.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest["version"]
+        self.rows = self.manifest["rows"]
+        self._mmap_mode = "r" if mmap else None
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, name):
+        return name in self.manifest["columns"]
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            if name not in self.manifest["columns"]:
+                raise KeyError(name)
+            file_name = self.manifest["columns"][name]["file"]
+            self._columns[name] = np.load(os.path.join(self.path, file_name), mmap_mode=self._mmap_mode)
+        return self._columns[name]
+
+    def to_pandas(self, rows=None):
+        """
+        Build a DataFrame shaped like the live Gaia query result.
+
+        Parameters:
+        - rows (np.ndarray): Optional row indices to select. All rows by default.
+
+        Returns:
+        - pd.DataFrame: Catalog rows with SOURCE_ID named as astroquery returns it.
+        """
+        import pandas as pd
+
+        data = {}
+        for name in GAIA_COLUMNS + DERIVED_COLUMNS:
+            column = self[name]
+            data[name] = np.asarray(column if rows is None else column[rows])
+        df = pd.DataFrame(data)
+        return df.rename(columns={"source_id": "SOURCE_ID"})
+
+
+def load_catalog(path, mmap=True):
+    """
+    Open a catalog store written by write_catalog.
+
+    Parameters:
+    - path (str): Directory of the store.
+    - mmap (bool): Memory-map the columns instead of reading them into memory.
+
+    Returns:
+    - Catalog: Read-only view of the store.
+    """
+    return Catalog(path, mmap=mmap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local Gaia catalog store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Download a Gaia slice into a local store.")
+    ingest_parser.add_argument("path", help="Directory of the catalog store.")
+    ingest_parser.add_argument("--min-index", type=int, default=50000)
+    ingest_parser.add_argument("--max-index", type=int, default=70000)
+
+    info_parser = subparsers.add_parser("info", help="Print the manifest of a local store.")
+    info_parser.add_argument("path", help="Directory of the catalog store.")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "ingest":
+        columns, query = fetch_gaia_slice(args.min_index, args.max_index)
+        manifest = write_catalog(args.path, columns, query=query)
+        logging.info("Wrote %d stars to %s (version %s)", manifest["rows"], args.path, manifest["version"])
+    elif args.command == "info":
+        print(json.dumps(load_catalog(args.path).manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Versioned catalog stores shared by every worker, swapped without downtime.
+
+Catalog columns and the saved indexes are opened with np.load(mmap_mode="r"),
+so every uvicorn worker on a host maps the same files and their pages live
+once in the page cache, however many workers there are. Two things would
+still give each worker its own copy or stop the service for a swap: an index
+missing from the store, which each worker then builds in memory, and
+rewriting a store in place under running workers. A catalog root avoids both:
+
+    root/
+        CURRENT                 name of the live version, e.g. "96f94d9039e5e996"
+        versions/<version>/     a complete catalog store with its magnitude index and sky tiles
+
+publish() copies (or moves) a store into versions/, builds and saves the
+indexes there, and only then replaces CURRENT atomically. Workers re-read
+CURRENT at most once per check interval; when it changes they open the new
+store and map its indexes, while requests already running finish on the
+version they started with. Mapped pages of an old version stay valid even if
+its directory is deleted, and the most recent versions are kept so rollback
+is a pointer change (activate()).
+
+A plain store directory, without CURRENT, is served as it is.
+
+Usage:
+    python catalog_versions.py publish root/ new_store/ --keep 2
+    python catalog_versions.py activate root/ 96f94d9039e5e996
+    python catalog_versions.py list root/
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+CURRENT_NAME = "CURRENT"
+VERSIONS_DIR_NAME = "versions"
+
+logger = logging.getLogger(__name__)
+
+
+def current_version(root):
+    """Return the live version name of a catalog root, or None if `root` is a plain store."""
+    try:
+        with open(os.path.join(root, CURRENT_NAME)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def resolve_store(root):
+    """Return the directory of the live catalog store of `root`: its current version, or `root` itself."""
+    version = current_version(root)
+    return root if version is None else os.path.join(root, VERSIONS_DIR_NAME, version)
+
+
+def list_versions(root):
+    """Return the published versions of a catalog root, oldest first."""
+    versions_dir = os.path.join(root, VERSIONS_DIR_NAME)
+    if not os.path.isdir(versions_dir):
+        return []
+    names = [name for name in os.listdir(versions_dir) if not name.endswith(".tmp")]
+    return sorted(names, key=lambda name: os.path.getmtime(os.path.join(versions_dir, name)))
+
+
+def activate(root, version):
+    """
+    Make `version` the live catalog of `root`.
+
+    Parameters:
+    - root (str): Catalog root.
+    - version (str): A published version.
+    """
+    if not os.path.isdir(os.path.join(root, VERSIONS_DIR_NAME, version)):
+        raise ValueError(f"No version {version} in {root}")
+    # Replace the pointer atomically, so workers read either the old or the new version
+    tmp_path = os.path.join(root, CURRENT_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_NAME))
+    logger.info("Catalog %s now serves version %s", root, version)
+
+
+def build_indexes(path):
+    """Build and save the magnitude index and the sky tiles of a store unless valid ones are saved."""
+    from catalog_store import load_catalog
+    from magnitude_selection import INDEX_DIR_NAME as MAGNITUDE_INDEX_DIR, MagnitudeBoundIndex, load_magnitude_index
+    from sky_tiles import INDEX_DIR_NAME as SKY_TILES_DIR, SkyTiles, load_sky_tiles
+
+    catalog = load_catalog(path)
+    if load_magnitude_index(catalog) is None:
+        MagnitudeBoundIndex.build(catalog).save(os.path.join(path, MAGNITUDE_INDEX_DIR))
+    if load_sky_tiles(catalog) is None:
+        SkyTiles.build(catalog).save(os.path.join(path, SKY_TILES_DIR))
+
+
+def publish(root, store_path, move=False, keep=2):
+    """
+    Add a catalog store to a root, build its indexes and make it the live version.
+
+    Parameters:
+    - root (str): Catalog root. Created if missing.
+    - store_path (str): Catalog store to publish.
+    - move (bool): Move the store into the root instead of copying it.
+    - keep (int): Versions kept, the live one included; older ones are deleted.
+
+    Returns:
+    - str: The published version.
+    """
+    from catalog_store import load_catalog
+
+    version = load_catalog(store_path).version
+    target = os.path.join(root, VERSIONS_DIR_NAME, version)
+    if not os.path.isdir(target):
+        # Prepare the version under a temporary name, so a half-copied store is never published
+        tmp_target = target + ".tmp"
+        shutil.rmtree(tmp_target, ignore_errors=True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if move:
+            shutil.move(store_path, tmp_target)
+        else:
+            shutil.copytree(store_path, tmp_target)
+        build_indexes(tmp_target)
+        os.replace(tmp_target, target)
+    else:
+        build_indexes(target)
+    os.utime(target)
+
+    activate(root, version)
+    prune(root, keep)
+    return version
+
+
+def prune(root, keep=2):
+    """Delete all but the `keep` most recently published versions; the live version is never deleted."""
+    live = current_version(root)
+    versions = [version for version in list_versions(root) if version != live]
+    for version in versions[:max(len(versions) - (keep - 1), 0)]:
+        shutil.rmtree(os.path.join(root, VERSIONS_DIR_NAME, version), ignore_errors=True)
+        logger.info("Deleted catalog version %s", version)
+
+
+class CatalogPointer:
+    """
+    Live store directory of a catalog root, re-read at most once per `check_interval` seconds.
+
+    Parameters:
+    - root (str): Catalog root, or a plain catalog store.
+    - check_interval (float): Seconds between two reads of the pointer.
+    """
+
+    def __init__(self, root, check_interval=1.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = -float("inf")
+        self._path = None
+
+    def resolve(self):
+        """Return the directory of the live catalog store."""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            with self._lock:
+                if now - self._checked >= self.check_interval:
+                    self._path = resolve_store(self.root)
+                    self._checked = now
+        return self._path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish and switch the catalog versions served by the star API.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    publish_parser = subparsers.add_parser("publish", help="Add a store, build its indexes and make it live.")
+    publish_parser.add_argument("root", help="Catalog root served by the API (GAIA_CATALOG_DIR).")
+    publish_parser.add_argument("store", help="Catalog store to publish.")
+    publish_parser.add_argument("--move", action="store_true", help="Move the store instead of copying it.")
+    publish_parser.add_argument("--keep", type=int, default=2, help="Versions kept, the live one included.")
+    activate_parser = subparsers.add_parser("activate", help="Make a published version live, e.g. to roll back.")
+    activate_parser.add_argument("root")
+    activate_parser.add_argument("version")
+    list_parser = subparsers.add_parser("list", help="List the published versions.")
+    list_parser.add_argument("root")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "publish":
+        publish(args.root, args.store, move=args.move, keep=args.keep)
+    elif args.command == "activate":
+        activate(args.root, args.version)
+    elif args.command == "list":
+        print(json.dumps({"current": current_version(args.root), "versions": list_versions(args.root)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Bounded thread pool that keeps blocking work off the event loop.
+
+Gaia queries, catalog reads and the projection are blocking, so running them
+inside an ``async def`` endpoint stalls every other request of the worker. The
+executor runs them on a fixed number of threads instead, admits at most
+`max_queue` jobs waiting for a thread and gives every job a deadline. Jobs
+that cannot be admitted or miss their deadline raise ExecutorSaturated or
+ComputeTimeout, which the API turns into 503 and 504 responses.
+
+A job that times out cannot be interrupted: its thread keeps running until the
+job returns, and it keeps counting against the queue limit until then, so a
+burst of slow jobs cannot pile up unbounded work behind the deadline.
+"""
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorSaturated(Exception):
+    """Raised when every thread is busy and the queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Compute queue is full, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class ComputeTimeout(Exception):
+    """Raised when a job does not finish before its deadline."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with admission control, deadlines and utilisation counters.
+
+    Parameters:
+    - max_workers (int): Number of threads.
+    - max_queue (int): Jobs allowed to wait for a thread; further jobs are rejected.
+    - timeout (float): Seconds a caller waits for its job. None waits forever.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, timeout=30.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compute")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.pending = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    async def run(self, function, *args):
+        """
+        Run `function(*args)` on a worker thread and wait for its result.
+
+        Parameters:
+        - function (callable): Blocking function to run.
+        - args: Its arguments.
+
+        Returns:
+        - The function's result; its exceptions are raised here.
+        """
+        # Admit the job only if a thread or a queue slot is free
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self._retry_after())
+            self.pending += 1
+            self.submitted += 1
+
+        submitted = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._call, function, args, submitted)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise ComputeTimeout(f"Computation did not finish within {self.timeout} s") from None
+
+    def _call(self, function, args, submitted):
+        started = time.monotonic()
+        with self._lock:
+            self.running += 1
+            self.wait_seconds += started - submitted
+        try:
+            result = function(*args)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                self.completed += 1
+                self.busy_seconds += time.monotonic() - started
+        return result
+
+    def _retry_after(self):
+        """Seconds until a queue slot is likely to free up, from the mean job duration."""
+        mean_seconds = self.busy_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(mean_seconds * (self.pending - self.max_workers + 1) / self.max_workers))
+
+    def stats(self):
+        """Return the queue state and the utilisation counters of the executor."""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout": self.timeout,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "utilisation": self.busy_seconds / (elapsed * self.max_workers) if elapsed else 0.0,
+                "mean_wait_seconds": self.wait_seconds / self.completed if self.completed else 0.0,
+                "mean_run_seconds": self.busy_seconds / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self, wait=True):
+        """Stop the threads once the running jobs are done."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,349 @@
+"""
+Array-in/array-out coordinate kernels shared by the scripts and the star API.
+
+Every function accepts scalars or NumPy arrays (anything that broadcasts) and
+works on whole arrays at once instead of row by row. The optional ``out``
+buffers have a leading axis for the outputs, e.g. shape ``(3, n)`` for
+``celestial_to_cartesian``, so callers that run the pipeline repeatedly can
+reuse their memory between calls.
+"""
+import numpy as np
+
+
+def _output_buffer(out, count, *arrays):
+    """Return a float64 buffer with `count` rows of the broadcast shape of `arrays`."""
+    shape = np.broadcast_shapes(*(np.shape(array) for array in arrays))
+    if out is None:
+        return np.empty((count,) + shape)
+    if out.shape != (count,) + shape:
+        raise ValueError(f"out has shape {out.shape}, expected {(count,) + shape}")
+    return out
+
+
+def _unpack(buffer):
+    """Split a buffer into its rows, returning scalars for scalar input."""
+    if buffer.ndim == 1:
+        return tuple(buffer[i] for i in range(len(buffer)))
+    return tuple(buffer[i, ...] for i in range(len(buffer)))
+
+
+def celestial_to_cartesian(ra, dec, distance, out=None):
+    """
+    Convert celestial coordinates (RA, Dec) to Cartesian coordinates (x, y, z).
+
+    Parameters:
+    - ra (float or np.ndarray): Right Ascension in degrees
+    - dec (float or np.ndarray): Declination in degrees
+    - distance (float or np.ndarray): Distance from the observer in parsecs
+    - out (np.ndarray): Optional (3, ...) float64 buffer receiving x, y and z
+
+    Returns:
+    - x, y, z (float or np.ndarray): Cartesian coordinates
+    """
+    buffer = _output_buffer(out, 3, ra, dec, distance)
+    x, y, z = (buffer[i, ...] for i in range(3))
+
+    # Convert RA and Dec from degrees to radians
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+
+    # distance * cos(dec) is shared by x and y, keep it in z until z is computed
+    np.multiply(distance, np.cos(dec_rad), out=z)
+    np.multiply(z, np.cos(ra_rad), out=x)
+    np.multiply(z, np.sin(ra_rad), out=y)
+    np.multiply(distance, np.sin(dec_rad), out=z)
+
+    return _unpack(buffer)
+
+
+def cartesian_to_celestial(x, y, z, out=None):
+    """
+    Convert Cartesian coordinates (x, y, z) to celestial coordinates (RA, Dec).
+
+    Parameters:
+    - x, y, z (float or np.ndarray): Cartesian coordinates
+    - out (np.ndarray): Optional (2, ...) float64 buffer receiving RA and Dec
+
+    Returns:
+    - ra (float or np.ndarray): Right Ascension in degrees, in [0, 360)
+    - dec (float or np.ndarray): Declination in degrees
+    """
+    buffer = _output_buffer(out, 2, x, y, z)
+    ra, dec = buffer[0, ...], buffer[1, ...]
+
+    # Calculate the distance from the origin
+    distance = np.sqrt(np.square(x) + np.square(y) + np.square(z))
+
+    # atan2 handles quadrants correctly, then move RA into [0, 2*pi)
+    np.arctan2(y, x, out=ra)
+    np.add(ra, 2 * np.pi, out=ra, where=ra < 0)
+    np.degrees(ra, out=ra)
+
+    # Calculate Declination
+    np.divide(z, distance, out=dec)
+    np.arcsin(dec, out=dec)
+    np.degrees(dec, out=dec)
+
+    return _unpack(buffer)
+
+
+# Reference epoch of Gaia DR3 astrometry (Julian year)
+GAIA_EPOCH = 2016.0
+
+# Milliarcseconds per year at 1 pc, in pc per year
+MAS_PER_YEAR_TO_PC_PER_YEAR = np.pi / (180 * 3600 * 1000)
+
+
+def space_velocity(ra, dec, distance, pmra, pmdec, out=None):
+    """
+    Cartesian velocity of stars from their proper motion.
+
+    The radial velocity is taken as zero, since it is not selected from Gaia, and
+    stars without a proper motion (two-parameter solutions) do not move. All the
+    trigonometry is done here, once per star, so positions at any number of
+    epochs only cost a multiply-add each (see propagate_positions).
+
+    Parameters:
+    - ra (float or np.ndarray): Right Ascension in degrees
+    - dec (float or np.ndarray): Declination in degrees
+    - distance (float or np.ndarray): Distance from the Sun in parsecs
+    - pmra (float or np.ndarray): Proper motion in RA, mu_alpha* = mu_alpha cos(dec), in mas/yr
+    - pmdec (float or np.ndarray): Proper motion in Dec in mas/yr
+    - out (np.ndarray): Optional (3, ...) float64 buffer receiving vx, vy and vz
+
+    Returns:
+    - vx, vy, vz (float or np.ndarray): Velocity in parsecs per year
+    """
+    buffer = _output_buffer(out, 3, ra, dec, distance, pmra, pmdec)
+    vx, vy, vz = (buffer[i, ...] for i in range(3))
+
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+    sin_ra, cos_ra = np.sin(ra_rad), np.cos(ra_rad)
+    sin_dec, cos_dec = np.sin(dec_rad), np.cos(dec_rad)
+
+    # Tangential speeds along the east (RA) and north (Dec) directions
+    scale = np.multiply(distance, MAS_PER_YEAR_TO_PC_PER_YEAR)
+    east = np.nan_to_num(np.multiply(pmra, scale))
+    north = np.nan_to_num(np.multiply(pmdec, scale))
+
+    # east = (-sin ra, cos ra, 0), north = (-sin dec cos ra, -sin dec sin ra, cos dec)
+    np.multiply(north, sin_dec, out=vz)
+    np.multiply(vz, -cos_ra, out=vx)
+    np.subtract(vx, np.multiply(east, sin_ra), out=vx)
+    np.multiply(vz, -sin_ra, out=vy)
+    np.add(vy, np.multiply(east, cos_ra), out=vy)
+    np.multiply(north, cos_dec, out=vz)
+
+    return _unpack(buffer)
+
+
+def propagate_positions(x, y, z, vx, vy, vz, epochs, reference_epoch=GAIA_EPOCH, out=None):
+    """
+    Move stars along straight lines to several epochs.
+
+    Parameters:
+    - x, y, z (np.ndarray): Cartesian positions at the reference epoch, in parsecs; the last axis holds the stars
+    - vx, vy, vz (np.ndarray): Velocities from space_velocity, in parsecs per year
+    - epochs (float or np.ndarray): Julian years to propagate to
+    - reference_epoch (float): Julian year of the given positions
+    - out (np.ndarray): Optional (3, epochs, ...) float64 buffer receiving the positions
+
+    Returns:
+    - x, y, z (np.ndarray): Positions with one row per epoch, shape (epochs, ...)
+    """
+    elapsed = np.atleast_1d(np.asarray(epochs, dtype=np.float64)) - reference_epoch
+    elapsed = elapsed.reshape(elapsed.shape + (1,) * np.ndim(x))
+    buffer = _output_buffer(out, 3, elapsed, x, vx)
+
+    # position + velocity * elapsed years, for every epoch at once
+    for axis, (position, velocity) in enumerate(((x, vx), (y, vy), (z, vz))):
+        np.multiply(elapsed, velocity, out=buffer[axis])
+        np.add(buffer[axis], position, out=buffer[axis])
+
+    return buffer[0], buffer[1], buffer[2]
+
+
+def planar_projection(x, y, z, R, out=None):
+    """
+    Project points onto the plane z = R.
+
+    Parameters:
+    - x, y, z (np.ndarray): Cartesian coordinates of the points
+    - R (float or np.ndarray): Distance of the projection plane
+    - out (np.ndarray): Optional (2, ...) float64 buffer receiving the projected x and y
+
+    Returns:
+    - x_projected, y_projected (np.ndarray): Coordinates on the plane
+    """
+    buffer = _output_buffer(out, 2, x, y, z)
+    x_projected, y_projected = buffer[0, ...], buffer[1, ...]
+
+    # Projection factor R / z, kept in x_projected until y is done
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(R, z, out=x_projected)
+        np.multiply(y, x_projected, out=y_projected)
+        np.multiply(x, x_projected, out=x_projected)
+
+    return _unpack(buffer)
+
+
+def normalize_projection(x_projected, y_projected, scale=200, out=None, normalization_value=None):
+    """
+    Scale projected points so that their mean distance from the centre is `scale`.
+
+    Parameters:
+    - x_projected, y_projected (np.ndarray): Projected coordinates; the last axis holds the stars
+    - scale (float): Mean modulus after normalization
+    - out (np.ndarray): Optional (2, ...) float64 buffer receiving the normalized x and y
+    - normalization_value (float or np.ndarray): Mean modulus to divide by, when it was computed
+      beforehand over a larger set of points (e.g. a sky processed in batches)
+
+    Returns:
+    - x_normalized, y_normalized (np.ndarray): Normalized coordinates
+    - normalization_value (float or np.ndarray): Mean modulus before normalization, one per row
+    """
+    buffer = _output_buffer(out, 2, x_projected, y_projected)
+    x_normalized, y_normalized = buffer[0, ...], buffer[1, ...]
+
+    # Use the given mean modulus as is
+    if normalization_value is not None:
+        normalization_value = np.asarray(normalization_value, dtype=np.float64)[..., np.newaxis]
+        np.divide(x_projected, normalization_value, out=x_normalized)
+        np.multiply(x_normalized, scale, out=x_normalized)
+        np.divide(y_projected, normalization_value, out=y_normalized)
+        np.multiply(y_normalized, scale, out=y_normalized)
+        return x_normalized, y_normalized, normalization_value[..., 0]
+
+    # Modulus (distance in the x-y plane) of each projected point, kept in x_normalized for now
+    np.square(x_projected, out=x_normalized)
+    np.square(y_projected, out=y_normalized)
+    np.add(x_normalized, y_normalized, out=x_normalized)
+    np.sqrt(x_normalized, out=x_normalized)
+
+    # Mean modulus along the star axis, ignoring undefined points like pandas does
+    with np.errstate(invalid='ignore'):
+        normalization_value = np.nanmean(x_normalized, axis=-1, keepdims=True)
+
+    np.divide(x_projected, normalization_value, out=x_normalized)
+    np.multiply(x_normalized, scale, out=x_normalized)
+    np.divide(y_projected, normalization_value, out=y_normalized)
+    np.multiply(y_normalized, scale, out=y_normalized)
+
+    if normalization_value.ndim == 1:
+        normalization_value = normalization_value[0]
+    else:
+        normalization_value = normalization_value[..., 0]
+    return x_normalized, y_normalized, normalization_value
+
+
+def normalized_brightness(magnitude, reference_magnitude, out=None, bounds=None):
+    """
+    Brightness relative to a reference magnitude, scaled between 0 and 1.
+
+    Parameters:
+    - magnitude (np.ndarray): Apparent magnitudes; the last axis holds the stars
+    - reference_magnitude (float or np.ndarray): Magnitude with relative brightness 1
+    - out (np.ndarray): Optional buffer of the same shape as `magnitude`
+    - bounds (tuple): Precomputed (min, max) relative brightness, when the stars are processed in batches
+
+    Returns:
+    - np.ndarray: Relative brightness normalized between 0 (faintest) and 1 (brightest),
+      in the precision of `magnitude` (Gaia G magnitudes are float32)
+    """
+    magnitude = np.asarray(magnitude)
+    dtype = magnitude.dtype if np.issubdtype(magnitude.dtype, np.floating) else np.float64
+    brightness = np.empty(magnitude.shape, dtype=dtype) if out is None else out
+    reference_magnitude = np.asarray(reference_magnitude, dtype=dtype)
+    if reference_magnitude.ndim:
+        reference_magnitude = reference_magnitude[..., np.newaxis]
+
+    # Relative brightness 10^(0.4 * (m_ref - m))
+    np.subtract(reference_magnitude, magnitude, out=brightness)
+    np.multiply(brightness, 0.4, out=brightness)
+    np.power(10, brightness, out=brightness)
+
+    # Normalize brightness between 0 and 1
+    if bounds is not None:
+        min_brightness, max_brightness = (np.asarray(bound, dtype=dtype)[..., np.newaxis] for bound in bounds)
+    else:
+        with np.errstate(invalid='ignore'):
+            min_brightness = np.nanmin(brightness, axis=-1, keepdims=True)
+            max_brightness = np.nanmax(brightness, axis=-1, keepdims=True)
+    np.subtract(brightness, min_brightness, out=brightness)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(brightness, max_brightness - min_brightness, out=brightness)
+
+    return brightness
+
+
+def horizon_rotation(ra, dec):
+    """
+    Rotation from ICRS Cartesian coordinates to the horizon frame of a planet.
+
+    The planet's zenith is the outward direction from the Sun through the planet, so +z of the frame points
+    along (ra, dec), +x to the east and +y to the north of that direction.
+
+    Parameters:
+    - ra (float): Planet's right ascension in degrees
+    - dec (float): Planet's declination in degrees
+
+    Returns:
+    - np.ndarray: (3, 3) matrix whose rows are the east, north and zenith unit vectors
+    """
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+    sin_ra, cos_ra = np.sin(ra_rad), np.cos(ra_rad)
+    sin_dec, cos_dec = np.sin(dec_rad), np.cos(dec_rad)
+    return np.array([
+        [-sin_ra, cos_ra, 0.0],
+        [-sin_dec * cos_ra, -sin_dec * sin_ra, cos_dec],
+        [cos_dec * cos_ra, cos_dec * sin_ra, sin_dec],
+    ])
+
+
+def horizon_projection(positions, planet_position, rotation, scale=200, out=None):
+    """
+    Rotate stars into a planet's horizon frame, cull those below its horizon and project and normalize the rest.
+
+    The multi-step path (planar_projection, then normalize_projection) projects every star through the ICRS z
+    axis. Here one matrix product moves all stars into the planet's frame, the stars below the horizon are
+    dropped before anything else is computed, and the gnomonic projection and the mean-modulus normalization
+    run in place on the survivors only. The plane distance of planar_projection is left out, since the
+    normalization divides it away.
+
+    Parameters:
+    - positions (np.ndarray): (3, n) ICRS Cartesian positions of the stars in parsecs
+    - planet_position (array-like): ICRS Cartesian position (x, y, z) of the planet in parsecs
+    - rotation (np.ndarray): (3, 3) rotation from horizon_rotation
+    - scale (float): Mean modulus after normalization
+    - out (np.ndarray): Optional (3, n) float64 buffer receiving the rotated positions, e.g. scratch memory
+
+    Returns:
+    - visible (np.ndarray): Indices of the stars above the horizon, in their input order
+    - x_normalized, y_normalized (np.ndarray): Normalized coordinates of the visible stars
+    - normalization_value (float): Mean modulus before normalization, NaN if no star is visible
+    """
+    # One matrix product rotates every star; the planet's offset is rotated once and subtracted
+    local = np.matmul(rotation, positions, out=out)
+    local -= (rotation @ np.asarray(planet_position, dtype=np.float64))[:, np.newaxis]
+
+    # Cull below the horizon first, so the rest only touches the visible stars
+    visible = np.flatnonzero(local[2] > 0)
+    if len(visible) == 0:
+        return visible, np.empty(0), np.empty(0), np.nan
+    projected = local[:, visible]
+    x_normalized, y_normalized, height = projected[0], projected[1], projected[2]
+
+    # Gnomonic projection onto the plane one parsec above the planet
+    np.divide(x_normalized, height, out=x_normalized)
+    np.divide(y_normalized, height, out=y_normalized)
+
+    # Mean modulus of the projected stars, kept in the height row, which is no longer needed
+    np.hypot(x_normalized, y_normalized, out=height)
+    normalization_value = float(height.mean())
+    factor = scale / normalization_value
+    np.multiply(x_normalized, factor, out=x_normalized)
+    np.multiply(y_normalized, factor, out=y_normalized)
+
+    return visible, x_normalized, y_normalized, normalization_value
@@ -0,0 +1,139 @@
+"""
+Local snapshot of the NASA Exoplanet Archive planet table.
+
+The table is the CSV download of the Planetary Systems Composite Parameters
+table (pscomppars) from https://exoplanetarchive.ipac.caltech.edu. Only the
+planet name, the host star name, the host coordinates and the distance are
+used.
+
+ExoplanetTable holds those columns as arrays with a dictionary from planet
+name to row, so the star API resolves a planet by name in constant time
+instead of the caller looking it up elsewhere first. Names are matched
+ignoring case and runs of whitespace ("kepler-22  B" finds "Kepler-22 b").
+
+A planet's ID is its data row in the CSV file (0 for the first planet after
+the header), counted before planets without coordinates are dropped. IDs are
+only valid for the snapshot they were read from: a new download numbers its
+rows differently. pl_name is the identifier that stays stable across
+snapshots.
+"""
+import csv
+import re
+
+import numpy as np
+
+# Our column name -> NASA Exoplanet Archive column name
+EXOPLANET_COLUMNS = {"name": "pl_name", "host": "hostname", "ra": "ra", "dec": "dec", "distance": "sy_dist"}
+
+
+def normalize_name(name):
+    """Return a planet name folded to lower case with runs of whitespace collapsed, the key names are matched on."""
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+def _float(value):
+    """Parse a numeric CSV field; empty fields are NaN."""
+    return float(value) if value.strip() else np.nan
+
+
+class ExoplanetTable:
+    """
+    Exoplanet table indexed by planet name.
+
+    Parameters:
+    - name, host (np.ndarray): Planet and host star names.
+    - ra, dec (np.ndarray): Host coordinates in degrees.
+    - distance (np.ndarray): Host distance in parsecs, NaN when unknown.
+    - ids (np.ndarray): ID of every planet, its data row in the CSV file; positions in the table by default.
+    """
+
+    def __init__(self, name, host, ra, dec, distance, ids=None):
+        self.name = name
+        self.host = host
+        self.ra = ra
+        self.dec = dec
+        self.distance = distance
+        self.ids = np.arange(len(name)) if ids is None else ids
+        # A name listed twice resolves to its first row
+        self._rows = {}
+        for row, planet_name in enumerate(name.tolist()):
+            self._rows.setdefault(normalize_name(planet_name), row)
+        self._id_rows = {planet_id: row for row, planet_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.name)
+
+    def row(self, name):
+        """Return the row of a planet, given its name or its ID in this snapshot, or None if there is no such planet."""
+        if name.isdigit():
+            return self._id_rows.get(int(name))
+        return self._rows.get(normalize_name(name))
+
+    def planet(self, row):
+        """
+        Return a planet of the table.
+
+        Parameters:
+        - row (int): Row of the planet, as returned by row().
+
+        Returns:
+        - dict: id (valid for this snapshot only), name, host, ra and dec (degrees) and distance (parsecs, None
+          when unknown).
+        """
+        distance = float(self.distance[row])
+        return {
+            "id": int(self.ids[row]),
+            "name": str(self.name[row]),
+            "host": str(self.host[row]),
+            "ra": float(self.ra[row]),
+            "dec": float(self.dec[row]),
+            "distance": None if np.isnan(distance) else distance,
+        }
+
+    def to_frame(self):
+        """Return the table as the DataFrame load_exoplanets returns."""
+        import pandas as pd
+
+        return pd.DataFrame({column: getattr(self, column) for column in EXOPLANET_COLUMNS})
+
+
+def load_exoplanet_table(path):
+    """
+    Read an exoplanet table into an ExoplanetTable.
+
+    The CSV is parsed without pandas, so the star API can load it at startup without importing pandas.
+
+    Parameters:
+    - path (str): CSV file as downloaded from the archive; '#' comment lines are skipped.
+
+    Returns:
+    - ExoplanetTable: name, host, ra, dec (degrees) and distance (parsecs, NaN when unknown) of every planet with
+      coordinates.
+    """
+    with open(path, newline="") as f:
+        reader = csv.DictReader(line for line in f if not line.startswith("#"))
+        rows = [[record[archive] for archive in EXOPLANET_COLUMNS.values()] for record in reader]
+
+    names = np.array([row[0] for row in rows], dtype=str)
+    hosts = np.array([row[1] for row in rows], dtype=str)
+    ra, dec, distance = (np.array([_float(row[i]) for row in rows], dtype=np.float64) for i in (2, 3, 4))
+
+    # Planets without host coordinates cannot be placed
+    placed = ~(np.isnan(ra) | np.isnan(dec))
+    distance = np.where(distance > 0, distance, np.nan)
+    return ExoplanetTable(names[placed], hosts[placed], ra[placed], dec[placed], distance[placed],
+                          ids=np.flatnonzero(placed))
+
+
+def load_exoplanets(path):
+    """
+    Read an exoplanet table.
+
+    Parameters:
+    - path (str): CSV file as downloaded from the archive; '#' comment lines are skipped.
+
+    Returns:
+    - pd.DataFrame: name, host, ra, dec (degrees) and distance (parsecs, NaN when unknown) of every planet with
+      coordinates.
+    """
+    return load_exoplanet_table(path).to_frame()
@@ -0,0 +1,273 @@
+"""
+Content-addressed on-disk cache of Gaia TAP query results.
+
+The exploration scripts query the archive at import time, so every run waits
+for the same ADQL to be answered again. `Gaia` here stands in for
+astroquery's: launch_job_async(query).get_results() first looks the query up
+in a local cache and only asks the archive on a miss.
+
+An entry is addressed by the SHA-256 of the normalized query (whitespace
+collapsed, trailing semicolon dropped) together with the table the client
+queries (MAIN_GAIA_TABLE, which names the data release), and holds the result
+columns as an uncompressed NumPy .npz file, so a hit costs a few milliseconds.
+Hits refresh the file's modification time, and when the cache grows past its
+size bound the least recently used entries are deleted.
+
+Settings, read when the module is imported:
+- GAIA_CACHE_DIR: cache directory, ~/.cache/gaia_tap by default.
+- GAIA_CACHE_MAX_BYTES: size bound, 2 GiB by default.
+- GAIA_CACHE_OFFLINE=1: never contact the archive; a miss raises CacheMiss.
+
+Usage in a script, instead of `from astroquery.gaia import Gaia`:
+    from gaia_cache import Gaia
+
+    python gaia_cache.py info
+    python gaia_cache.py clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gaia_tap")
+DEFAULT_MAX_BYTES = 2 << 30
+ENTRY_SUFFIX = ".npz"
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode for a query that is not cached."""
+
+
+def normalize_query(query):
+    """Return the query with runs of whitespace collapsed and no trailing semicolon."""
+    return re.sub(r"\s+", " ", query).strip().rstrip(";").strip()
+
+
+def query_key(query, table):
+    """
+    Address of a query's result in the cache.
+
+    Parameters:
+    - query (str): The ADQL query.
+    - table (str): Main table of the client, which names the data release.
+
+    Returns:
+    - str: Hexadecimal SHA-256 digest.
+    """
+    return hashlib.sha256(json.dumps([normalize_query(query), table]).encode()).hexdigest()
+
+
+def _column_array(series):
+    """Plain NumPy array of a result column, so that entries never need pickle."""
+    import pandas as pd
+
+    values = series.to_numpy()
+    if values.dtype != object:
+        return values
+    # Masked integers and booleans come back as nullable columns; missing values become NaN
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=np.float64, na_value=np.nan)
+    # Text columns are stored as fixed-width strings
+    return values.astype(str)
+
+
+class CachedTable:
+    """
+    Query result read from the cache, with the parts of the astropy Table API the scripts use.
+
+    Parameters:
+    - columns (dict): Column name -> NumPy array, in the order the archive returned them.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def colnames(self):
+        return list(self.columns)
+
+    def to_pandas(self):
+        """Return the result as a DataFrame, as astropy's Table.to_pandas does."""
+        import pandas as pd
+
+        return pd.DataFrame(self.columns)
+
+
+class CachedJob:
+    """Finished job whose results come from the cache."""
+
+    def __init__(self, table):
+        self._table = table
+
+    def get_results(self):
+        return self._table
+
+
+class CachedGaia:
+    """
+    Gaia client answering queries from the cache first.
+
+    Parameters:
+    - cache_dir (str): Directory of the cache entries.
+    - max_bytes (int): Size bound of the cache; least recently used entries are deleted past it.
+    - offline (bool): Never contact the archive; a miss raises CacheMiss.
+    - client: Object with launch_job_async(query), astroquery's Gaia by default, imported on the first miss.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, offline=False, client=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"
+        self._client = client
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported here so that cache hits never load astroquery
+            from astroquery.gaia import Gaia
+            self._client = Gaia
+        return self._client
+
+    def entry_path(self, key):
+        """File of a cache entry; entries are spread over 256 subdirectories."""
+        return os.path.join(self.cache_dir, key[:2], key + ENTRY_SUFFIX)
+
+    def launch_job_async(self, query, **kwargs):
+        """
+        Run a query, or read its result from the cache.
+
+        Parameters:
+        - query (str): The ADQL query.
+        - kwargs: Passed on to the client's launch_job_async on a miss.
+
+        Returns:
+        - CachedJob: Job whose get_results() returns a CachedTable.
+        """
+        key = query_key(query, self.MAIN_GAIA_TABLE)
+        path = self.entry_path(key)
+
+        # A hit marks the entry as recently used
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                columns = {name: entry[name] for name in entry.files}
+            os.utime(path)
+            with self._lock:
+                self.hits += 1
+            return CachedJob(CachedTable(columns))
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self.misses += 1
+        if self.offline:
+            raise CacheMiss(f"Query not cached and offline mode is on: {normalize_query(query)}")
+
+        self.client.MAIN_GAIA_TABLE = self.MAIN_GAIA_TABLE
+        df = self.client.launch_job_async(query, **kwargs).get_results().to_pandas()
+        columns = {name: _column_array(df[name]) for name in df.columns}
+        self._store(path, columns)
+        return CachedJob(CachedTable(columns))
+
+    def _store(self, path, columns):
+        """Write an entry atomically, then evict past the size bound."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        """Return (modification time, size, path) of every entry, least recently used first."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for directory, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(ENTRY_SUFFIX):
+                    path = os.path.join(directory, name)
+                    try:
+                        status = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((status.st_mtime, status.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        """Delete every entry."""
+        for _, _, path in self.entries():
+            os.remove(path)
+
+    def stats(self):
+        """Return the hit, miss and eviction counters of this process and the entries and bytes on disk."""
+        entries = self.entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(entry[1] for entry in entries),
+                "max_bytes": self.max_bytes,
+                "offline": self.offline,
+            }
+
+
+Gaia = CachedGaia(
+    cache_dir=os.environ.get("GAIA_CACHE_DIR", DEFAULT_CACHE_DIR),
+    max_bytes=int(os.environ.get("GAIA_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+    offline=os.environ.get("GAIA_CACHE_OFFLINE", "0") == "1",
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the on-disk cache of Gaia query results.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("info", help="Print the entries and size of the cache.")
+    subparsers.add_parser("clear", help="Delete every cache entry.")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        stats = Gaia.stats()
+        print(json.dumps({"cache_dir": Gaia.cache_dir, "entries": stats["entries"], "bytes": stats["bytes"],
+                          "max_bytes": stats["max_bytes"], "oldest": time.ctime(Gaia.entries()[0][0])
+                          if stats["entries"] else None}, indent=2))
+    elif args.command == "clear":
+        Gaia.clear()
+
+
+if __name__ == "__main__":
+    main()
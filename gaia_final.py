@@ -1,71 +1,12 @@
-import numpy as np
 import pandas as pd
 from astropy import units as u
 from astropy.coordinates import SkyCoord
 
 from astroquery.gaia import Gaia
+from coordinate_kernels import celestial_to_cartesian, cartesian_to_celestial
 Gaia.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"  # Data Release 3, default
 
 
-def cartesian_to_celestial(x, y, z):
-    """
-    Convert Cartesian coordinates (x, y, z) to celestial coordinates (RA, Dec).
-    
-    Parameters:
-    - x (float): x coordinate
-    - y (float): y coordinate
-    - z (float): z coordinate
-    
-    Returns:
-    - ra (float): Right Ascension in degrees
-    - dec (float): Declination in degrees
-    """
-    
-    # Calculate the distance from the origin
-    distance = np.sqrt(x**2 + y**2 + z**2)
-    
-    # Calculate Right Ascension (RA)
-    ra_rad = np.arctan2(y, x)  # atan2 handles quadrants correctly
-    
-    # Ensure RA is in the range [0, 2*pi]
-    if ra_rad < 0:
-        ra_rad += 2 * np.pi
-    
-    # Calculate Declination (Dec)
-    dec_rad = np.arcsin(z / distance)
-    
-    # Convert radians to degrees
-    ra_deg = np.degrees(ra_rad)
-    dec_deg = np.degrees(dec_rad)
-    
-    return ra_deg, dec_deg
-
-def celestial_to_cartesian(ra, dec, distance):
-    """
-    Convert celestial coordinates (RA, Dec) to Cartesian coordinates (x, y, z).
-    
-    Parameters:
-    - ra (float): Right Ascension in degrees
-    - dec (float): Declination in degrees
-    - distance (float): Distance from the observer in parsecs
-    
-    Returns:
-    - x (float): x coordinate
-    - y (float): y coordinate
-    - z (float): z coordinate
-    """
-    
-    # Convert RA and Dec from degrees to radians
-    ra_rad = np.radians(ra)
-    dec_rad = np.radians(dec)
-
-    # Calculate Cartesian coordinates
-    x = distance * np.cos(dec_rad) * np.cos(ra_rad)
-    y = distance * np.cos(dec_rad) * np.sin(ra_rad)
-    z = distance * np.sin(dec_rad)
-    
-    return x, y, z
-
 def change_reference(star_ref, exoplanet_ref):
     '''
     takes in current coordinates of star and the new reference centre of exoplanet and returns the new reference coordinates
@@ -109,10 +50,8 @@ df = results.to_pandas()
 df["distance"] = 1000 / df["parallax"]
 
 # Convert celestial coordinates to Cartesian coordinates and add to DataFrame
-df[['x', 'y', 'z']] = df.apply(
-    lambda row: celestial_to_cartesian(row['ra'], row['dec'], row['distance']),
-    axis=1,
-    result_type='expand'
+df['x'], df['y'], df['z'] = celestial_to_cartesian(
+    df['ra'].to_numpy(), df['dec'].to_numpy(), df['distance'].to_numpy()
 )
 
 # Calculate the Cartesian coordinates of the first entry
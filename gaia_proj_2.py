@@ -1,29 +1,9 @@
-import numpy as np
 import pandas as pd
 from astroquery.gaia import Gaia
+from coordinate_kernels import celestial_to_cartesian, planar_projection as project_onto_plane
 
 Gaia.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"  # Data Release 3, default
 
-def cartesian_to_celestial(x, y, z):
-    """Convert Cartesian coordinates (x, y, z) to celestial coordinates (RA, Dec)."""
-    distance = np.sqrt(x**2 + y**2 + z**2)
-    ra_rad = np.arctan2(y, x)  # atan2 handles quadrants correctly
-    if ra_rad < 0:
-        ra_rad += 2 * np.pi
-    dec_rad = np.arcsin(z / distance)
-    ra_deg = np.degrees(ra_rad)
-    dec_deg = np.degrees(dec_rad)
-    return ra_deg, dec_deg
-
-def celestial_to_cartesian(ra, dec, distance):
-    """Convert celestial coordinates (RA, Dec) to Cartesian coordinates (x, y, z)."""
-    ra_rad = np.radians(ra)
-    dec_rad = np.radians(dec)
-    x = distance * np.cos(dec_rad) * np.cos(ra_rad)
-    y = distance * np.cos(dec_rad) * np.sin(ra_rad)
-    z = distance * np.sin(dec_rad)
-    return x, y, z
-
 def planar_projection(df):
     """
     Create a planar projection of celestial points onto the plane z = R.
@@ -37,12 +17,9 @@ def planar_projection(df):
     # Maximum distance from the reference point (the first entry)
     R = df['distance'].max()
     
-    # Create new DataFrame for projected points using original coordinates
-    df_projection = pd.DataFrame()
-    
-    # Perform projection for each point
-    df_projection['x_projected'] = df['x'] * (R / df['z'])
-    df_projection['y_projected'] = df['y'] * (R / df['z'])
+    # Project all points at once, keeping the index of the original DataFrame
+    x_projected, y_projected = project_onto_plane(df['x'].to_numpy(), df['y'].to_numpy(), df['z'].to_numpy(), R)
+    df_projection = pd.DataFrame({'x_projected': x_projected, 'y_projected': y_projected}, index=df.index)
     
     return df_projection
 
@@ -73,10 +50,8 @@ df = results.to_pandas()
 df["distance"] = 1000 / df["parallax"]
 
 # Convert celestial coordinates to Cartesian coordinates and add to DataFrame
-df[['x', 'y', 'z']] = df.apply(
-    lambda row: celestial_to_cartesian(row['ra'], row['dec'], row['distance']),
-    axis=1,
-    result_type='expand'
+df['x'], df['y'], df['z'] = celestial_to_cartesian(
+    df['ra'].to_numpy(), df['dec'].to_numpy(), df['distance'].to_numpy()
 )
 
 # Call the planar_projection function
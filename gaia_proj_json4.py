@@ -1,6 +1,6 @@
-import numpy as np
 import pandas as pd
-from astroquery.gaia import Gaia
+from gaia_cache import Gaia
+from coordinate_kernels import celestial_to_cartesian, planar_projection as project_onto_plane, normalize_projection
 import json
 import logging
 
@@ -9,26 +9,6 @@ logging.getLogger('astroquery').setLevel(logging.WARNING)
 
 Gaia.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"  # Data Release 3, default
 
-def cartesian_to_celestial(x, y, z):
-    """Convert Cartesian coordinates (x, y, z) to celestial coordinates (RA, Dec)."""
-    distance = np.sqrt(x**2 + y**2 + z**2)
-    ra_rad = np.arctan2(y, x)  # atan2 handles quadrants correctly
-    if ra_rad < 0:
-        ra_rad += 2 * np.pi
-    dec_rad = np.arcsin(z / distance)
-    ra_deg = np.degrees(ra_rad)
-    dec_deg = np.degrees(dec_rad)
-    return ra_deg, dec_deg
-
-def celestial_to_cartesian(ra, dec, distance):
-    """Convert celestial coordinates (RA, Dec) to Cartesian coordinates (x, y, z)."""
-    ra_rad = np.radians(ra)
-    dec_rad = np.radians(dec)
-    x = distance * np.cos(dec_rad) * np.cos(ra_rad)
-    y = distance * np.cos(dec_rad) * np.sin(ra_rad)
-    z = distance * np.sin(dec_rad)
-    return x, y, z
-
 def planar_projection(df):
     """
     Create a planar projection of celestial points onto the plane z = R.
@@ -42,12 +22,9 @@ def planar_projection(df):
     # Maximum distance from the reference point (the first entry)
     R = df['distance'].max()
     
-    # Create new DataFrame for projected points using original coordinates
-    df_projection = pd.DataFrame()
-    
-    # Perform projection for each point
-    df_projection['x_projected'] = df['x'] * (R / df['z'])
-    df_projection['y_projected'] = df['y'] * (R / df['z'])
+    # Project all points at once, keeping the index of the original DataFrame
+    x_projected, y_projected = project_onto_plane(df['x'].to_numpy(), df['y'].to_numpy(), df['z'].to_numpy(), R)
+    df_projection = pd.DataFrame({'x_projected': x_projected, 'y_projected': y_projected}, index=df.index)
     
     return df_projection
 
@@ -79,10 +56,8 @@ df = results.to_pandas()
 df["distance"] = 1000 / df["parallax"]
 
 # Convert celestial coordinates to Cartesian coordinates
-df[['x', 'y', 'z']] = df.apply(
-    lambda row: celestial_to_cartesian(row['ra'], row['dec'], row['distance']),
-    axis=1,
-    result_type='expand'
+df['x'], df['y'], df['z'] = celestial_to_cartesian(
+    df['ra'].to_numpy(), df['dec'].to_numpy(), df['distance'].to_numpy()
 )
 
 # Filter to keep only rows with positive z values (visible hemisphere)
@@ -94,22 +69,14 @@ df_projection = planar_projection(df)
 # Drop NaN values if any
 df_projection = df_projection.dropna()
 
-# Create a DataFrame for x, y, and their modulus
+# Create a DataFrame for x and y
 projected_values = df_projection[['x_projected', 'y_projected']].copy()
 
-# Calculate the modulus for each projected point
-projected_values['modulus'] = np.sqrt(
-    projected_values['x_projected']**2 + 
-    projected_values['y_projected']**2
+# Normalize x and y so that the mean modulus of the projected points is 200
+projected_values['x_normalized'], projected_values['y_normalized'], normalization_value = normalize_projection(
+    projected_values['x_projected'].to_numpy(), projected_values['y_projected'].to_numpy()
 )
 
-# Find the normalization value (mean of modulus)
-normalization_value = projected_values['modulus'].mean()
-
-# Normalize x and y by dividing them by normalization_value and multiplying by 200
-projected_values['x_normalized'] = projected_values['x_projected'] / normalization_value * 200
-projected_values['y_normalized'] = projected_values['y_projected'] / normalization_value * 200
-
 # Normalize phot_g_mean_mag from 0 to 1
 # Assuming 'phot_g_mean_mag' is part of df and aligns with df_projection
 min_mag = df['phot_g_mean_mag'].min()
@@ -1,11 +1,53 @@
 import numpy as np
-import pandas as pd
-from astroquery.gaia import Gaia
+import contextlib
+import json
 import logging
-from fastapi import FastAPI
+import os
+import threading
+import time
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from adql import gaia_query, log_transfer
+from catalog_store import load_catalog
+from catalog_versions import CatalogPointer
+from exoplanets import load_exoplanet_table
+from metrics import CONTENT_TYPE, ROW_BUCKETS, SIZE_BUCKETS, MetricsRegistry, StageClock
+from compute_executor import BoundedExecutor, ExecutorSaturated, ComputeTimeout
+from singleflight import SingleFlight
+from response_cache import ResponseCache
+from sky_archive import load_sky_archive
+from sky_tiles import SkyTiles, load_sky_tiles
+from sky_session import SessionStore, SkySession, StarPool, index_pool
+from star_block import StarBlock, project_block, project_block_horizon
+from star_format import MEDIA_TYPE, negotiate, to_json_dict, encode_binary
+from sky_batch import DEFAULT_PLANET_DISTANCE, select_brightest_batch, skies_from_selections
+from sky_stream import DEFAULT_BATCH_SIZE, catalog_batch_loader, frame_batch_loader, sky_constants, sky_batches
+from catalog_scan import DEFAULT_CHUNK_ROWS, scan_brightest
+from magnitude_selection import MagnitudeBoundIndex, load_magnitude_index, absolute_magnitude, apparent_magnitude, brightest
+from coordinate_kernels import (
+    celestial_to_cartesian,
+    space_velocity,
+    propagate_positions,
+    planar_projection as project_onto_plane,
+    normalize_projection,
+    normalized_brightness,
+)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # Open the catalog in the background, so the process answers (/ready with 503) while it loads
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    # Newly published catalog versions are picked up off the event loop
+    if CATALOG_DIR:
+        catalog_refresh_stop.clear()
+        threading.Thread(target=refresh_catalog, name="catalog-refresh", daemon=True).start()
+    yield
+    catalog_refresh_stop.set()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -19,16 +61,121 @@ app.add_middleware(
 # Suppress INFO log messages from astroquery
 logging.getLogger('astroquery').setLevel(logging.WARNING)
 
-Gaia.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"  # Data Release 3, default
+# Directory of a local catalog store (see catalog_store.py). When set, stars are
+# served from it and the Gaia archive is never contacted.
+CATALOG_DIR = os.environ.get("GAIA_CATALOG_DIR")
+
+# How stars are selected from the catalog store: "index" opens the blocks of the magnitude index that can
+# hold a top star, "scan" streams the whole store in chunks (see catalog_scan.py) and needs no index, for
+# catalogs too large to build one
+SELECTION_MODE = os.environ.get("STAR_SELECTION", "index")
+SCAN_CHUNK_ROWS = int(os.environ.get("STAR_SCAN_CHUNK_ROWS", DEFAULT_CHUNK_ROWS))
+SCAN_WORKERS = int(os.environ.get("STAR_SCAN_WORKERS", 1))
+
+# Gaia query of live mode: the served random_index slice, with the visibility filter done by the archive
+LIVE_QUERY = gaia_query(random_index=(50000, 70000), positive_parallax=True)
+
+# Set by warm_up once the catalog store and its indexes are open
+readiness = {"ready": False, "error": None, "seconds": None}
+
+# Catalog store, its brightness selection index and its sky tiles, opened on first use. GAIA_CATALOG_DIR may
+# also be a catalog root of published versions (see catalog_versions.py), whose pointer is re-read every
+# STAR_CATALOG_CHECK_SECONDS so that a new version is picked up without a restart.
+catalog_pointer = CatalogPointer(CATALOG_DIR, float(os.environ.get("STAR_CATALOG_CHECK_SECONDS", 1.0))) \
+    if CATALOG_DIR else None
+catalog_refresh_stop = threading.Event()
+_catalog = None
+_magnitude_index = None
+_sky_tiles = None
+
+# Exoplanet table CSV from the NASA Exoplanet Archive (see exoplanets.py), loaded at startup.
+# /star_positions/{planet_name} looks planets up in it and places them at their real distance.
+EXOPLANET_TABLE_PATH = os.environ.get("STAR_EXOPLANET_TABLE")
+_exoplanets = None
+
+# Sky archive written by bake_skies.py. Baked planets are served from it without any computation.
+ARCHIVE_PATH = os.environ.get("STAR_ARCHIVE_PATH")
+_sky_archive = None
+
+# Cache of computed skies, keyed on the planet coordinates quantized to STAR_CACHE_TOLERANCE_DEG.
+# STAR_CACHE_DIR adds an on-disk tier that survives restarts.
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("STAR_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("STAR_CACHE_TTL", 3600)),
+    tolerance=float(os.environ.get("STAR_CACHE_TOLERANCE_DEG", 1e-4)),
+    disk_dir=os.environ.get("STAR_CACHE_DIR"),
+)
+
+# Threads running catalog I/O and projections off the event loop. Requests beyond the
+# workers plus STAR_COMPUTE_QUEUE waiting ones get a 503, slower than STAR_COMPUTE_TIMEOUT a 504.
+compute_executor = BoundedExecutor(
+    max_workers=int(os.environ.get("STAR_COMPUTE_WORKERS", 4)),
+    max_queue=int(os.environ.get("STAR_COMPUTE_QUEUE", 32)),
+    timeout=float(os.environ.get("STAR_COMPUTE_TIMEOUT", 30)),
+)
+
+# Concurrent requests for the same sky share one computation
+sky_flights = SingleFlight()
+
+# Fly-through sessions of /star_sessions/, kept in this process until idle for STAR_SESSION_TTL seconds
+star_sessions = SessionStore(
+    max_sessions=int(os.environ.get("STAR_MAX_SESSIONS", 1000)),
+    ttl=float(os.environ.get("STAR_SESSION_TTL", 600)),
+)
+
+# Frames a sky can be projected in: "sun" projects every star through the ICRS z axis, as the API always has;
+# "horizon" rotates the stars into the planet's horizon frame and keeps those above it (see horizon_projection)
+FRAMES = ("sun", "horizon")
+
+# Most epochs one /star_positions/epochs request may ask for
+MAX_EPOCHS = int(os.environ.get("STAR_MAX_EPOCHS", 1000))
 
-def celestial_to_cartesian(ra, dec, distance):
-    """Convert celestial coordinates (RA, Dec) to Cartesian coordinates (x, y, z)."""
-    ra_rad = np.radians(ra)
-    dec_rad = np.radians(dec)
-    x = distance * np.cos(dec_rad) * np.cos(ra_rad)
-    y = distance * np.cos(dec_rad) * np.sin(ra_rad)
-    z = distance * np.sin(dec_rad)
-    return x, y, z
+# Per-stage timings, row counts and payload sizes, served on /metrics. STAR_METRICS=0 stops recording them.
+metrics_registry = MetricsRegistry(enabled=os.environ.get("STAR_METRICS", "1") != "0")
+request_seconds = metrics_registry.histogram(
+    "star_api_request_seconds", "Latency of star API requests, queueing included.", ["endpoint"]
+)
+stage_seconds = metrics_registry.histogram(
+    "star_api_stage_seconds", "Time spent in each stage of finding, computing and encoding a sky.", ["stage"]
+)
+star_rows = metrics_registry.histogram(
+    "star_api_rows", "Star rows fetched from Gaia or the catalog store, and returned per sky.", ["source"],
+    buckets=ROW_BUCKETS,
+)
+payload_bytes = metrics_registry.histogram(
+    "star_api_payload_bytes", "Size of /star_positions/ response bodies.", ["encoding"], buckets=SIZE_BUCKETS
+)
+sky_lookups = metrics_registry.counter(
+    "star_api_sky_lookups_total", "Skies served from the archive or the cache, and skies computed.", ["source"]
+)
+
+def component_stats():
+    """Report the counters of the cache, the compute executor and the single-flight group on /metrics."""
+    cache, executor, flights = response_cache.stats(), compute_executor.stats(), sky_flights.stats()
+    sessions = star_sessions.stats()
+    return [
+        ("star_cache_entries", "gauge", "Skies held in the in-memory cache.", cache["entries"]),
+        ("star_cache_hits_total", "counter", "In-memory cache hits.", cache["hits"]),
+        ("star_cache_disk_hits_total", "counter", "Disk cache hits.", cache["disk_hits"]),
+        ("star_cache_misses_total", "counter", "Cache misses.", cache["misses"]),
+        ("star_cache_evictions_total", "counter", "Cache evictions.", cache["evictions"]),
+        ("star_cache_hit_ratio", "gauge", "Share of cache lookups that hit.", cache["hit_ratio"]),
+        ("star_executor_running", "gauge", "Jobs running on the compute executor.", executor["running"]),
+        ("star_executor_queued", "gauge", "Jobs waiting for a compute thread.", executor["queued"]),
+        ("star_executor_rejected_total", "counter", "Jobs refused with a 503.", executor["rejected"]),
+        ("star_executor_timeouts_total", "counter", "Jobs that missed their deadline.", executor["timeouts"]),
+        ("star_executor_utilisation", "gauge", "Busy share of the compute threads.", executor["utilisation"]),
+        ("star_executor_mean_wait_seconds", "gauge", "Mean time a job waited for a thread.",
+         executor["mean_wait_seconds"]),
+        ("star_singleflight_computations_total", "counter", "Sky computations started.", flights["computations"]),
+        ("star_singleflight_deduplicated_total", "counter", "Requests that joined a computation in flight.",
+         flights["deduplicated"]),
+        ("star_sessions", "gauge", "Live fly-through sessions.", sessions["sessions"]),
+        ("star_session_frames", "gauge", "Frames computed by the live sessions.", sessions["frames"]),
+        ("star_session_rebuilds", "gauge", "Candidate pool rebuilds of the live sessions.", sessions["rebuilds"]),
+    ]
+
+metrics_registry.add_collector(component_stats)
 
 def planar_projection(df):
     """
@@ -43,16 +190,16 @@ def planar_projection(df):
     # Maximum distance from the reference point (the first entry)
     R = df['distance'].max()
     
-    # Create new DataFrame for projected points using original coordinates
-    df_projection = pd.DataFrame()
-    
-    # Perform projection for each point
-    df_projection['x_projected'] = df['x'] * (R / df['z'])
-    df_projection['y_projected'] = df['y'] * (R / df['z'])
+    # Project all points at once, keeping the index of the original DataFrame
+    x_projected, y_projected = project_onto_plane(df['x'].to_numpy(), df['y'].to_numpy(), df['z'].to_numpy(), R)
+    # Imported here so that serving from the catalog store never loads pandas
+    import pandas as pd
+    df_projection = pd.DataFrame({'x_projected': x_projected, 'y_projected': y_projected}, index=df.index)
     
     return df_projection
 
-def recalculate_star_positions(planet_ra, planet_dec, star_catalog_df):
+def recalculate_star_positions(planet_ra, planet_dec, star_catalog_df, planet_distance=DEFAULT_PLANET_DISTANCE,
+                               magnitude_column='phot_g_mean_mag'):
     """
     Adjust star positions relative to the exoplanet's coordinates and recalculate brightness.
     
@@ -60,107 +207,984 @@ def recalculate_star_positions(planet_ra, planet_dec, star_catalog_df):
     - planet_ra (float): Exoplanet's right ascension in degrees.
     - planet_dec (float): Exoplanet's declination in degrees.
     - star_catalog_df (pd.DataFrame): DataFrame of star catalog with RA, Dec, and magnitude.
+    - planet_distance (float): Exoplanet's distance in parsecs. Defaults to a point at infinity.
+    - magnitude_column (str): Column with the magnitudes brightness is computed from.
     
     Returns:
     - pd.DataFrame: DataFrame with recalculated x, y positions and brightness.
     """
-    # Assume the exoplanet is at infinite distance (i.e., it's the reference point)
-    exo_x, exo_y, exo_z = celestial_to_cartesian(planet_ra, planet_dec, 1e12)
+    clock = StageClock(stage_seconds)
 
-    # Convert stars' celestial coordinates to Cartesian
-    star_catalog_df[['x', 'y', 'z']] = star_catalog_df.apply(
-        lambda row: celestial_to_cartesian(row['ra'], row['dec'], row['distance']),
-        axis=1,
-        result_type='expand'
-    )
+    # Without a known distance, assume the exoplanet is at infinite distance (i.e., it's the reference point)
+    exo_x, exo_y, exo_z = celestial_to_cartesian(planet_ra, planet_dec, planet_distance)
+
+    # Convert stars' celestial coordinates to Cartesian, unless the catalog store precomputed them
+    if not {'x', 'y', 'z'}.issubset(star_catalog_df.columns):
+        star_catalog_df['x'], star_catalog_df['y'], star_catalog_df['z'] = celestial_to_cartesian(
+            star_catalog_df['ra'].to_numpy(), star_catalog_df['dec'].to_numpy(), star_catalog_df['distance'].to_numpy()
+        )
 
     # Shift stars' positions to be relative to the exoplanet
     star_catalog_df['x_relative'] = star_catalog_df['x'] - exo_x
     star_catalog_df['y_relative'] = star_catalog_df['y'] - exo_y
     star_catalog_df['z_relative'] = star_catalog_df['z'] - exo_z
+    clock.lap("coordinates")
 
     # Project the stars onto the z = R plane
     df_projection = planar_projection(star_catalog_df)
+    clock.lap("projection")
     
-    # Calculate the modulus (distance in the x-y plane) for each projected point
-    df_projection['modulus'] = np.sqrt(
-        df_projection['x_projected']**2 + 
-        df_projection['y_projected']**2
+    # Normalize the x and y coordinates by the mean modulus of the projected points
+    df_projection['x_normalized'], df_projection['y_normalized'], normalization_value = normalize_projection(
+        df_projection['x_projected'].to_numpy(), df_projection['y_projected'].to_numpy()
     )
-
-    # Find normalization value for scaling
-    normalization_value = df_projection['modulus'].mean()
-
-    # Normalize the x and y coordinates
-    df_projection['x_normalized'] = df_projection['x_projected'] / normalization_value * 200
-    df_projection['y_normalized'] = df_projection['y_projected'] / normalization_value * 200
+    clock.lap("normalization")
 
     # Select reference star (e.g., the first in the DataFrame) for brightness calculation
-    reference_magnitude = star_catalog_df.iloc[0]['phot_g_mean_mag']
+    reference_magnitude = star_catalog_df.iloc[0][magnitude_column]
     
-    # Calculate relative brightness
-    star_catalog_df['relative_brightness'] = 10**(0.4 * (reference_magnitude - star_catalog_df['phot_g_mean_mag']))
-
-    # Normalize brightness between 0 and 1
-    min_brightness = star_catalog_df['relative_brightness'].min()
-    max_brightness = star_catalog_df['relative_brightness'].max()
-    star_catalog_df['relative_brightness_normalized'] = (
-        (star_catalog_df['relative_brightness'] - min_brightness) / (max_brightness - min_brightness)
+    # Calculate relative brightness, normalized between 0 and 1
+    star_catalog_df['relative_brightness_normalized'] = normalized_brightness(
+        star_catalog_df[magnitude_column].to_numpy(), reference_magnitude
     )
-    print(star_catalog_df.columns)
+
     # Merge brightness back with projected positions
     df_projection['relative_brightness'] = star_catalog_df['relative_brightness_normalized'].values
     df_projection['source_id'] = star_catalog_df['SOURCE_ID'].values  # Add the star's ID
+    clock.lap("brightness")
     
     return df_projection
 
-@app.get("/star_positions/")
-async def get_stars(planet_ra: float, planet_dec: float, limit: int = 10):
+def get_catalog():
     """
-    Retrieve star positions and brightness relative to a given exoplanet's position.
+    Return the live local catalog store, opening it on first use. refresh_catalog opens newly published versions.
+    
+    A request that uses several catalog structures gets the catalog once and passes it on, so that it
+    finishes on the version it started with even if the live version changes meanwhile.
+    """
+    global _catalog
+    if _catalog is None:
+        _catalog = load_catalog(catalog_pointer.resolve())
+    return _catalog
+
+def refresh_catalog():
+    """
+    Re-read the catalog pointer every check interval and switch to a newly published version; runs on its own
+    thread, so that neither the pointer read nor the opening of a version happens on the event loop.
+    """
+    global _catalog
+    while not catalog_refresh_stop.wait(catalog_pointer.check_interval):
+        try:
+            path = catalog_pointer.resolve()
+            if _catalog is not None and _catalog.path != path:
+                catalog = load_catalog(path)
+                # Map the new version's index before requests select from it
+                get_magnitude_index(catalog)
+                _catalog = catalog
+                logging.getLogger(__name__).info("Serving catalog version %s", catalog.version)
+        except Exception:
+            logging.getLogger(__name__).exception("Could not switch to the catalog in %s", CATALOG_DIR)
+
+def catalog_version():
+    """Return the version of the catalog stars are served from, used to invalidate cached skies."""
+    return get_catalog().version if CATALOG_DIR else "live"
+
+async def served_catalog_version():
+    """catalog_version() for the request handlers: the catalog is opened on the compute executor if it is not yet."""
+    if CATALOG_DIR and _catalog is None:
+        await run_blocking(get_catalog)
+    return catalog_version()
+
+def cache_sky(cache_key, star_arrays, version=None):
+    """
+    Put a computed sky in the response cache, unless it was computed from another catalog version than its key's.
+    
+    A handler builds the key from the version it saw; a sky computed after a switch would otherwise be cached
+    under the previous version.
     
     Parameters:
-    - planet_ra (float): Exoplanet's right ascension in degrees.
-    - planet_dec (float): Exoplanet's declination in degrees.
+    - cache_key (tuple): The request's response cache key, which starts with the catalog version.
+    - star_arrays (tuple): The computed sky.
+    - version (str): Version of the catalog the sky was computed from, the live one by default.
+    """
+    if cache_key[0] == (version if version is not None else catalog_version()):
+        response_cache.put(cache_key, star_arrays)
+
+def get_magnitude_index(catalog=None):
+    """Return the brightness selection index of a catalog store (the live one by default), building it in memory
+    if it was not saved."""
+    global _magnitude_index
+    catalog = catalog if catalog is not None else get_catalog()
+    index = _magnitude_index
+    if index is None or index.catalog_version != catalog.version:
+        index = load_magnitude_index(catalog)
+        if index is None:
+            logging.getLogger(__name__).warning("No magnitude index saved in %s, building one in memory", catalog.path)
+            index = MagnitudeBoundIndex.build(catalog)
+        # Only the live version's index is kept; requests still on an old version map theirs again
+        if catalog is _catalog:
+            _magnitude_index = index
+    return index
+
+def select_from_store(planet_position, limit, catalog=None):
+    """
+    Find the stars of the catalog store that look brightest from a planet, with the configured selection mode.
+    
+    Parameters:
+    - planet_position (tuple): Cartesian position (x, y, z) of the exoplanet in parsecs.
+    - limit (int): The maximum number of stars to select.
+    - catalog (Catalog): Store the returned rows refer to, the live one by default.
+    
+    Returns:
+    - np.ndarray: Catalog rows of the selected stars, brightest first.
+    - np.ndarray: Their apparent magnitudes from the exoplanet.
+    """
+    catalog = catalog if catalog is not None else get_catalog()
+    if SELECTION_MODE == "scan":
+        return scan_brightest(catalog, planet_position, limit, chunk_rows=SCAN_CHUNK_ROWS, workers=SCAN_WORKERS)
+    return get_magnitude_index(catalog).select_brightest(planet_position, limit)
+
+def get_sky_tiles(catalog=None):
+    """Return the level-of-detail sky tiles of a catalog store (the live one by default), building them in memory
+    if they were not saved."""
+    global _sky_tiles
+    catalog = catalog if catalog is not None else get_catalog()
+    tiles = _sky_tiles
+    if tiles is None or tiles.catalog_version != catalog.version:
+        tiles = load_sky_tiles(catalog)
+        if tiles is None:
+            logging.getLogger(__name__).warning("No sky tiles saved in %s, building them in memory", catalog.path)
+            tiles = SkyTiles.build(catalog)
+        # Only the live version's tiles are kept, as for the magnitude index
+        if catalog is _catalog:
+            _sky_tiles = tiles
+    return tiles
+
+def warm_up():
+    """
+    Open what the first request would otherwise open, and mark the process ready for /ready.
+    
+    The catalog columns and the saved indexes are memory-mapped, not read, so this takes milliseconds
+    unless the magnitude index has to be built in memory.
+    """
+    start = time.perf_counter()
+    try:
+        if CATALOG_DIR:
+            catalog = get_catalog()
+            for name in ("source_id", "x", "y", "z", "distance", "ra", "dec", "pmra", "pmdec", "phot_g_mean_mag"):
+                catalog[name]
+            # One small selection loads the index and pages in its top-level arrays
+            select_from_store(celestial_to_cartesian(0.0, 0.0, DEFAULT_PLANET_DISTANCE), 1)
+            get_sky_archive()
+        # The exoplanet table is small and read whole
+        get_exoplanets()
+        readiness.update(ready=True, seconds=time.perf_counter() - start)
+    except Exception as error:
+        logging.getLogger(__name__).exception("Warm-up failed")
+        readiness.update(error=repr(error), seconds=time.perf_counter() - start)
+
+def get_exoplanets():
+    """Return the exoplanet table, or None when none is configured."""
+    global _exoplanets
+    if EXOPLANET_TABLE_PATH and _exoplanets is None:
+        _exoplanets = load_exoplanet_table(EXOPLANET_TABLE_PATH)
+    return _exoplanets
+
+def get_sky_archive():
+    """Return the sky archive, or None when none is configured or it was baked from another catalog."""
+    global _sky_archive
+    if not ARCHIVE_PATH:
+        return None
+    if _sky_archive is None:
+        _sky_archive = load_sky_archive(ARCHIVE_PATH)
+        if _sky_archive.catalog_version != catalog_version():
+            logging.getLogger(__name__).warning("Sky archive %s was baked from catalog %s, not %s; ignoring it",
+                                                ARCHIVE_PATH, _sky_archive.catalog_version, catalog_version())
+    if _sky_archive.catalog_version != catalog_version():
+        return None
+    return _sky_archive
+
+def lookup_sky(planet_ra, planet_dec, limit, planet_distance, cache_key, epoch=None, frame="sun"):
+    """
+    Find an already computed sky, in the sky archive first and then in the cache.
+    
+    Parameters:
+    - planet_ra, planet_dec (float): Exoplanet's coordinates in degrees.
     - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    - cache_key (tuple): The request's response cache key.
+    - epoch (float): Epoch the stars are moved to, None for the catalog epoch the archive was baked at.
+    - frame (str): Projection frame, one of FRAMES; the archive holds "sun" skies only.
     
     Returns:
-    - dict: A dictionary where keys are source_ids and values are lists [x_normalized, y_normalized, relative_brightness].
+    - tuple: The compute_star_arrays result, or None if it has to be computed.
     """
+    archive = get_sky_archive() if epoch is None and frame == "sun" else None
+    if archive is not None:
+        star_arrays = archive.lookup(planet_ra, planet_dec, limit, planet_distance)
+        if star_arrays is not None:
+            sky_lookups.labels("archive").inc()
+            return star_arrays
+    star_arrays = response_cache.get(cache_key)
+    sky_lookups.labels("cache" if star_arrays is not None else "computed").inc()
+    return star_arrays
 
-    # Set Pandas to display all rows and columns
-    pd.set_option('display.max_rows', None)
-    pd.set_option('display.max_columns', None)
+def select_brightest_stars(df, planet_position, limit):
+    """
+    Keep the stars of a DataFrame that look brightest from the exoplanet.
+    
+    Parameters:
+    - df (pd.DataFrame): Visible stars with ra, dec, distance and phot_g_mean_mag.
+    - planet_position (tuple): Cartesian position (x, y, z) of the exoplanet in parsecs.
+    - limit (int): The maximum number of stars to keep.
+    
+    Returns:
+    - pd.DataFrame: The selected rows, brightest first, with x, y, z and 'apparent_mag' added.
+    """
+    clock = StageClock(stage_seconds)
+    df['x'], df['y'], df['z'] = celestial_to_cartesian(
+        df['ra'].to_numpy(), df['dec'].to_numpy(), df['distance'].to_numpy()
+    )
+
+    # Apparent magnitude from the exoplanet through the distance modulus
+    abs_mag = absolute_magnitude(df['phot_g_mean_mag'].to_numpy(), df['distance'].to_numpy())
+    magnitudes = apparent_magnitude(abs_mag, df[['x', 'y', 'z']].to_numpy(), planet_position)
 
-    # Define additional columns to select from Gaia, including source_id for star identification
-    columns_to_select = ["source_id", "ra", "dec", "phot_g_mean_mag", "parallax", "pmra", "pmdec"]
-    columns_string = ", ".join(columns_to_select)
+    top = brightest(magnitudes, limit)
+    log_transfer(LIVE_QUERY, len(df), len(top))
+    df = df.iloc[top].copy()
+    df['apparent_mag'] = magnitudes[top]
+    clock.lap("selection")
+    return df
 
-    # Query Gaia database
-    query = f"""
-    SELECT {columns_string} FROM gaiadr3.gaia_source
-    WHERE has_xp_sampled = 'True'
-    AND random_index BETWEEN 50000 AND 70000
-    """  
+def propagate_stars(block, planet_position, epochs):
+    """
+    Move selected stars to other epochs along their proper motion.
+    
+    Parameters:
+    - block (StarBlock): The stars at the Gaia epoch; ra, dec, pmra, pmdec and phot_g_mean_mag are read from it.
+    - planet_position (tuple): Cartesian position (x, y, z) of the exoplanet in parsecs.
+    - epochs (list): Julian years to move the stars to.
+    
+    Returns:
+    - tuple: x, y, z arrays of shape (epochs, stars), and the apparent magnitudes from the exoplanet at every epoch.
+    """
+    clock = StageClock(stage_seconds)
+
+    # The trigonometry is done once per star; every epoch is then a multiply-add
+    velocity = space_velocity(
+        block.column('ra'), block.column('dec'), block.distance, block.column('pmra'), block.column('pmdec'),
+    )
+    x, y, z = propagate_positions(block.x, block.y, block.z, *velocity, epochs)
+
+    # Stars coming closer to the exoplanet look brighter
+    abs_mag = absolute_magnitude(block.column('phot_g_mean_mag'), block.distance)
+    magnitudes = apparent_magnitude(abs_mag, np.stack((x, y, z), axis=-1), planet_position)
+    clock.lap("propagation")
+    return (x, y, z), magnitudes
+
+def query_gaia_stars():
+    """
+    Query the Gaia archive for the visible stars of the served slice.
+    
+    Returns:
+    - pd.DataFrame: Star rows with the distance in parsecs.
+    """
+    # Imported here so that serving from a local store never loads astroquery
+    from astroquery.gaia import Gaia
+    Gaia.MAIN_GAIA_TABLE = "gaiadr3.gaia_source"  # Data Release 3, default
 
     # Launch the async job
-    job = Gaia.launch_job_async(query)
+    clock = StageClock(stage_seconds)
+    job = Gaia.launch_job_async(LIVE_QUERY)
     results = job.get_results()
+    clock.lap("gaia_query")
 
     # Convert results to a Pandas DataFrame
     df = results.to_pandas()
+    clock.lap("to_pandas")
+    star_rows.labels("gaia").observe(len(df))
 
-    # Calculate distance from parallax (in parsecs)
+    # Calculate distance from parallax (in parsecs); the query only returns visible stars (parallax > 0)
     df["distance"] = 1000 / df["parallax"]
+    return df
+
+async def run_blocking(function, *args):
+    """
+    Run blocking work on the compute executor, turning its refusals into HTTP errors.
+    
+    Parameters:
+    - function (callable): Blocking function to run.
+    - args: Its arguments.
+    
+    Returns:
+    - The function's result.
+    """
+    try:
+        return await compute_executor.run(function, *args)
+    except ExecutorSaturated as error:
+        raise HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+    except ComputeTimeout as error:
+        raise HTTPException(status_code=504, detail=str(error))
+
+@app.get("/star_positions/")
+async def get_stars(planet_ra: float, planet_dec: float, limit: int = 10, planet_distance: Optional[float] = None,
+                    epoch: Optional[float] = None, frame: str = "sun", accept: Optional[str] = Header(None)):
+    """
+    Retrieve star positions and brightness relative to a given exoplanet's position.
+    
+    Parameters:
+    - planet_ra (float): Exoplanet's right ascension in degrees.
+    - planet_dec (float): Exoplanet's declination in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs. Unknown distances are treated as infinite.
+    - epoch (float): Julian year to move the stars to with their proper motion. Defaults to the Gaia epoch, 2016.0.
+    - frame (str): "sun" (default) projects the stars through the ICRS z axis. "horizon" projects them in the
+      planet's horizon frame and returns only the stars above its horizon; it needs planet_distance.
+    - accept (str): Accept header. "application/x-star-positions" selects the packed binary format of
+      star_format.py, with "; encoding=int16" for the quantized variant.
+    
+    Returns:
+    - dict: A dictionary where keys are source_ids and values are lists [x_normalized, y_normalized, relative_brightness],
+      or the binary payload when it was asked for.
+    """
+    start = time.perf_counter()
+    check_frame(frame, planet_distance)
+
+    # Identical concurrent requests wait for the same computation and share its encoded body
+    epoch_key = () if epoch is None else ("epoch", epoch)
+    frame_key = () if frame == "sun" else ("frame", frame)
+    version = await served_catalog_version()
+    cache_key = response_cache.key(planet_ra, planet_dec, limit, version, planet_distance, *epoch_key, *frame_key)
+    encoding = negotiate(accept)
+    body, media_type = await sky_flights.do((cache_key, encoding), lambda: run_blocking(
+        star_response_body, planet_ra, planet_dec, limit, planet_distance, cache_key, encoding, epoch, frame
+    ))
+    request_seconds.labels("star_positions").observe(time.perf_counter() - start)
+    return Response(body, media_type=media_type, headers={"Vary": "Accept"})
+
+def check_frame(frame, planet_distance):
+    """Reject an unknown frame, and the horizon frame of a planet at unknown distance, which sees no catalog star."""
+    if frame not in FRAMES:
+        raise HTTPException(status_code=422, detail=f"frame must be one of {', '.join(FRAMES)}")
+    if frame == "horizon" and planet_distance is None:
+        raise HTTPException(status_code=422, detail="frame=horizon needs the planet's distance")
+
+def find_or_compute_sky(planet_ra, planet_dec, limit, planet_distance, cache_key, epoch=None, frame="sun"):
+    """
+    Return the baked or cached sky of a planet, computing and caching it on a miss.
+    
+    Parameters:
+    - planet_ra, planet_dec (float): Exoplanet's coordinates in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    - cache_key (tuple): The request's response cache key.
+    - epoch (float): Julian year the stars are moved to, None for the Gaia epoch.
+    - frame (str): Projection frame, one of FRAMES.
+    
+    Returns:
+    - tuple: The compute_star_arrays result.
+    """
+    # Serve baked planets and repeated requests for the same planet without computing
+    clock = StageClock(stage_seconds)
+    star_arrays = lookup_sky(planet_ra, planet_dec, limit, planet_distance, cache_key, epoch, frame)
+    clock.lap("lookup")
+    if star_arrays is None:
+        star_arrays = compute_star_arrays(planet_ra, planet_dec, limit, planet_distance, epoch, frame)
+        cache_sky(cache_key, star_arrays)
+    return star_arrays
+
+def star_response_body(planet_ra, planet_dec, limit, planet_distance, cache_key, encoding, epoch=None, frame="sun"):
+    """
+    Find or compute a sky and encode it as the /star_positions/ response body; runs on the compute executor.
+    
+    Parameters:
+    - planet_ra, planet_dec (float): Exoplanet's coordinates in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    - cache_key (tuple): The request's response cache key.
+    - encoding (str): Binary encoding picked by negotiate, None for JSON.
+    - epoch (float): Julian year the stars are moved to, None for the Gaia epoch.
+    - frame (str): Projection frame, one of FRAMES.
+    
+    Returns:
+    - bytes: The body.
+    - str: Its media type.
+    """
+    star_arrays = find_or_compute_sky(planet_ra, planet_dec, limit, planet_distance, cache_key, epoch, frame)
+    clock = StageClock(stage_seconds)
+
+    # The same URL answers with JSON or binary depending on the Accept header
+    if encoding is not None:
+        body, media_type = encode_binary(*star_arrays, encoding=encoding), MEDIA_TYPE
+    else:
+        # Convert to the required dictionary format: {star_id: [x_normalized, y_normalized, relative_brightness]}
+        body, media_type = JSONResponse(to_json_dict(*star_arrays)).body, "application/json"
+
+    clock.lap("serialization")
+    star_rows.labels("response").observe(len(star_arrays[0]))
+    payload_bytes.labels(encoding or "json").observe(len(body))
+    return body, media_type
+
+def load_sky_block(planet_ra, planet_dec, limit, planet_distance):
+    """
+    Select the stars that look brightest from an exoplanet, from the local store when one is configured.
+    
+    Parameters:
+    - planet_ra, planet_dec (float): Exoplanet's coordinates in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    
+    Returns:
+    - StarBlock: The stars, brightest first, with their apparent magnitude from the exoplanet.
+    - tuple: Its Cartesian position.
+    """
+    # Compute on the cache grid so an entry does not depend on which request filled it
+    planet_ra, planet_dec = response_cache.snap(planet_ra, planet_dec)
+
+    distance = planet_distance if planet_distance is not None else DEFAULT_PLANET_DISTANCE
+    planet_position = celestial_to_cartesian(planet_ra, planet_dec, distance)
+    if not CATALOG_DIR:
+        df = select_brightest_stars(query_gaia_stars(), planet_position, limit)
+        return StarBlock.from_frame(df, magnitude_column='apparent_mag'), planet_position
+
+    # Only the columns the projection reads are gathered, into the thread's scratch buffers
+    clock = StageClock(stage_seconds)
+    catalog = get_catalog()
+    rows, magnitudes = select_from_store(planet_position, limit, catalog)
+    clock.lap("selection")
+    block = StarBlock.from_catalog(catalog, rows, magnitudes)
+    clock.lap("load")
+    star_rows.labels("store").observe(len(block))
+    return block, planet_position
+
+def compute_star_arrays(planet_ra, planet_dec, limit, planet_distance=None, epoch=None, frame="sun"):
+    """
+    Compute the sky seen from an exoplanet as plain arrays, the form cached and serialized by get_stars.
+    
+    Parameters:
+    - planet_ra (float): Exoplanet's right ascension in degrees.
+    - planet_dec (float): Exoplanet's declination in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    - epoch (float): Julian year to move the stars to, None for the Gaia epoch. The stars are selected at the
+      Gaia epoch.
+    - frame (str): "sun" projects the stars through the ICRS z axis; "horizon" keeps and projects the selected
+      stars above the planet's horizon with the fused kernel, so fewer than `limit` may be returned.
+    
+    Returns:
+    - tuple: source_id, x_normalized, y_normalized and relative_brightness arrays, brightest star first.
+    """
+    block, planet_position = load_sky_block(planet_ra, planet_dec, limit, planet_distance)
+
+    # Move the stars along their proper motion before projecting them
+    if epoch is not None:
+        (x, y, z), magnitudes = propagate_stars(block, planet_position, [epoch])
+        block = block.moved(x[0], y[0], z[0], magnitudes[0])
+
+    # Project, normalize and compute the brightness without building DataFrames
+    clock = StageClock(stage_seconds)
+    if frame == "horizon":
+        planet_ra, planet_dec = response_cache.snap(planet_ra, planet_dec)
+        star_arrays = project_block_horizon(block, planet_position, planet_ra, planet_dec)
+    else:
+        star_arrays = project_block(block)
+    clock.lap("projection")
+    return star_arrays
+
+@app.get("/star_positions/epochs")
+async def get_stars_over_epochs(planet_ra: float, planet_dec: float, limit: int = 10,
+                                planet_distance: Optional[float] = None, epochs: Optional[List[float]] = Query(None),
+                                start: Optional[float] = None, stop: Optional[float] = None, count: int = 0):
+    """
+    Retrieve the sky seen from an exoplanet at many epochs in one call, e.g. for animations.
+    
+    Parameters:
+    - planet_ra (float): Exoplanet's right ascension in degrees.
+    - planet_dec (float): Exoplanet's declination in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs. Unknown distances are treated as infinite.
+    - epochs (list): Julian years, as repeated epochs= parameters.
+    - start, stop, count (float, float, int): Alternatively, `count` evenly spaced epochs from `start` to `stop`.
+    
+    Returns:
+    - dict: "epochs", the "source_id" of the stars selected at the Gaia epoch, brightest first, and "x", "y" and
+      "brightness" lists with one row per epoch, each row equal to /star_positions/ with that epoch.
+    """
+    if epochs is None:
+        if start is None or stop is None or count < 1:
+            raise HTTPException(status_code=422, detail="Give epochs, or start, stop and count")
+        epochs = np.linspace(start, stop, count).tolist()
+    if len(epochs) > MAX_EPOCHS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_EPOCHS} epochs per request, got {len(epochs)}")
+    return await run_blocking(epochs_response, planet_ra, planet_dec, limit, planet_distance, epochs)
+
+def epochs_response(planet_ra, planet_dec, limit, planet_distance, epochs):
+    """Build the /star_positions/epochs response; runs on the compute executor."""
+    source_id, x, y, brightness = compute_star_epochs(planet_ra, planet_dec, limit, planet_distance, epochs)
+    clock = StageClock(stage_seconds)
+    response = JSONResponse({
+        "epochs": list(epochs),
+        "source_id": source_id.tolist(),
+        "x": x.tolist(),
+        "y": y.tolist(),
+        "brightness": brightness.tolist(),
+    })
+    clock.lap("serialization")
+    return response
+
+def compute_star_epochs(planet_ra, planet_dec, limit, planet_distance, epochs):
+    """
+    Compute the sky seen from an exoplanet at several epochs, projecting and normalizing all of them at once.
+    
+    Parameters:
+    - planet_ra, planet_dec (float): Exoplanet's coordinates in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    - epochs (list): Julian years.
+    
+    Returns:
+    - tuple: source_id array, and x_normalized, y_normalized and relative_brightness arrays of shape
+      (epochs, stars), each row as compute_star_arrays returns it for that epoch.
+    """
+    block, planet_position = load_sky_block(planet_ra, planet_dec, limit, planet_distance)
+    (x, y, z), magnitudes = propagate_stars(block, planet_position, epochs)
+
+    # Same stages as recalculate_star_positions, one row per epoch
+    clock = StageClock(stage_seconds)
+    R = np.nanmax(block.distance) if len(block) else np.nan
+    x_projected, y_projected = project_onto_plane(x, y, z, R)
+    x_normalized, y_normalized, _ = normalize_projection(x_projected, y_projected)
+    brightness = normalized_brightness(magnitudes, magnitudes[:, 0] if magnitudes.shape[1] else np.nan)
+    clock.lap("epoch_projection")
+    return block.source_id, x_normalized, y_normalized, brightness
+
+@app.get("/star_positions/stream")
+async def stream_stars(planet_ra: float, planet_dec: float, limit: int = 10, planet_distance: Optional[float] = None,
+                       batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Stream star positions and brightness as newline-delimited JSON, brightest stars first.
+    
+    Parameters:
+    - planet_ra (float): Exoplanet's right ascension in degrees.
+    - planet_dec (float): Exoplanet's declination in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs. Unknown distances are treated as infinite.
+    - batch_size (int): Number of stars per line.
+    
+    Returns:
+    - StreamingResponse: A first line {"count", "batch_size", "normalization_value"} (null when the sky
+      comes from the cache), then one line
+      {"batch": i, "stars": {star_id: [x_normalized, y_normalized, relative_brightness]}} per batch,
+      with the same values as /star_positions/.
+    """
+    batch_size = max(1, batch_size)
+    version = await served_catalog_version()
+    cache_key = response_cache.key(planet_ra, planet_dec, limit, version, planet_distance)
+
+    # Selection and the first pass run on the compute executor, shared by identical concurrent streams
+    flight_key = (cache_key, "stream", batch_size)
+    count, normalization_value, make_batches = await sky_flights.do(flight_key, lambda: run_blocking(
+        prepare_star_stream, planet_ra, planet_dec, limit, planet_distance, batch_size, cache_key
+    ))
+    return StreamingResponse(stream_star_lines(count, batch_size, normalization_value, make_batches()),
+                             media_type="application/x-ndjson")
+
+def prepare_star_stream(planet_ra, planet_dec, limit, planet_distance, batch_size, cache_key):
+    """
+    Find the baked or cached sky of a stream, or select its stars and compute the constants of its batches.
+    
+    Streamed skies are not put in the response cache: the batch pipeline sums the mean modulus batch by batch,
+    so its values can differ from compute_star_arrays in the last bits and would change the /star_positions/
+    bodies served under the same key, and holding a whole sky for the cache would defeat the memory bound of
+    streaming. A stream of a sky /star_positions/ already computed is served from the cache.
+    
+    Parameters:
+    - planet_ra, planet_dec (float): Exoplanet's coordinates in degrees.
+    - limit (int): The maximum number of stars to retrieve.
+    - planet_distance (float): Exoplanet's distance in parsecs, None if unknown.
+    - batch_size (int): Number of stars per line.
+    - cache_key (tuple): The request's response cache key.
+    
+    Returns:
+    - int: Number of stars.
+    - float: Mean modulus the coordinates are normalized by, None for a baked or cached sky.
+    - callable: Returns a new generator of the sky's batches, so that streams sharing this result each get theirs.
+    """
+    star_arrays = lookup_sky(planet_ra, planet_dec, limit, planet_distance, cache_key)
+    if star_arrays is not None:
+        # Baked and cached skies are already final, only the batching is left
+        count = len(star_arrays[0])
+        return count, None, lambda: (tuple(array[start:start + batch_size] for array in star_arrays)
+                                     for start in range(0, count, batch_size))
+
+    planet_ra, planet_dec = response_cache.snap(planet_ra, planet_dec)
+
+    # Select the stars that look brightest from the exoplanet, without building their rows yet
+    distance = planet_distance if planet_distance is not None else DEFAULT_PLANET_DISTANCE
+    planet_position = celestial_to_cartesian(planet_ra, planet_dec, distance)
+    if CATALOG_DIR:
+        catalog = get_catalog()
+        rows, magnitudes = select_from_store(planet_position, limit, catalog)
+        load_batch, count = catalog_batch_loader(catalog, rows, magnitudes), len(rows)
+    else:
+        df = select_brightest_stars(query_gaia_stars(), planet_position, limit)
+        load_batch, count = frame_batch_loader(df), len(df)
+
+    constants = sky_constants(load_batch, count, batch_size)
+    return count, float(constants["normalization_value"]), lambda: sky_batches(load_batch, count, batch_size,
+                                                                              constants)
+
+def stream_star_lines(count, batch_size, normalization_value, batches):
+    """Generate the lines of stream_stars; each batch is projected as it is sent."""
+    yield json.dumps({"count": count, "batch_size": batch_size, "normalization_value": normalization_value}) + "\n"
+    for batch_number, batch in enumerate(batches):
+        yield json.dumps({"batch": batch_number, "stars": to_json_dict(*batch)}) + "\n"
+
+# Declared after the fixed /star_positions/ paths, which would otherwise be taken for planet names
+@app.get("/star_positions/{planet_name}")
+async def get_planet_stars(planet_name: str, limit: int = 10, epoch: Optional[float] = None, frame: str = "sun",
+                           accept: Optional[str] = Header(None)):
+    """
+    Retrieve star positions and brightness as seen from an exoplanet of the exoplanet table.
+    
+    Parameters:
+    - planet_name (str): Planet name, matched ignoring case and extra whitespace, or its ID: its data row in the
+      loaded CSV snapshot, which changes with the snapshot (see exoplanets.py).
+    - limit (int): The maximum number of stars to retrieve.
+    - epoch (float): Julian year to move the stars to with their proper motion. Defaults to the Gaia epoch, 2016.0.
+    - frame (str): Projection frame, as for /star_positions/; "horizon" needs a planet with a known distance.
+    - accept (str): Accept header, as for /star_positions/.
+    
+    Returns:
+    - Response: The /star_positions/ response for the planet's host coordinates and distance; planets without a
+      known distance are placed at infinity. The X-Planet header holds the planet's table entry as JSON.
+    """
+    exoplanets = get_exoplanets()
+    if exoplanets is None:
+        raise HTTPException(status_code=404, detail="No exoplanet table is configured (STAR_EXOPLANET_TABLE)")
+    row = exoplanets.row(planet_name)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No planet {planet_name}")
+    planet = exoplanets.planet(row)
+    check_frame(frame, planet["distance"])
+
+    start = time.perf_counter()
+    epoch_key = () if epoch is None else ("epoch", epoch)
+    frame_key = () if frame == "sun" else ("frame", frame)
+    version = await served_catalog_version()
+    cache_key = response_cache.key(planet["ra"], planet["dec"], limit, version, planet["distance"],
+                                   *epoch_key, *frame_key)
+    encoding = negotiate(accept)
+    body, media_type = await sky_flights.do((cache_key, encoding), lambda: run_blocking(
+        star_response_body, planet["ra"], planet["dec"], limit, planet["distance"], cache_key, encoding, epoch, frame
+    ))
+    request_seconds.labels("star_positions_planet").observe(time.perf_counter() - start)
+    return Response(body, media_type=media_type,
+                    headers={"Vary": "Accept", "X-Planet": json.dumps(planet, ensure_ascii=True)})
+
+class PlanetQuery(BaseModel):
+    """One planet of a batch request, with the parameters of /star_positions/."""
+    planet_ra: float
+    planet_dec: float
+    limit: int = 10
+    planet_distance: Optional[float] = None
+    key: Optional[str] = None
+
+class BatchQuery(BaseModel):
+    """Body of a batch request."""
+    planets: List[PlanetQuery]
+
+@app.post("/star_positions/batch")
+async def get_stars_batch(query: BatchQuery):
+    """
+    Retrieve the skies of several exoplanets in one request.
+    
+    Parameters:
+    - query (BatchQuery): The planets, each with planet_ra, planet_dec and optionally limit, planet_distance
+      and a key naming it in the response.
+    
+    Returns:
+    - dict: For each planet, under its key (or its position in the list), the same dictionary as /star_positions/.
+    """
+    planets = [(planet.planet_ra, planet.planet_dec, planet.limit, planet.planet_distance) for planet in query.planets]
+    keys = [planet.key if planet.key is not None else str(i) for i, planet in enumerate(query.planets)]
+    start = time.perf_counter()
+    response = await run_blocking(batch_response, planets, keys)
+    request_seconds.labels("batch").observe(time.perf_counter() - start)
+    return response
+
+def batch_response(planets, keys):
+    """Build the /star_positions/batch response; runs on the compute executor."""
+    skies = compute_star_arrays_batch(planets)
+    clock = StageClock(stage_seconds)
+    response = JSONResponse({key: to_json_dict(*star_arrays) for key, star_arrays in zip(keys, skies)})
+    clock.lap("batch_serialization")
+    return response
+
+def compute_star_arrays_batch(planets):
+    """
+    Compute the skies of several exoplanets, loading the stars once and broadcasting over the planets.
+    
+    Parameters:
+    - planets (list): (planet_ra, planet_dec, limit, planet_distance) of each exoplanet.
+    
+    Returns:
+    - list: The compute_star_arrays result of each planet, in the same order.
+    """
+    # Serve what is already baked or cached; identical planets in the batch are computed once
+    version = catalog_version()
+    keys = [response_cache.key(ra, dec, limit, version, distance) for ra, dec, limit, distance in planets]
+    skies = {}
+    for key, (planet_ra, planet_dec, limit, planet_distance) in zip(keys, planets):
+        if key not in skies:
+            skies[key] = lookup_sky(planet_ra, planet_dec, limit, planet_distance, key)
+    missing = [key for key, sky in skies.items() if sky is None]
+    if not missing:
+        return [skies[key] for key in keys]
+    queries = {key: planet for key, planet in zip(keys, planets)}
+
+    # Position of each planet on the cache grid
+    planet_positions = np.empty((len(missing), 3))
+    limits = []
+    for i, key in enumerate(missing):
+        planet_ra, planet_dec, limit, planet_distance = queries[key]
+        planet_ra, planet_dec = response_cache.snap(planet_ra, planet_dec)
+        distance = planet_distance if planet_distance is not None else DEFAULT_PLANET_DISTANCE
+        planet_positions[i] = celestial_to_cartesian(planet_ra, planet_dec, distance)
+        limits.append(limit)
+
+    # Select the stars that look brightest from each planet
+    clock = StageClock(stage_seconds)
+    if CATALOG_DIR:
+        columns = get_catalog()
+        selections = [select_from_store(position, limit, columns)
+                      for position, limit in zip(planet_positions, limits)]
+    else:
+        df = query_gaia_stars()
+        columns = {'source_id': df['SOURCE_ID'].to_numpy(), 'distance': df['distance'].to_numpy()}
+        columns['x'], columns['y'], columns['z'] = celestial_to_cartesian(
+            df['ra'].to_numpy(), df['dec'].to_numpy(), columns['distance']
+        )
+        abs_mag = absolute_magnitude(df['phot_g_mean_mag'].to_numpy(), columns['distance'])
+        positions = np.column_stack((columns['x'], columns['y'], columns['z']))
+        selections = select_brightest_batch(abs_mag, positions, planet_positions, limits)
+        log_transfer(LIVE_QUERY, len(df), len(np.unique(np.concatenate([rows for rows, _ in selections]))))
+    clock.lap("batch_selection")
+
+    # Project and normalize all the skies of a chunk at once
+    for key, star_arrays in zip(missing, skies_from_selections(columns, selections)):
+        skies[key] = star_arrays
+        cache_sky(key, star_arrays)
+    clock.lap("batch_projection")
+
+    return [skies[key] for key in keys]
+
+@app.get("/sky_tiles/")
+async def get_tile_layout():
+    """
+    Describe the level-of-detail sky tiles served by /sky_tiles/{tile}/{layer}.
+    
+    Returns:
+    - dict: The HEALPix "order" and "nside" of the nested tiles, the G magnitude "layer_edges" between the layers,
+      the "normalization_value" shared by all blocks and "counts", the number of stars of every [tile][layer].
+    """
+    if not CATALOG_DIR:
+        raise HTTPException(status_code=404, detail="Sky tiles are only served from a catalog store (GAIA_CATALOG_DIR)")
+    tiles = await run_blocking(get_sky_tiles)
+    return {
+        "order": tiles.order,
+        "nside": 1 << tiles.order,
+        "layer_edges": list(tiles.layer_edges),
+        "normalization_value": tiles.normalization_value,
+        "counts": tiles.counts().tolist(),
+    }
+
+@app.get("/sky_tiles/{tile}/{layer}")
+async def get_tile(tile: int, layer: int, planet_ra: float, planet_dec: float, planet_distance: Optional[float] = None,
+                   accept: Optional[str] = Header(None)):
+    """
+    Retrieve the stars of one sky tile and magnitude layer, transformed for an exoplanet.
+    
+    Parameters:
+    - tile (int): Nested HEALPix pixel of the tile, at the order given by /sky_tiles/.
+    - layer (int): Magnitude layer, 0 being the brightest.
+    - planet_ra (float): Exoplanet's right ascension in degrees.
+    - planet_dec (float): Exoplanet's declination in degrees.
+    - planet_distance (float): Exoplanet's distance in parsecs. Unknown distances are treated as infinite.
+    - accept (str): Accept header, as for /star_positions/.
+    
+    Returns:
+    - dict: {star_id: [x_normalized, y_normalized, relative_brightness]} for the stars of the block, brightest
+      first, or the binary payload when it was asked for. Brightness is relative to the brightest star seen from
+      the exoplanet (see sky_tiles.py).
+    """
+    if not CATALOG_DIR:
+        raise HTTPException(status_code=404, detail="Sky tiles are only served from a catalog store (GAIA_CATALOG_DIR)")
+
+    # Every block is cached on its own
+    version = await served_catalog_version()
+    cache_key = response_cache.key(planet_ra, planet_dec, None, version, planet_distance, "tile", tile, layer)
+    encoding = negotiate(accept)
+    body, media_type = await sky_flights.do((cache_key, encoding), lambda: run_blocking(
+        tile_response_body, tile, layer, planet_ra, planet_dec, planet_distance, cache_key, encoding
+    ))
+    return Response(body, media_type=media_type, headers={"Vary": "Accept"})
+
+def tile_response_body(tile, layer, planet_ra, planet_dec, planet_distance, cache_key, encoding):
+    """Find or compute a tile block and encode it like star_response_body; runs on the compute executor."""
+    # Tiles and brightness reference come from the same catalog version, even if the live one changes meanwhile
+    catalog = get_catalog()
+    tiles = get_sky_tiles(catalog)
+    if not (0 <= tile < tiles.tiles and 0 <= layer < tiles.layers):
+        raise HTTPException(status_code=404, detail=f"No tile {tile} layer {layer}; "
+                                                    f"there are {tiles.tiles} tiles of {tiles.layers} layers")
+
+    clock = StageClock(stage_seconds)
+    star_arrays = response_cache.get(cache_key)
+    if star_arrays is None:
+        # The brightest star seen from the planet is the brightness reference of all its blocks
+        planet_ra, planet_dec = response_cache.snap(planet_ra, planet_dec)
+        distance = planet_distance if planet_distance is not None else DEFAULT_PLANET_DISTANCE
+        planet_position = celestial_to_cartesian(planet_ra, planet_dec, distance)
+        reference_magnitudes = select_from_store(planet_position, 1, catalog)[1]
+        reference_magnitude = reference_magnitudes[0] if len(reference_magnitudes) else np.nan
+        star_arrays = tiles.block(tile, layer, planet_position, reference_magnitude)
+        cache_sky(cache_key, star_arrays, catalog.version)
+    clock.lap("tile_block")
+
+    if encoding is not None:
+        body, media_type = encode_binary(*star_arrays, encoding=encoding), MEDIA_TYPE
+    else:
+        body, media_type = JSONResponse(to_json_dict(*star_arrays)).body, "application/json"
+    clock.lap("serialization")
+    payload_bytes.labels(encoding or "json").observe(len(body))
+    return body, media_type
+
+class SessionQuery(BaseModel):
+    """Body of a session creation request."""
+    limit: int = 10
+    planet_distance: Optional[float] = None
+    tolerance: float = 1e-3
+
+@app.post("/star_sessions/")
+async def create_session(query: SessionQuery):
+    """
+    Start a fly-through session whose frames are sent as deltas.
+    
+    Parameters:
+    - query (SessionQuery): The number of stars per frame, the exoplanet's distance in parsecs (unknown distances
+      are treated as infinite) and the brightness change below which a star is not sent again.
+    
+    Returns:
+    - dict: The "session_id" to pass to /star_sessions/{session_id}/frame.
+    """
+    session = SkySession(session_pool_builder(), limit=query.limit, tolerance=query.tolerance,
+                         planet_distance=query.planet_distance)
+    return {"session_id": star_sessions.add(session), "limit": query.limit, "tolerance": query.tolerance}
+
+def session_pool_builder():
+    """Return the function building a session's candidate pool, from the store or from one Gaia query."""
+    if CATALOG_DIR:
+        def build_pool(planet_position, limit):
+            catalog = get_catalog()
+            return index_pool(get_magnitude_index(catalog), catalog["source_id"], planet_position, limit)
+        return build_pool
+
+    stars = {}
+
+    def build_pool(planet_position, limit):
+        # Without an index every visible star of the slice is a candidate; query Gaia once per session
+        if not stars:
+            df = query_gaia_stars()
+            points = np.column_stack(celestial_to_cartesian(
+                df['ra'].to_numpy(), df['dec'].to_numpy(), df['distance'].to_numpy()
+            ))
+            stars['pool'] = StarPool(df['SOURCE_ID'].to_numpy(), points,
+                                     absolute_magnitude(df['phot_g_mean_mag'].to_numpy(), df['distance'].to_numpy()))
+        return stars['pool']
+
+    return build_pool
+
+@app.get("/star_sessions/{session_id}/frame")
+async def get_session_frame(session_id: str, planet_ra: float, planet_dec: float, full: bool = False):
+    """
+    Move a session's observer and return what changed since its previous frame.
+    
+    Parameters:
+    - session_id (str): Id returned by POST /star_sessions/.
+    - planet_ra (float): Exoplanet's right ascension in degrees.
+    - planet_dec (float): Exoplanet's declination in degrees.
+    - full (bool): Send every star, as if it were the first frame.
+    
+    Returns:
+    - dict: "frame" number, "full", "count", "scale", "added" {star_id: [x, y, relative_brightness]} for stars
+      entering the set, "removed" star ids and "brightness" {star_id: relative_brightness} for kept stars whose
+      brightness changed by more than the tolerance. x * scale and y * scale are the normalized coordinates of
+      /star_positions/; coordinates of a star never change while it stays in the set (see sky_session.py).
+    """
+    session = star_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"No session {session_id}; it may have expired")
+    return await run_blocking(session_frame_response, session, planet_ra, planet_dec, full)
+
+def session_frame_response(session, planet_ra, planet_dec, full):
+    """Compute a session frame and build its response; runs on the compute executor."""
+    clock = StageClock(stage_seconds)
+    distance = session.planet_distance if session.planet_distance is not None else DEFAULT_PLANET_DISTANCE
+    frame = session.frame(celestial_to_cartesian(planet_ra, planet_dec, distance), full=full)
+    clock.lap("session_frame")
+    changed_ids, changed_brightness = frame["brightness"]
+    response = JSONResponse({
+        "frame": frame["frame"],
+        "full": frame["full"],
+        "count": frame["count"],
+        "scale": frame["scale"],
+        "added": to_json_dict(*frame["added"]),
+        "removed": frame["removed"].tolist(),
+        "brightness": dict(zip(changed_ids.tolist(), changed_brightness.tolist())),
+    })
+    clock.lap("serialization")
+    return response
+
+@app.delete("/star_sessions/{session_id}")
+async def delete_session(session_id: str):
+    """End a session and free its state."""
+    if not star_sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail=f"No session {session_id}")
+    return {"deleted": session_id}
+
+@app.get("/ready")
+async def get_readiness():
+    """
+    Tell whether the process has opened the catalog store and its indexes and serves at full speed.
+    
+    Returns:
+    - JSONResponse: 200 with "ready": true, the catalog version and the warm-up time once warm-up is done;
+      503 with "ready": false, and the warm-up error if it failed, before that.
+    """
+    version = await served_catalog_version() if readiness["ready"] else None
+    body = {"ready": readiness["ready"], "catalog_version": version,
+            "warm_up_seconds": readiness["seconds"], "error": readiness["error"]}
+    return JSONResponse(body, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Return hit, miss and eviction counters of the sky cache."""
+    return response_cache.stats()
 
-    # Filter to keep only visible stars
-    df = df[df['distance'] > 0].head(limit)
+@app.get("/executor/stats")
+async def get_executor_stats():
+    """Return queue depth, rejections, timeouts and utilisation of the compute executor."""
+    return compute_executor.stats()
 
-    # Recalculate star positions and brightness based on the exoplanet's location
-    star_data = recalculate_star_positions(planet_ra, planet_dec, df)
-    print(star_data.columns)
-    # Convert to the required dictionary format: {star_id: [x_normalized, y_normalized, relative_brightness]}
-    star_data_dict = star_data.set_index('source_id')[['x_normalized', 'y_normalized', 'relative_brightness']].T.to_dict(orient='list')
+@app.get("/singleflight/stats")
+async def get_singleflight_stats():
+    """Return how many sky computations ran and how many requests joined one already in flight."""
+    return sky_flights.stats()
 
-    return star_data_dict
+@app.get("/metrics")
+async def get_metrics():
+    """Return request latencies, per-stage timings, row counts, payload sizes and cache ratios for Prometheus."""
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
 
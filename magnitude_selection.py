@@ -0,0 +1,326 @@
+"""
+Select the N brightest stars as seen from an arbitrary vantage point.
+
+Moving the observer changes every star's apparent magnitude through the
+distance modulus, m = M + 5 log10(d / 10 pc). The selection index groups stars
+into blocks and keeps, for every block, the brightest absolute magnitude it
+contains. Together with the distance from the observer to the block's bounding
+box this gives a lower bound on the apparent magnitude of every star in the
+block, so only blocks that could still contain a top-N star are ever opened.
+The final cut uses argpartition rather than a full sort.
+
+Usage:
+    python magnitude_selection.py build catalog/
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from spatial_index import StarIndex, node_range
+
+INDEX_DIR_NAME = "magnitude_index"
+
+
+def absolute_magnitude(apparent_magnitude, distance):
+    """
+    Absolute magnitude from the apparent magnitude seen from the Sun.
+
+    Parameters:
+    - apparent_magnitude (np.ndarray): Apparent magnitudes.
+    - distance (np.ndarray): Distances from the Sun in parsecs.
+
+    Returns:
+    - np.ndarray: Absolute magnitudes; inf where the distance is not positive.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = apparent_magnitude - 5 * np.log10(np.asarray(distance, dtype=np.float64) / 10)
+    return np.where(np.asarray(distance) > 0, magnitude, np.inf)
+
+
+def apparent_magnitude(abs_mag, positions, planet_position):
+    """
+    Apparent magnitude of stars seen from a vantage point.
+
+    Parameters:
+    - abs_mag (np.ndarray): Absolute magnitudes.
+    - positions (np.ndarray): (..., 3) star positions in parsecs.
+    - planet_position (array-like): (..., 3) observer position in parsecs, broadcast against `positions`.
+
+    Returns:
+    - np.ndarray: Apparent magnitudes from the vantage point.
+    """
+    offset = positions - np.asarray(planet_position, dtype=np.float64)
+    distance = np.sqrt(np.square(offset).sum(axis=-1))
+    with np.errstate(divide='ignore'):
+        return abs_mag + 5 * np.log10(distance / 10)
+
+
+def brightest(magnitudes, n):
+    """
+    Positions of the `n` smallest magnitudes, brightest first, without sorting everything.
+
+    Parameters:
+    - magnitudes (np.ndarray): Apparent magnitudes.
+    - n (int): Number of stars to keep.
+
+    Returns:
+    - np.ndarray: Positions into `magnitudes`.
+    """
+    # Stars without a magnitude, or sitting at the vantage point itself, are never selected
+    finite = np.isfinite(magnitudes)
+    n = min(n, int(np.count_nonzero(finite)))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(np.where(finite, magnitudes, np.inf), n - 1)[:n]
+    return top[np.argsort(magnitudes[top], kind="stable")]
+
+
+def _concatenate_ranges(starts, ends):
+    """All integers of the half-open ranges [starts[i], ends[i]), concatenated."""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return offsets + np.arange(total)
+
+
+def _magnitude_bound(min_abs_mag, lower, upper, point):
+    """Lower bound of the apparent magnitude, seen from `point`, of any star inside each box."""
+    gap = np.maximum(np.maximum(lower - point, point - upper), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bound = min_abs_mag + 5 * np.log10(np.sqrt(np.square(gap).sum(axis=1)) / 10)
+    return np.where(np.isnan(bound), np.inf, bound)
+
+
+class MagnitudeBoundIndex:
+    """
+    Stars grouped into blocks that are tight in both absolute magnitude and space.
+
+    Stars are sorted by absolute magnitude and cut into bands of `band_size`
+    stars; each band is split spatially (median KD splits) into blocks of at
+    most `block_size` stars. Every band and block keeps its bounding box and
+    its brightest absolute magnitude, so whole bands and then blocks can be
+    skipped when even their brightest possible star is too faint.
+
+    Attributes:
+    - order (np.ndarray): Catalog row of each star, in block order.
+    - points (np.ndarray): (n, 3) star positions in block order.
+    - abs_mag (np.ndarray): Absolute magnitude of each star in block order.
+    - block_start (np.ndarray): First star of each block, plus the star count.
+    - band_block_start (np.ndarray): First block of each band, plus the block count.
+    """
+
+    ARRAYS = [
+        "order", "points", "abs_mag",
+        "block_start", "block_lower", "block_upper", "block_min_abs_mag",
+        "band_block_start", "band_lower", "band_upper", "band_min_abs_mag",
+    ]
+
+    def __init__(self, catalog_version=None, **arrays):
+        self.catalog_version = catalog_version
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.order)
+
+    @classmethod
+    def build(cls, catalog, band_size=16384, block_size=64):
+        """
+        Build the bound index of a catalog store.
+
+        Parameters:
+        - catalog (Catalog): Catalog store with x, y, z, phot_g_mean_mag and distance columns.
+        - band_size (int): Stars per absolute-magnitude band.
+        - block_size (int): Maximum number of stars per block.
+
+        Returns:
+        - MagnitudeBoundIndex: The bound index.
+        """
+        points = np.column_stack((catalog["x"], catalog["y"], catalog["z"])).astype(np.float64)
+        abs_mag = absolute_magnitude(np.asarray(catalog["phot_g_mean_mag"]), np.asarray(catalog["distance"]))
+
+        # Only visible stars with a position and a magnitude can be selected
+        usable = np.isfinite(abs_mag) & np.isfinite(points).all(axis=1)
+        rows = np.flatnonzero(usable)
+        rows = rows[np.argsort(abs_mag[rows], kind="stable")]
+
+        order, block_start, block_lower, block_upper = [], [0], [], []
+        band_block_start = [0]
+        for band_start in range(0, len(rows), band_size):
+            band_rows = rows[band_start:band_start + band_size]
+            band_points = points[band_rows]
+
+            # Spatial blocks of the band are the leaves of a small KD-tree
+            tree = StarIndex.build(band_points[:, 0], band_points[:, 1], band_points[:, 2], leaf_size=block_size)
+            order.append(band_rows[tree.order])
+            first_leaf = 2 ** tree.depth - 1
+            for leaf in range(first_leaf, 2 * first_leaf + 1):
+                start, end = node_range(leaf, len(band_rows))
+                if start == end:
+                    continue
+                block_start.append(block_start[-1] + end - start)
+                block_lower.append(tree.lower[leaf])
+                block_upper.append(tree.upper[leaf])
+            band_block_start.append(len(block_start) - 1)
+
+        order = np.concatenate(order) if order else np.empty(0, dtype=np.int64)
+        block_start = np.array(block_start)
+        band_block_start = np.array(band_block_start)
+        block_lower = np.array(block_lower).reshape(-1, 3)
+        block_upper = np.array(block_upper).reshape(-1, 3)
+        sorted_abs_mag = abs_mag[order]
+
+        # Brightest star of each block and band; each band is a run of whole blocks
+        block_min_abs_mag = np.minimum.reduceat(sorted_abs_mag, block_start[:-1]) if len(order) else np.empty(0)
+        band_first_block = band_block_start[:-1]
+        if len(order):
+            band_min_abs_mag = np.minimum.reduceat(block_min_abs_mag, band_first_block)
+            band_lower = np.minimum.reduceat(block_lower, band_first_block)
+            band_upper = np.maximum.reduceat(block_upper, band_first_block)
+        else:
+            band_min_abs_mag, band_lower, band_upper = np.empty(0), np.empty((0, 3)), np.empty((0, 3))
+
+        return cls(
+            catalog_version=catalog.version,
+            order=order, points=points[order], abs_mag=sorted_abs_mag,
+            block_start=block_start, block_lower=block_lower, block_upper=block_upper,
+            block_min_abs_mag=block_min_abs_mag,
+            band_block_start=band_block_start, band_lower=band_lower, band_upper=band_upper,
+            band_min_abs_mag=band_min_abs_mag,
+        )
+
+    def save(self, path):
+        """Write the index arrays and their description into directory `path`."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            tmp_path = os.path.join(path, f"{name}.npy.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({"catalog_version": self.catalog_version}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open an index written by save, memory-mapping its arrays."""
+        with open(os.path.join(path, "index.json")) as f:
+            description = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in cls.ARRAYS
+        }
+        return cls(catalog_version=description["catalog_version"], **arrays)
+
+    def select_brightest(self, planet_position, n):
+        """
+        Find the `n` stars with the smallest apparent magnitude seen from `planet_position`.
+
+        Parameters:
+        - planet_position (array-like): Observer position (x, y, z) in parsecs.
+        - n (int): Number of stars to return.
+
+        Returns:
+        - np.ndarray: Catalog rows of the selected stars, brightest first.
+        - np.ndarray: Their apparent magnitudes from the vantage point.
+        """
+        planet_position = np.asarray(planet_position, dtype=np.float64)
+        if n <= 0 or len(self.order) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        band_first_star = self.block_start[self.band_block_start]
+        band_bounds = _magnitude_bound(self.band_min_abs_mag, self.band_lower, self.band_upper, planet_position)
+
+        # Open the most promising bands until they hold n stars; their n-th brightest
+        # star is an upper bound on the n-th brightest star overall
+        promising = np.argsort(band_bounds, kind="stable")
+        band_sizes = np.diff(band_first_star)[promising]
+        promising = promising[:np.searchsorted(np.cumsum(band_sizes), n) + 1]
+        magnitudes = self._magnitudes(band_first_star[promising], band_first_star[promising + 1], planet_position)[1]
+        finite = magnitudes[np.isfinite(magnitudes)]
+        threshold = np.partition(finite, n - 1)[n - 1] if len(finite) >= n else np.inf
+
+        # Every block, in every band, that could still hold a star at least that bright
+        blocks = self.candidate_blocks(planet_position, threshold, band_bounds)
+        positions, magnitudes = self._magnitudes(self.block_start[blocks], self.block_start[blocks + 1], planet_position)
+
+        top = brightest(magnitudes, n)
+        return np.asarray(self.order[positions[top]]), magnitudes[top]
+
+    def candidate_blocks(self, planet_position, threshold, band_bounds=None):
+        """
+        Blocks that could hold a star at least as bright as `threshold` seen from `planet_position`.
+
+        Parameters:
+        - planet_position (np.ndarray): Observer position (x, y, z) in parsecs.
+        - threshold (float): Apparent magnitude.
+        - band_bounds (np.ndarray): Magnitude bound of every band from `planet_position`, if already computed.
+
+        Returns:
+        - np.ndarray: Block numbers, increasing.
+        """
+        if band_bounds is None:
+            band_bounds = _magnitude_bound(self.band_min_abs_mag, self.band_lower, self.band_upper, planet_position)
+        bands = np.flatnonzero(band_bounds <= threshold)
+        blocks = _concatenate_ranges(self.band_block_start[bands], self.band_block_start[bands + 1])
+        block_bounds = _magnitude_bound(
+            self.block_min_abs_mag[blocks], self.block_lower[blocks], self.block_upper[blocks], planet_position
+        )
+        return blocks[block_bounds <= threshold]
+
+    def block_stars(self, blocks):
+        """Positions, in block order, of the stars of the given blocks."""
+        return _concatenate_ranges(self.block_start[blocks], self.block_start[blocks + 1])
+
+    def _magnitudes(self, starts, ends, planet_position):
+        """Positions of the stars in the given ranges and their apparent magnitudes."""
+        positions = _concatenate_ranges(starts, ends)
+        magnitudes = apparent_magnitude(self.abs_mag[positions], self.points[positions], planet_position)
+        return positions, magnitudes
+
+
+def load_magnitude_index(catalog, mmap=True):
+    """
+    Open the bound index saved inside a catalog store.
+
+    Parameters:
+    - catalog (Catalog): The store the index was built for.
+    - mmap (bool): Memory-map the index arrays.
+
+    Returns:
+    - MagnitudeBoundIndex: The index, or None if it is missing or was built for another catalog version.
+    """
+    path = os.path.join(catalog.path, INDEX_DIR_NAME)
+    if not os.path.exists(os.path.join(path, "index.json")):
+        return None
+    index = MagnitudeBoundIndex.load(path, mmap=mmap)
+    if index.catalog_version != catalog.version:
+        return None
+    return index
+
+
+def main():
+    from catalog_store import load_catalog
+
+    parser = argparse.ArgumentParser(description="Build the magnitude bound index of a catalog store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build and save the magnitude bound index.")
+    build_parser.add_argument("path", help="Directory of the catalog store.")
+    build_parser.add_argument("--band-size", type=int, default=16384)
+    build_parser.add_argument("--block-size", type=int, default=64)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    catalog = load_catalog(args.path)
+    index = MagnitudeBoundIndex.build(catalog, band_size=args.band_size, block_size=args.block_size)
+    index.save(os.path.join(args.path, INDEX_DIR_NAME))
+    logging.info("Indexed %d stars in %d blocks and %d bands", len(index), len(index.block_min_abs_mag),
+                 len(index.band_min_abs_mag))
+
+
+if __name__ == "__main__":
+    main()
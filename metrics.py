@@ -0,0 +1,241 @@
+"""
+Lightweight in-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are plain Python objects guarded by a lock, so
+recording a value costs a dictionary lookup, a bisect and a few additions and
+can stay enabled under full load. Labelled series are created on first use and
+cached. Values that other components already count (cache, executor and
+single-flight statistics) are read through collectors when the metrics are
+scraped instead of being recorded twice.
+
+Usage:
+    registry = MetricsRegistry()
+    stage_seconds = registry.histogram("stage_seconds", "Time per stage.", ["stage"])
+    clock = StageClock(stage_seconds)
+    ...                      # first stage
+    clock.lap("load")
+    text = registry.render()
+"""
+import bisect
+import math
+import threading
+import time
+
+# Media type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from half a millisecond up to the compute timeout
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Star counts, per decade
+ROW_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Bytes, from 256 B to 64 MiB in factors of 4
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterSeries:
+    def __init__(self, family):
+        self._family = family
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        """Add `amount` to the counter."""
+        if self._family.registry.enabled:
+            with self._lock:
+                self.value += amount
+
+
+class _HistogramSeries:
+    def __init__(self, family):
+        self._family = family
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(family.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record one value."""
+        if self._family.registry.enabled:
+            i = bisect.bisect_left(self._family.buckets, value)
+            with self._lock:
+                self.counts[i] += 1
+                self.sum += value
+                self.count += 1
+
+
+class _Family:
+    """A metric name with its labelled series."""
+
+    kind = None
+    series_class = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        self._unlabelled = None if self.labelnames else self.labels()
+
+    def labels(self, *values):
+        """
+        Return the series of the given label values, creating it on first use.
+
+        Parameters:
+        - values (str): One value per label name, in order.
+
+        Returns:
+        - The series, with inc() for counters and observe() for histograms.
+        """
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.setdefault(values, self.series_class(self))
+        return series
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in sorted(self._series.items()):
+            lines.extend(self._samples(values, series))
+        return lines
+
+
+class Counter(_Family):
+    """Monotonic counter; the exported name should end in _total."""
+
+    kind = "counter"
+    series_class = _CounterSeries
+
+    def inc(self, amount=1):
+        """Add `amount` to the counter of a family without labels."""
+        self._unlabelled.inc(amount)
+
+    def _samples(self, values, series):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(series.value)}"]
+
+
+class Histogram(_Family):
+    """
+    Distribution of observed values over fixed buckets.
+
+    Parameters:
+    - registry (MetricsRegistry): Registry the histogram belongs to.
+    - name (str): Metric name.
+    - help (str): Description shown by Prometheus.
+    - labelnames (list): Label names of the series.
+    - buckets (tuple): Increasing upper bounds; +Inf is implied.
+    """
+
+    kind = "histogram"
+    series_class = _HistogramSeries
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(registry, name, help, labelnames)
+
+    def observe(self, value):
+        """Record one value in a histogram without labels."""
+        self._unlabelled.observe(value)
+
+    def _samples(self, values, series):
+        with series._lock:
+            counts, total, count = list(series.counts), series.sum, series.count
+        lines, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class StageClock:
+    """
+    Time consecutive stages of a computation into a histogram labelled by stage.
+
+    Parameters:
+    - histogram (Histogram): Histogram with a single "stage" label.
+    """
+
+    __slots__ = ("_histogram", "_last")
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """Record the time since the previous lap (or the clock's creation) under `stage`."""
+        now = time.perf_counter()
+        self._histogram.labels(stage).observe(now - self._last)
+        self._last = now
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered together.
+
+    Parameters:
+    - enabled (bool): When False, recording is a no-op; collectors still report on scrape.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        """Create and register a Counter."""
+        family = Counter(self, name, help, labelnames)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Create and register a Histogram."""
+        family = Histogram(self, name, help, labelnames, buckets)
+        self._families.append(family)
+        return family
+
+    def add_collector(self, function):
+        """
+        Register a function called on every scrape.
+
+        Parameters:
+        - function (callable): Returns (name, kind, help, value) tuples, kind being "counter" or "gauge".
+        """
+        self._collectors.append(function)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        for function in self._collectors:
+            for name, kind, help, value in function():
+                lines.extend((f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {_format_value(value)}"))
+        return "\n".join(lines) + "\n"
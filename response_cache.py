@@ -0,0 +1,192 @@
+"""
+In-process cache of computed skies for the star API.
+
+Keys are built from the planet coordinates quantized to a fixed angular
+tolerance, the requested star count and the catalog version, so requests for
+the same planet share an entry and a re-ingested catalog never serves stale
+skies. Entries expire after a TTL and the least recently used entry is evicted
+once the cache is full. An optional directory keeps entries across restarts.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+def grid_steps(planet_ra, planet_dec, tolerance):
+    """
+    Grid cell of planet coordinates quantized to `tolerance` degrees.
+
+    Parameters:
+    - planet_ra, planet_dec (float): Planet coordinates in degrees.
+    - tolerance (float): Angular quantization step in degrees.
+
+    Returns:
+    - tuple: (ra_step, dec_step) integers, RA wrapped around the full circle.
+    """
+    ra_step = round(planet_ra / tolerance) % round(360 / tolerance)
+    dec_step = round(planet_dec / tolerance)
+    return ra_step, dec_step
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache with hit/miss/eviction counters.
+
+    Parameters:
+    - max_entries (int): Number of entries kept in memory.
+    - ttl (float): Seconds an entry stays valid. None keeps entries until evicted.
+    - tolerance (float): Angular quantization step in degrees for planet coordinates.
+    - disk_dir (str): Optional directory of a second, persistent tier.
+    - max_disk_entries (int): Number of files kept in the disk tier.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, tolerance=1e-4, disk_dir=None, max_disk_entries=16384):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def snap(self, planet_ra, planet_dec):
+        """
+        Quantize planet coordinates to the cache grid.
+
+        Parameters:
+        - planet_ra (float): Right ascension in degrees.
+        - planet_dec (float): Declination in degrees.
+
+        Returns:
+        - tuple: (ra, dec) moved to the nearest grid point, RA wrapped into [0, 360).
+        """
+        ra = round(planet_ra / self.tolerance) * self.tolerance % 360
+        dec = round(planet_dec / self.tolerance) * self.tolerance
+        return ra, dec
+
+    def key(self, planet_ra, planet_dec, limit, catalog_version, *extra):
+        """
+        Build the cache key of a request.
+
+        Parameters:
+        - planet_ra, planet_dec (float): Planet coordinates in degrees.
+        - limit (int): Number of stars requested.
+        - catalog_version (str): Version of the catalog the sky is computed from.
+        - extra: Any further request parameters that change the result.
+
+        Returns:
+        - tuple: Hashable key.
+        """
+        return (catalog_version,) + grid_steps(planet_ra, planet_dec, self.tolerance) + (limit,) + extra
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if self.ttl is None or now - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value, now)
+        return value
+
+    def put(self, key, value):
+        """Store `value` under `key`, evicting the least recently used entries if full."""
+        now = time.monotonic()
+        with self._lock:
+            self._store(key, value, now)
+        self._disk_put(key, value)
+
+    def clear(self):
+        """Drop every in-memory entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the counters and current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _store(self, key, value, created):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, created, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # Disk entries use wall-clock time since they outlive the process
+        if stored_key != key or (self.ttl is not None and time.time() - created >= self.ttl):
+            return None
+        return value
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, time.time(), value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        # Trim the oldest files now and then rather than listing the directory on every write
+        self._disk_writes += 1
+        if self._disk_writes % 64 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        paths = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith(".pkl")]
+        if len(paths) <= self.max_disk_entries:
+            return
+        paths.sort(key=lambda path: os.path.getmtime(path))
+        for path in paths[:len(paths) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,46 @@
+"""
+Serving entry point of the star API.
+
+Runs gaia_proj_json6_api:app under uvicorn. Importing the app loads NumPy and
+FastAPI only: astroquery is imported by the live Gaia query on its first call
+and pandas by the DataFrame paths, so a worker serving from a catalog store
+never pays for them. At startup every worker memory-maps the catalog store
+and its saved indexes in the background; GET /ready answers 503 until that is
+done, so a load balancer sends traffic only to warm workers.
+
+--catalog may be a catalog root managed with catalog_versions.py: the workers
+then map the live version's files, shared in the page cache rather than
+copied per worker, and switch to a newly published version without a restart.
+
+Usage:
+    python serve.py --catalog catalog/ --port 8000 --workers 4
+"""
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the star API.")
+    parser.add_argument("--catalog", help="Catalog store or catalog root to serve from (GAIA_CATALOG_DIR); live Gaia "
+                                          "queries if not given.")
+    parser.add_argument("--exoplanets", help="Exoplanet table CSV served by /star_positions/{planet_name} "
+                                             "(STAR_EXOPLANET_TABLE).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes.")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if args.catalog:
+        os.environ["GAIA_CATALOG_DIR"] = args.catalog
+    if args.exoplanets:
+        os.environ["STAR_EXOPLANET_TABLE"] = args.exoplanets
+
+    import uvicorn
+
+    uvicorn.run("gaia_proj_json6_api:app", host=args.host, port=args.port, workers=args.workers,
+                log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
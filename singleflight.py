@@ -0,0 +1,80 @@
+"""
+Coalesce concurrent identical computations on the event loop.
+
+The first caller for a key starts the computation; callers arriving with the
+same key while it runs await the same task instead of starting their own, so a
+burst of N identical requests costs one computation. All of them receive its
+result or its exception. A caller that is cancelled (e.g. its client
+disconnected) only stops waiting; the computation is cancelled once no caller
+is left waiting for it.
+"""
+import asyncio
+import threading
+
+
+class SingleFlight:
+    """Per-key deduplication of in-flight coroutines, with counters."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.deduplicated = 0
+        self.failures = 0
+        self.cancellations = 0
+
+    async def do(self, key, function):
+        """
+        Await `function()` once for every group of concurrent calls with the same key.
+
+        Parameters:
+        - key (hashable): Identity of the computation.
+        - function (callable): Called without arguments by the first caller; returns an awaitable.
+
+        Returns:
+        - The computation's result; its exception is raised in every caller.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(function()), "waiters": 0}
+            self._calls[key] = call
+            call["task"].add_done_callback(lambda task: self._finish(key, call))
+            with self._lock:
+                self.leaders += 1
+        else:
+            with self._lock:
+                self.deduplicated += 1
+
+        # Shield the shared task so one caller's cancellation does not reach the others
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"])
+        except asyncio.CancelledError:
+            if not call["task"].done() and call["waiters"] == 1:
+                call["task"].cancel()
+            raise
+        finally:
+            call["waiters"] -= 1
+
+    def _finish(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        task = call["task"]
+        with self._lock:
+            if task.cancelled():
+                self.cancellations += 1
+            elif task.exception() is not None:
+                self.failures += 1
+
+    def stats(self):
+        """Return the number of computations started, callers that joined one, and the in-flight count."""
+        with self._lock:
+            calls = self.leaders + self.deduplicated
+            return {
+                "in_flight": len(self._calls),
+                "computations": self.leaders,
+                "deduplicated": self.deduplicated,
+                "failures": self.failures,
+                "cancellations": self.cancellations,
+                "deduplication_ratio": self.deduplicated / calls if calls else 0.0,
+            }
@@ -0,0 +1,182 @@
+"""
+Single-file archive of precomputed skies, read through a memory map.
+
+Layout (little-endian, every section aligned to 64 bytes):
+
+    b"SKYARCH1"            magic
+    uint64                 length of the JSON header
+    JSON header            catalog_version, tolerance, entry and star counts,
+                           and the offset and dtype of every section
+    index                  one INDEX_DTYPE record per sky
+    source_id, x, y,       the star arrays of all skies, one after the other;
+    brightness             a sky is the slice [offset, offset + count) of each
+
+Skies are looked up by the same quantized coordinates as the response cache,
+the number of stars and the planet distance (NaN in the index when unknown,
+rounded to DISTANCE_DIGITS significant digits in the lookup key, so that a
+client's float close to the catalogued distance still finds the sky), and
+are returned as read-only views into the map, without copying.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from response_cache import grid_steps
+
+MAGIC = b"SKYARCH1"
+ALIGNMENT = 64
+
+INDEX_DTYPE = np.dtype([
+    ("ra_step", "<i8"),
+    ("dec_step", "<i8"),
+    ("limit", "<i8"),
+    ("distance", "<f8"),
+    ("offset", "<i8"),
+    ("count", "<i8"),
+])
+
+# Significant digits of the planet distance that tell two baked skies apart
+DISTANCE_DIGITS = 6
+
+# Star arrays of a sky, in the order compute_star_arrays returns them
+COLUMNS = [("source_id", "<i8"), ("x", "<f8"), ("y", "<f8"), ("brightness", "<f8")]
+
+
+def distance_key(distance):
+    """Lookup key of a planet distance: None when unknown, else rounded to DISTANCE_DIGITS significant digits."""
+    if distance is None or np.isnan(distance):
+        return None
+    return float(f"{float(distance):.{DISTANCE_DIGITS}g}")
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_archive(path, index, parts, metadata):
+    """
+    Write an archive from skies held in several parts, one column at a time.
+
+    Parameters:
+    - path (str): Archive file to write; replaced atomically.
+    - index (np.ndarray): INDEX_DTYPE records of every sky, offsets counted from the start of the star arrays.
+    - parts (list): Callables returning, for each part in index order, a dict of its column arrays.
+    - metadata (dict): Extra header fields, e.g. catalog_version and tolerance.
+
+    Returns:
+    - dict: The header that was written.
+    """
+    stars = int(index["count"].sum())
+    header = dict(metadata, entries=len(index), stars=stars, index_dtype=INDEX_DTYPE.descr, columns={})
+
+    # Lay the sections out behind a header of bounded size
+    header_budget = 4096
+    offset = _aligned(len(MAGIC) + 8 + header_budget)
+    header["index_offset"] = offset
+    offset = _aligned(offset + index.nbytes)
+    for name, dtype in COLUMNS:
+        header["columns"][name] = {"offset": offset, "dtype": dtype}
+        offset = _aligned(offset + stars * np.dtype(dtype).itemsize)
+    encoded = json.dumps(header).encode()
+    if len(encoded) > header_budget:
+        raise ValueError("Archive header does not fit in its reserved space")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        f.seek(header["index_offset"])
+        f.write(np.ascontiguousarray(index, dtype=INDEX_DTYPE).tobytes())
+
+        # One column at a time, so only one part of one column is ever in memory
+        for name, dtype in COLUMNS:
+            f.seek(header["columns"][name]["offset"])
+            for load_part in parts:
+                f.write(np.asarray(load_part()[name], dtype=dtype).tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return header
+
+
+class SkyArchive:
+    """
+    Read-only view of a sky archive.
+
+    Attributes:
+    - header (dict): The JSON header.
+    - catalog_version (str): Version of the catalog store the skies were computed from.
+    - tolerance (float): Angular quantization step of the lookup keys, in degrees.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a sky archive")
+            header_length, = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_length))
+        self.catalog_version = self.header["catalog_version"]
+        self.tolerance = self.header["tolerance"]
+
+        self.index = self._map(INDEX_DTYPE, self.header["index_offset"], self.header["entries"])
+        self.columns = {
+            name: self._map(self.header["columns"][name]["dtype"], self.header["columns"][name]["offset"],
+                            self.header["stars"])
+            for name, _ in COLUMNS
+        }
+
+        # Hash table from lookup key to index position
+        self._positions = {
+            self._key(ra_step, dec_step, limit, distance): i
+            for i, (ra_step, dec_step, limit, distance) in enumerate(
+                zip(*(self.index[field].tolist() for field in ("ra_step", "dec_step", "limit", "distance")))
+            )
+        }
+
+    def __len__(self):
+        return len(self.index)
+
+    def _map(self, dtype, offset, count):
+        """Read-only memory map of a section (numpy cannot map zero bytes)."""
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+    @staticmethod
+    def _key(ra_step, dec_step, limit, distance):
+        return int(ra_step), int(dec_step), int(limit), distance_key(distance)
+
+    def lookup(self, planet_ra, planet_dec, limit, planet_distance=None):
+        """
+        Find the baked sky of a planet.
+
+        Parameters:
+        - planet_ra, planet_dec (float): Planet coordinates in degrees.
+        - limit (int): Number of stars requested.
+        - planet_distance (float): Planet distance in parsecs, None if unknown.
+
+        Returns:
+        - tuple: source_id, x_normalized, y_normalized and relative_brightness views, or None if not baked.
+        """
+        key = self._key(*grid_steps(planet_ra, planet_dec, self.tolerance), limit, planet_distance)
+        position = self._positions.get(key)
+        if position is None:
+            return None
+        entry = self.index[position]
+        start, end = int(entry["offset"]), int(entry["offset"] + entry["count"])
+        return tuple(self.columns[name][start:end] for name, _ in COLUMNS)
+
+
+def load_sky_archive(path):
+    """
+    Open a sky archive written by write_archive.
+
+    Parameters:
+    - path (str): Archive file.
+
+    Returns:
+    - SkyArchive: Read-only view of the archive.
+    """
+    return SkyArchive(path)
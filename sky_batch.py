@@ -0,0 +1,160 @@
+"""
+Compute the skies of many planets at once.
+
+Star positions are computed once and the per-planet work is broadcast over a
+leading planet axis: the selected stars of every planet are gathered into
+(planets, stars) arrays padded with NaN, and the coordinate kernels, which all
+work along the last axis, handle every planet in one call. Planets are
+processed in chunks so that no intermediate array holds more than
+`max_elements` values.
+
+The results are identical to the single-planet pipeline. Row maxima and minima
+do not depend on the padding, and the mean modulus is taken over the unpadded
+part of each row so it is summed in the same order as for a single planet.
+"""
+import numpy as np
+
+from coordinate_kernels import planar_projection, normalize_projection, normalized_brightness
+from magnitude_selection import apparent_magnitude, brightest
+
+# Distance used for an exoplanet whose distance is unknown, in parsecs (effectively infinite)
+DEFAULT_PLANET_DISTANCE = 1e12
+
+# Values held by the largest intermediate (planets, stars) array, 32 MB of float64
+MAX_CHUNK_ELEMENTS = 1 << 22
+
+
+def chunk_ranges(count, width, max_elements=MAX_CHUNK_ELEMENTS):
+    """
+    Split `count` planets into chunks whose (planets, width) arrays stay within `max_elements`.
+
+    Parameters:
+    - count (int): Number of planets.
+    - width (int): Length of the star axis.
+    - max_elements (int): Largest number of values in one chunk.
+
+    Returns:
+    - list: (start, end) planet ranges, end exclusive.
+    """
+    step = max(1, max_elements // max(1, width))
+    return [(start, min(start + step, count)) for start in range(0, count, step)]
+
+
+def select_brightest_batch(abs_mag, positions, planet_positions, limits, max_elements=MAX_CHUNK_ELEMENTS):
+    """
+    Select the brightest stars of every planet from star arrays held in memory.
+
+    Parameters:
+    - abs_mag (np.ndarray): (n,) absolute magnitudes of the stars.
+    - positions (np.ndarray): (n, 3) star positions in parsecs.
+    - planet_positions (np.ndarray): (planets, 3) observer positions in parsecs.
+    - limits (list): Number of stars to keep for each planet.
+    - max_elements (int): Largest (planets, stars) magnitude array computed at once.
+
+    Returns:
+    - list: One (star positions into the arrays, apparent magnitudes) pair per planet, brightest first.
+    """
+    planet_positions = np.asarray(planet_positions, dtype=np.float64)
+    selections = []
+    for start, end in chunk_ranges(len(planet_positions), len(abs_mag), max_elements):
+        # Apparent magnitude of every star from every planet of the chunk
+        magnitudes = apparent_magnitude(abs_mag, positions, planet_positions[start:end, np.newaxis, :])
+        for row, limit in zip(magnitudes, limits[start:end]):
+            top = brightest(row, limit)
+            selections.append((top, row[top]))
+    return selections
+
+
+def gather_padded(columns, selections, names):
+    """
+    Gather the selected stars of every planet into (planets, stars) arrays.
+
+    Parameters:
+    - columns (mapping): Column name -> array indexed by the selections (a catalog store or a dict).
+    - selections (list): One (rows, magnitudes) pair per planet.
+    - names (list): Columns to gather.
+
+    Returns:
+    - dict: Column name -> (planets, widest selection) array, NaN (or 0 for integers) past each selection,
+      plus "magnitude" and "counts" (stars selected for each planet).
+    """
+    counts = np.array([len(rows) for rows, _ in selections], dtype=np.int64)
+    width = int(counts.max()) if len(counts) else 0
+    valid = np.arange(width) < counts[:, np.newaxis]
+
+    # Pad every selection with row 0 and blank the padding out after the gather
+    rows = np.zeros((len(selections), width), dtype=np.int64)
+    magnitude = np.full((len(selections), width), np.nan)
+    for i, (selected_rows, selected_magnitudes) in enumerate(selections):
+        rows[i, :counts[i]] = selected_rows
+        magnitude[i, :counts[i]] = selected_magnitudes
+
+    gathered = {"magnitude": magnitude, "counts": counts}
+    for name in names:
+        values = np.asarray(columns[name][rows.ravel()]).reshape(rows.shape)
+        if np.issubdtype(values.dtype, np.floating):
+            values = np.where(valid, values, np.nan)
+        else:
+            values = np.where(valid, values, 0)
+        gathered[name] = values
+    return gathered
+
+
+def project_skies(x, y, z, distance, magnitude, counts):
+    """
+    Normalized projected coordinates and brightness for a chunk of planets.
+
+    Parameters:
+    - x, y, z, distance (np.ndarray): (planets, stars) positions and distances of the selected stars, NaN padded.
+    - magnitude (np.ndarray): (planets, stars) apparent magnitudes from each planet, brightest first.
+    - counts (np.ndarray): Stars selected for each planet.
+
+    Returns:
+    - x_normalized, y_normalized, relative_brightness (np.ndarray): (planets, stars) arrays.
+    """
+    # Project onto each planet's z = R plane, R being the largest distance of its stars
+    with np.errstate(invalid='ignore'):
+        R = np.fmax.reduce(distance, axis=-1, initial=-np.inf)
+    R = np.where(np.isfinite(R), R, np.nan)
+    x_projected, y_projected = planar_projection(x, y, z, R[:, np.newaxis])
+
+    # Mean modulus of each sky over its own stars only, see the module docstring
+    modulus = np.sqrt(np.square(x_projected) + np.square(y_projected))
+    normalization_value = np.empty(len(counts))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i, count in enumerate(counts):
+            normalization_value[i] = np.nanmean(modulus[i, :count]) if count else np.nan
+    x_normalized, y_normalized, _ = normalize_projection(
+        x_projected, y_projected, normalization_value=normalization_value
+    )
+
+    # The brightest star of each sky is the reference; min and max ignore the padding
+    reference_magnitude = magnitude[:, 0] if magnitude.shape[-1] else np.full(len(counts), np.nan)
+    relative_brightness = normalized_brightness(magnitude, reference_magnitude)
+    return x_normalized, y_normalized, relative_brightness
+
+
+def skies_from_selections(columns, selections, max_elements=MAX_CHUNK_ELEMENTS):
+    """
+    Final star arrays of every planet from its selected stars.
+
+    Parameters:
+    - columns (mapping): Arrays with source_id, x, y, z and distance, indexed by the selections.
+    - selections (list): One (rows, apparent magnitudes) pair per planet, brightest first.
+    - max_elements (int): Largest (planets, stars) array computed at once.
+
+    Returns:
+    - list: One (source_id, x_normalized, y_normalized, relative_brightness) tuple of arrays per planet.
+    """
+    skies = []
+    width = max((len(rows) for rows, _ in selections), default=0)
+    for start, end in chunk_ranges(len(selections), width, max_elements):
+        stars = gather_padded(columns, selections[start:end], ['source_id', 'x', 'y', 'z', 'distance'])
+        x_normalized, y_normalized, brightness = project_skies(
+            stars['x'], stars['y'], stars['z'], stars['distance'], stars['magnitude'], stars['counts']
+        )
+        for i, count in enumerate(stars['counts']):
+            skies.append(tuple(
+                array[i, :count].copy() for array in (stars['source_id'], x_normalized, y_normalized, brightness)
+            ))
+    return skies
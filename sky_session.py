@@ -0,0 +1,292 @@
+"""
+Incremental skies for an observer that moves in small steps.
+
+A fly-through calls the star API once per frame with slowly changing planet
+coordinates, and a full recompute selects, loads, projects and normalizes
+every star again. A session keeps what does not change between frames:
+
+- A pool of candidate stars: the stars within a magnitude margin of the N-th
+  brightest at the position the pool was built at, with their positions,
+  absolute magnitudes and projections.
+- The star set and brightness values last sent to the client.
+
+Each frame only computes the apparent magnitudes of the pool stars and picks
+the N brightest. Moving the observer by s parsecs brightens a star at distance
+d by at most 5 log10(d / (d - s)), so when the pool is built the largest step
+is computed for which no star left out of it (and no index block left
+unopened) can become brighter than the pool's magnitude limit. A frame within
+that step whose N-th star is within the limit is exact; otherwise the pool is
+rebuilt around the new position.
+
+The projection onto the z = R plane uses the stars' own position (see
+recalculate_star_positions), so the projected coordinates of a star never
+change; only the normalization scale does. Frames send them once, when the
+star enters the set, together with a per-frame scale:
+x_normalized = x * scale matches /star_positions/. Brightness is sent again
+only when it moved by more than the session tolerance.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from coordinate_kernels import planar_projection, normalized_brightness
+from magnitude_selection import apparent_magnitude, brightest
+
+# Apparent magnitudes beyond the N-th brightest star that a pool also covers
+POOL_MARGIN_MAG = 0.5
+
+
+def safe_step(abs_mag, distance, limit_magnitude):
+    """
+    Largest observer step after which none of the given stars can look brighter than a limit.
+
+    Parameters:
+    - abs_mag (np.ndarray): Absolute magnitudes (or lower bounds of them).
+    - distance (np.ndarray): Distances from the observer in parsecs (or lower bounds of them).
+    - limit_magnitude (float): Apparent magnitude the stars must stay fainter than.
+
+    Returns:
+    - float: The step in parsecs, inf if there are no stars.
+    """
+    if len(abs_mag) == 0:
+        return np.inf
+    # m = M + 5 log10((d - s) / 10) > limit  <=>  s < d - 10 ** ((limit - M) / 5 + 1)
+    with np.errstate(over='ignore'):
+        return float(np.min(distance - np.power(10.0, (limit_magnitude - abs_mag) / 5 + 1)))
+
+
+class StarPool:
+    """
+    Candidate stars of a session.
+
+    Parameters:
+    - source_id (np.ndarray): Gaia source identifiers.
+    - points (np.ndarray): (n, 3) star positions in parsecs.
+    - abs_mag (np.ndarray): Absolute magnitudes.
+    - anchor (np.ndarray): Observer position the pool was built at, None if the pool holds every star.
+    - limit_magnitude (float): N-th star magnitude up to which frames near the anchor are exact.
+    - step (float): Distance from the anchor, in parsecs, up to which frames are exact.
+    """
+
+    def __init__(self, source_id, points, abs_mag, anchor=None, limit_magnitude=np.inf, step=np.inf):
+        self.source_id = np.asarray(source_id)
+        self.points = np.asarray(points, dtype=np.float64)
+        self.abs_mag = np.asarray(abs_mag)
+        self.anchor = anchor
+        self.limit_magnitude = limit_magnitude
+        self.step = step
+
+        # Projection onto the z = 1 plane; the plane distance cancels out in the normalization
+        self.x, self.y = planar_projection(self.points[:, 0], self.points[:, 1], self.points[:, 2], 1.0)
+        self.modulus = np.hypot(self.x, self.y)
+
+    def __len__(self):
+        return len(self.source_id)
+
+    def covers(self, planet_position, threshold):
+        """True if no star outside the pool can be at least as bright as `threshold` from `planet_position`."""
+        if self.anchor is None:
+            return True
+        return threshold <= self.limit_magnitude and np.linalg.norm(planet_position - self.anchor) < self.step
+
+
+def index_pool(index, source_id, planet_position, limit, margin=POOL_MARGIN_MAG):
+    """
+    Build the candidate pool of a session around a planet position.
+
+    Parameters:
+    - index (MagnitudeBoundIndex): Brightness selection index of the catalog.
+    - source_id (np.ndarray): Source identifier of every catalog row.
+    - planet_position (np.ndarray): Observer position (x, y, z) in parsecs.
+    - limit (int): Number of stars per frame.
+    - margin (float): Magnitudes beyond the limit-th brightest star to cover.
+
+    Returns:
+    - StarPool: The stars within `margin` of the limit-th brightest, exact for frames whose limit-th star is
+      within half the margin.
+    """
+    magnitudes = index.select_brightest(planet_position, limit)[1]
+    if len(magnitudes) < limit:
+        cut = limit_magnitude = np.inf
+    else:
+        cut, limit_magnitude = magnitudes[-1] + margin, magnitudes[-1] + margin / 2
+
+    # Stars within the cut, from the blocks that can hold one
+    blocks = index.candidate_blocks(planet_position, cut)
+    positions = index.block_stars(blocks)
+    points, abs_mag = np.asarray(index.points[positions]), np.asarray(index.abs_mag[positions])
+    distance = np.sqrt(np.square(points - planet_position).sum(axis=1))
+    with np.errstate(divide='ignore'):
+        inside = abs_mag + 5 * np.log10(distance / 10) <= cut
+
+    # The pool is exact while neither a star left out nor an unopened block can get past the limit
+    unopened = np.ones(len(index.block_start) - 1, dtype=bool)
+    unopened[blocks] = False
+    gap = np.maximum(np.maximum(index.block_lower[unopened] - planet_position, 0),
+                     planet_position - index.block_upper[unopened])
+    step = min(
+        safe_step(abs_mag[~inside], distance[~inside], limit_magnitude),
+        safe_step(index.block_min_abs_mag[unopened], np.sqrt(np.square(gap).sum(axis=1)), limit_magnitude),
+    )
+    return StarPool(np.asarray(source_id)[np.asarray(index.order[positions[inside]])], points[inside],
+                    abs_mag[inside], anchor=planet_position, limit_magnitude=limit_magnitude, step=step)
+
+
+class SkySession:
+    """
+    State of one client's fly-through.
+
+    Parameters:
+    - build_pool (callable): build_pool(planet_position, limit) returns the StarPool around a position.
+    - limit (int): Number of stars per frame.
+    - tolerance (float): Brightness change below which a star's brightness is not sent again.
+    - planet_distance (float): Distance of the observer in parsecs, None if unknown; kept for the caller
+      turning planet coordinates into frame positions.
+    """
+
+    def __init__(self, build_pool, limit=10, tolerance=1e-3, planet_distance=None):
+        self.build_pool = build_pool
+        self.limit = limit
+        self.tolerance = tolerance
+        self.planet_distance = planet_distance
+        self.lock = threading.Lock()
+        self.pool = None
+        self.frames = 0
+        self.rebuilds = 0
+        self._ids = np.empty(0, dtype=np.int64)
+        self._brightness = np.empty(0)
+
+    def frame(self, planet_position, full=False):
+        """
+        Compute the next frame as a delta from the previous one.
+
+        Parameters:
+        - planet_position (array-like): Observer position (x, y, z) in parsecs.
+        - full (bool): Send every star, for a client that lost its state.
+
+        Returns:
+        - dict: "frame" number, "rebuilt" (the pool was rebuilt), "full", "count" of stars, "scale",
+          "added" as (source_id, x, y, brightness) arrays brightest first, "removed" source ids and
+          "brightness" as (source_id, brightness) arrays of the kept stars whose brightness changed.
+        """
+        planet_position = np.asarray(planet_position, dtype=np.float64)
+        with self.lock:
+            # The N brightest of the pool, exact unless a star outside it could now beat the N-th
+            rebuilt = self.pool is None
+            if rebuilt:
+                self.pool = self.build_pool(planet_position, self.limit)
+            top, magnitudes = self._select(planet_position)
+            threshold = magnitudes[-1] if len(top) == self.limit else np.inf
+            if not rebuilt and not self.pool.covers(planet_position, threshold):
+                self.pool = self.build_pool(planet_position, self.limit)
+                top, magnitudes = self._select(planet_position)
+                rebuilt = True
+            self.rebuilds += rebuilt
+
+            # Same normalizations as /star_positions/, on the stars of the frame
+            ids = self.pool.source_id[top]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scale = 200 / np.nanmean(self.pool.modulus[top]) if len(top) else np.nan
+            brightness = normalized_brightness(magnitudes, magnitudes[0]) if len(top) else np.empty(0)
+
+            # Compare with the sorted ids and brightness values the client holds
+            order = np.argsort(ids, kind="stable")
+            sorted_ids, sorted_brightness = ids[order], brightness[order]
+            if full:
+                kept = np.zeros(len(ids), dtype=bool)
+                removed = np.empty(0, dtype=self._ids.dtype)
+            else:
+                positions = np.minimum(np.searchsorted(self._ids, sorted_ids), max(len(self._ids) - 1, 0))
+                kept = (self._ids[positions] == sorted_ids) if len(self._ids) else np.zeros(len(ids), dtype=bool)
+                removed = self._ids[~np.isin(self._ids, sorted_ids, assume_unique=True)]
+            previous = self._brightness[positions] if kept.any() else np.zeros(len(ids))
+            unchanged = kept & ((np.abs(sorted_brightness - previous) <= self.tolerance)
+                                | (np.isnan(sorted_brightness) & np.isnan(previous)))
+            changed = kept & ~unchanged
+
+            # Unchanged stars keep the value the client has, so errors never add up past the tolerance
+            self._ids = sorted_ids
+            self._brightness = np.where(unchanged, previous, sorted_brightness)
+            self.frames += 1
+
+            added = np.empty(len(ids), dtype=bool)
+            added[order] = ~kept
+            changed_order = order[changed]
+            return {
+                "frame": self.frames,
+                "rebuilt": rebuilt,
+                "full": full,
+                "count": len(ids),
+                "scale": float(scale),
+                "added": (ids[added], self.pool.x[top][added], self.pool.y[top][added], brightness[added]),
+                "removed": removed,
+                "brightness": (ids[changed_order], brightness[changed_order]),
+            }
+
+    def _select(self, planet_position):
+        """Pool positions of the N brightest pool stars, brightest first, and their magnitudes."""
+        magnitudes = apparent_magnitude(self.pool.abs_mag, self.pool.points, planet_position)
+        top = brightest(magnitudes, self.limit)
+        return top, magnitudes[top]
+
+
+class SessionStore:
+    """
+    Sessions by id, dropped once idle for `ttl` seconds or when more than `max_sessions` exist.
+
+    Parameters:
+    - max_sessions (int): Sessions kept; the least recently used is dropped first.
+    - ttl (float): Idle seconds after which a session expires.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+
+    def add(self, session):
+        """Register a session and return its id."""
+        session_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), session)
+            self.created += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.expired += 1
+        return session_id
+
+    def get(self, session_id):
+        """Return the session, or None if it does not exist or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return None
+            if now - entry[0] >= self.ttl:
+                self.expired += 1
+                return None
+            self._sessions[session_id] = (now, entry[1])
+            return entry[1]
+
+    def remove(self, session_id):
+        """Drop a session; returns False if it did not exist."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        """Return the session count and the frame and pool rebuild counters of the live sessions."""
+        with self._lock:
+            sessions = [session for _, session in self._sessions.values()]
+            return {
+                "sessions": len(sessions),
+                "created": self.created,
+                "expired": self.expired,
+                "frames": sum(session.frames for session in sessions),
+                "rebuilds": sum(session.rebuilds for session in sessions),
+            }
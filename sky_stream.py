@@ -0,0 +1,139 @@
+"""
+Compute a planet's sky in brightest-first batches, for streaming responses.
+
+The normalized coordinates and brightness of every star depend on three
+constants of the whole selection: the projection distance R (the largest star
+distance), the mean modulus of the projected points and the brightness range.
+A first pass over the selected stars, batch by batch, computes them; a second
+pass then produces each batch with its final values. Apart from the selected
+row numbers and magnitudes, memory stays bounded by the batch size.
+
+Stars are described by a `load_batch(start, end)` callable returning a dict of
+"source_id", "x", "y", "z", "distance" and "magnitude" arrays for the stars
+start..end of the selection, brightest first.
+"""
+import numpy as np
+
+from coordinate_kernels import planar_projection, normalize_projection, normalized_brightness
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def catalog_batch_loader(catalog, rows, magnitudes):
+    """
+    Read selected stars of a catalog store batch by batch.
+
+    Parameters:
+    - catalog (Catalog): The catalog store.
+    - rows (np.ndarray): Selected catalog rows, brightest first.
+    - magnitudes (np.ndarray): Their apparent magnitudes from the planet.
+
+    Returns:
+    - callable: load_batch(start, end) as described in the module docstring.
+    """
+    def load_batch(start, end):
+        batch_rows = rows[start:end]
+        batch = {name: catalog[name][batch_rows] for name in ("source_id", "x", "y", "z", "distance")}
+        batch["magnitude"] = magnitudes[start:end]
+        return batch
+    return load_batch
+
+
+def frame_batch_loader(df, magnitude_column='apparent_mag'):
+    """
+    Read the stars of a DataFrame batch by batch.
+
+    Parameters:
+    - df (pd.DataFrame): Selected stars, brightest first, with SOURCE_ID, x, y, z and distance.
+    - magnitude_column (str): Column with the apparent magnitudes from the planet.
+
+    Returns:
+    - callable: load_batch(start, end) as described in the module docstring.
+    """
+    columns = {"source_id": "SOURCE_ID", "x": "x", "y": "y", "z": "z", "distance": "distance",
+               "magnitude": magnitude_column}
+
+    def load_batch(start, end):
+        return {name: df[column].to_numpy()[start:end] for name, column in columns.items()}
+    return load_batch
+
+
+def sky_constants(load_batch, count, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    First pass: the constants shared by every batch of a sky.
+
+    Parameters:
+    - load_batch (callable): Star loader, see the module docstring.
+    - count (int): Number of selected stars.
+    - batch_size (int): Stars read at a time.
+
+    Returns:
+    - dict: "R" (projection distance), "normalization_value" (mean modulus of the projected points),
+      "reference_magnitude" and "brightness_bounds" (min, max relative brightness).
+    """
+    if count == 0:
+        return {"R": np.nan, "normalization_value": np.nan, "reference_magnitude": np.nan,
+                "brightness_bounds": (np.nan, np.nan)}
+
+    reference_magnitude = load_batch(0, 1)["magnitude"][0]
+    max_distance = -np.inf
+    modulus_sum, modulus_count = 0.0, 0
+    min_brightness, max_brightness = np.inf, -np.inf
+
+    for start in range(0, count, batch_size):
+        batch = load_batch(start, min(start + batch_size, count))
+        if np.isfinite(batch["distance"]).any():
+            max_distance = max(max_distance, np.nanmax(batch["distance"]))
+
+        # R cancels out of the normalized coordinates, so the modulus is summed on the z = 1 plane
+        x_unit, y_unit = planar_projection(batch["x"], batch["y"], batch["z"], 1.0)
+        modulus = np.sqrt(np.square(x_unit) + np.square(y_unit))
+        modulus_sum += np.nansum(modulus)
+        modulus_count += np.count_nonzero(~np.isnan(modulus))
+
+        # Range of the un-normalized brightness relative to the brightest star
+        brightness = normalized_brightness(batch["magnitude"], reference_magnitude, bounds=(0, 1))
+        with np.errstate(invalid='ignore'):
+            if not np.isnan(brightness).all():
+                min_brightness = min(min_brightness, np.nanmin(brightness))
+                max_brightness = max(max_brightness, np.nanmax(brightness))
+
+    max_distance = max_distance if np.isfinite(max_distance) else np.nan
+    mean_modulus = modulus_sum / modulus_count if modulus_count else np.nan
+    return {
+        "R": max_distance,
+        "normalization_value": max_distance * mean_modulus,
+        "reference_magnitude": reference_magnitude,
+        "brightness_bounds": (min_brightness, max_brightness),
+    }
+
+
+def sky_batches(load_batch, count, batch_size=DEFAULT_BATCH_SIZE, constants=None):
+    """
+    Second pass: the final coordinates and brightness of the sky, one batch at a time.
+
+    Parameters:
+    - load_batch (callable): Star loader, see the module docstring.
+    - count (int): Number of selected stars.
+    - batch_size (int): Stars per batch.
+    - constants (dict): Result of sky_constants, computed here if not given.
+
+    Yields:
+    - tuple: source_id, x_normalized, y_normalized and relative_brightness arrays of a batch.
+    """
+    if constants is None:
+        constants = sky_constants(load_batch, count, batch_size)
+
+    for start in range(0, count, batch_size):
+        batch = load_batch(start, min(start + batch_size, count))
+
+        # Project onto the z = R plane and scale by the mean modulus of the whole sky
+        x_projected, y_projected = planar_projection(batch["x"], batch["y"], batch["z"], constants["R"])
+        x_normalized, y_normalized, _ = normalize_projection(
+            x_projected, y_projected, normalization_value=constants["normalization_value"]
+        )
+
+        brightness = normalized_brightness(
+            batch["magnitude"], constants["reference_magnitude"], bounds=constants["brightness_bounds"]
+        )
+        yield batch["source_id"], x_normalized, y_normalized, brightness
@@ -0,0 +1,285 @@
+"""
+Level-of-detail sky tiles: the catalog cut into HEALPix tiles and magnitude layers.
+
+Every star is assigned to the nested HEALPix pixel of its ICRS direction at a
+fixed order (the tile) and to a layer by its Gaia G magnitude, e.g. G < 6,
+6-9, 9-12, ... Each (tile, layer) block is a contiguous run of the tile arrays,
+so a client can ask for the bright layers of the tiles it shows first and for
+deeper layers only when it zooms in, and every block can be cached on its own.
+
+Blocks are transformed for a planet independently of each other, so their
+values cannot depend on which other stars are drawn:
+- x and y are the projection of /star_positions/, normalized once by the mean
+  modulus over every tiled star; it is stored with the tiles.
+- brightness is the flux relative to the brightest star seen from the planet,
+  so the planet's brightest star has brightness 1 and fainter stars tend to 0.
+
+Tiles and layers partition the catalog as seen from the Sun. From a distant
+planet the apparent magnitude of a star changes, so a layer is a level of
+detail rather than an exact magnitude cut for that planet, and stars inside a
+block are returned brightest first as seen from the planet.
+
+Usage:
+    python sky_tiles.py build catalog/ --order 3 --layers 6 9 12 15 18
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from coordinate_kernels import planar_projection, normalize_projection, normalized_brightness
+from magnitude_selection import absolute_magnitude, apparent_magnitude
+
+INDEX_DIR_NAME = "sky_tiles"
+
+# HEALPix order of the tiles: 12 * 4**3 = 768 tiles of about 54 square degrees
+DEFAULT_ORDER = 3
+
+# Upper G magnitude of every layer but the last, which holds all fainter stars
+DEFAULT_LAYER_EDGES = (6.0, 9.0, 12.0, 15.0, 18.0)
+
+
+def _spread_bits(values):
+    """Move bit i of every value to bit 2i, for the nested pixel number."""
+    values = values.astype(np.int64)
+    result = np.zeros_like(values)
+    for bit in range(30):
+        result |= ((values >> bit) & 1) << (2 * bit)
+    return result
+
+
+def healpix_nested(ra, dec, order):
+    """
+    Nested HEALPix pixel of celestial coordinates.
+
+    Parameters:
+    - ra (np.ndarray): Right Ascension in degrees.
+    - dec (np.ndarray): Declination in degrees.
+    - order (int): HEALPix order; there are 12 * 4**order pixels.
+
+    Returns:
+    - np.ndarray: Pixel numbers (int64). At order k + 1 the pixel number shifted right by 2 is the pixel at order k.
+    """
+    nside = 1 << order
+    z = np.sin(np.radians(np.asarray(dec, dtype=np.float64)))
+    tt = np.mod(np.asarray(ra, dtype=np.float64), 360.0) / 90.0
+    tt = np.where(tt >= 4.0, 0.0, tt)
+    z_abs = np.abs(z)
+
+    # Equatorial belt: faces 4-7 and the equatorial halves of the polar faces
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp, ifm = jp // nside, jm // nside
+    face = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix = jm & (nside - 1)
+    iy = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps, |z| > 2/3
+    polar = z_abs > 2.0 / 3.0
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * np.sqrt(3 * (1 - z_abs))
+    jp_polar = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm_polar = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face = np.where(polar, np.where(north, ntt, ntt + 8), face)
+    ix = np.where(polar, np.where(north, nside - jm_polar - 1, jp_polar), ix)
+    iy = np.where(polar, np.where(north, nside - jp_polar - 1, jm_polar), iy)
+
+    return face * nside * nside + (_spread_bits(ix) | (_spread_bits(iy) << 1))
+
+
+def magnitude_layer(magnitude, layer_edges):
+    """Layer of each magnitude: 0 below the first edge, len(layer_edges) at or above the last."""
+    return np.searchsorted(np.asarray(layer_edges, dtype=np.float64), magnitude, side="right")
+
+
+class SkyTiles:
+    """
+    Catalog stars grouped by (tile, layer) block.
+
+    Attributes:
+    - source_id (np.ndarray): Gaia source identifier of each star, in block order.
+    - x_normalized, y_normalized (np.ndarray): Normalized projected coordinates, in block order.
+    - abs_mag (np.ndarray): Absolute magnitude of each star, in block order.
+    - points (np.ndarray): (n, 3) star positions in parsecs, in block order.
+    - block_start (np.ndarray): First star of block tile * layers + layer, plus the star count.
+    - order (int): HEALPix order of the tiles.
+    - layer_edges (tuple): Magnitude edges between the layers.
+    - normalization_value (float): Mean modulus the coordinates were divided by.
+    """
+
+    ARRAYS = ["source_id", "x_normalized", "y_normalized", "abs_mag", "points", "block_start"]
+
+    def __init__(self, order, layer_edges, normalization_value, catalog_version=None, **arrays):
+        self.order = order
+        self.layer_edges = tuple(layer_edges)
+        self.normalization_value = normalization_value
+        self.catalog_version = catalog_version
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self):
+        return len(self.source_id)
+
+    @property
+    def tiles(self):
+        return 12 * 4 ** self.order
+
+    @property
+    def layers(self):
+        return len(self.layer_edges) + 1
+
+    @classmethod
+    def build(cls, catalog, order=DEFAULT_ORDER, layer_edges=DEFAULT_LAYER_EDGES):
+        """
+        Build the tiles of a catalog store.
+
+        Parameters:
+        - catalog (Catalog): Catalog store with ra, dec, x, y, z, distance and phot_g_mean_mag columns.
+        - order (int): HEALPix order of the tiles.
+        - layer_edges (list): Increasing G magnitudes separating the layers.
+
+        Returns:
+        - SkyTiles: The tiles.
+        """
+        points = np.column_stack((catalog["x"], catalog["y"], catalog["z"])).astype(np.float64)
+        magnitude = np.asarray(catalog["phot_g_mean_mag"])
+        abs_mag = absolute_magnitude(magnitude, np.asarray(catalog["distance"]))
+
+        # The same stars as the brightness selection: visible, with a position and a magnitude
+        rows = np.flatnonzero(np.isfinite(abs_mag) & np.isfinite(points).all(axis=1))
+
+        # Sort the stars by block, and by magnitude inside a block
+        layers = len(layer_edges) + 1
+        blocks = healpix_nested(np.asarray(catalog["ra"])[rows], np.asarray(catalog["dec"])[rows], order) * layers
+        blocks += magnitude_layer(magnitude[rows], layer_edges)
+        sort = np.lexsort((magnitude[rows], blocks))
+        rows, blocks = rows[sort], blocks[sort]
+        block_start = np.searchsorted(blocks, np.arange(12 * 4 ** order * layers + 1))
+
+        # Project once, with one normalization shared by every block
+        sorted_points = points[rows]
+        x_projected, y_projected = planar_projection(
+            sorted_points[:, 0], sorted_points[:, 1], sorted_points[:, 2], np.asarray(catalog["distance"])[rows].max()
+            if len(rows) else 1.0
+        )
+        x_normalized, y_normalized, normalization_value = normalize_projection(x_projected, y_projected)
+
+        return cls(
+            order, tuple(float(edge) for edge in layer_edges), float(normalization_value),
+            catalog_version=catalog.version,
+            source_id=np.asarray(catalog["source_id"])[rows], x_normalized=x_normalized, y_normalized=y_normalized,
+            abs_mag=abs_mag[rows], points=sorted_points, block_start=block_start,
+        )
+
+    def save(self, path):
+        """Write the tile arrays and their description into directory `path`."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            tmp_path = os.path.join(path, f"{name}.npy.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({
+                "catalog_version": self.catalog_version,
+                "order": self.order,
+                "layer_edges": list(self.layer_edges),
+                "normalization_value": self.normalization_value,
+            }, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open tiles written by save, memory-mapping their arrays."""
+        with open(os.path.join(path, "index.json")) as f:
+            description = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in cls.ARRAYS
+        }
+        return cls(description["order"], description["layer_edges"], description["normalization_value"],
+                   catalog_version=description["catalog_version"], **arrays)
+
+    def counts(self):
+        """Return a (tiles, layers) array with the number of stars of every block."""
+        return np.diff(self.block_start).reshape(self.tiles, self.layers)
+
+    def block(self, tile, layer, planet_position, reference_magnitude):
+        """
+        Transform the stars of one block for a planet.
+
+        Parameters:
+        - tile (int): Nested HEALPix pixel at the tiles' order.
+        - layer (int): Magnitude layer.
+        - planet_position (array-like): Planet position (x, y, z) in parsecs.
+        - reference_magnitude (float): Apparent magnitude of the brightest star seen from the planet.
+
+        Returns:
+        - tuple: source_id, x_normalized, y_normalized and relative_brightness arrays, brightest star first.
+        """
+        if not (0 <= tile < self.tiles and 0 <= layer < self.layers):
+            raise IndexError(f"No block ({tile}, {layer}) in {self.tiles} tiles of {self.layers} layers")
+        start, end = self.block_start[tile * self.layers + layer], self.block_start[tile * self.layers + layer + 1]
+
+        # Apparent magnitudes from the planet decide the order inside the block
+        magnitudes = apparent_magnitude(self.abs_mag[start:end], self.points[start:end],
+                                        np.asarray(planet_position, dtype=np.float64))
+        order = np.argsort(magnitudes, kind="stable") + start
+
+        # Bounds (0, 1) keep the plain flux ratio to the planet's brightest star
+        brightness = normalized_brightness(magnitudes[order - start], reference_magnitude, bounds=(0.0, 1.0))
+        return (
+            np.asarray(self.source_id[order]),
+            np.asarray(self.x_normalized[order]),
+            np.asarray(self.y_normalized[order]),
+            brightness,
+        )
+
+
+def load_sky_tiles(catalog, mmap=True):
+    """
+    Open the sky tiles saved inside a catalog store.
+
+    Parameters:
+    - catalog (Catalog): The store the tiles were built for.
+    - mmap (bool): Memory-map the tile arrays.
+
+    Returns:
+    - SkyTiles: The tiles, or None if they are missing or were built for another catalog version.
+    """
+    path = os.path.join(catalog.path, INDEX_DIR_NAME)
+    if not os.path.exists(os.path.join(path, "index.json")):
+        return None
+    tiles = SkyTiles.load(path, mmap=mmap)
+    if tiles.catalog_version != catalog.version:
+        return None
+    return tiles
+
+
+def main():
+    from catalog_store import load_catalog
+
+    parser = argparse.ArgumentParser(description="Build the level-of-detail sky tiles of a catalog store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build and save the sky tiles.")
+    build_parser.add_argument("path", help="Directory of the catalog store.")
+    build_parser.add_argument("--order", type=int, default=DEFAULT_ORDER, help="HEALPix order of the tiles.")
+    build_parser.add_argument("--layers", type=float, nargs="+", default=list(DEFAULT_LAYER_EDGES),
+                              help="G magnitudes separating the layers.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    catalog = load_catalog(args.path)
+    tiles = SkyTiles.build(catalog, order=args.order, layer_edges=sorted(args.layers))
+    tiles.save(os.path.join(args.path, INDEX_DIR_NAME))
+    logging.info("Wrote %d stars in %d tiles of %d layers to %s",
+                 len(tiles), tiles.tiles, tiles.layers, os.path.join(args.path, INDEX_DIR_NAME))
+
+
+if __name__ == "__main__":
+    main()
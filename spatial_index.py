@@ -0,0 +1,105 @@
+"""
+KD-tree partition of Cartesian star positions, the spatial blocks of MagnitudeBoundIndex.
+
+The tree is implicit: nodes are numbered breadth-first (children of node i are
+2i + 1 and 2i + 2), every split is at the median of the widest axis and all
+leaves sit on the last level. It is held as a handful of flat arrays: the
+points in tree order, the catalog row of each and the bounding box of every
+node. MagnitudeBoundIndex builds one tree per absolute-magnitude band and
+keeps its leaves as the blocks whose bounding boxes bound the apparent
+magnitude seen from a planet (see magnitude_selection.py), which is how the
+brightest stars from an arbitrary vantage point are found without a scan.
+"""
+import math
+
+import numpy as np
+
+
+class StarIndex:
+    """
+    Static KD-tree over star positions, built once and read through its arrays.
+
+    Attributes:
+    - points (np.ndarray): (n, 3) star positions in tree order.
+    - order (np.ndarray): Catalog row of each entry of `points`.
+    - lower, upper (np.ndarray): (nodes, 3) bounding box of every node.
+    - depth (int): Level of the leaves; the root is level 0.
+    """
+
+    def __init__(self, points, order, lower, upper, depth, leaf_size):
+        self.points = points
+        self.order = order
+        self.lower = lower
+        self.upper = upper
+        self.depth = depth
+        self.leaf_size = leaf_size
+
+    def __len__(self):
+        return len(self.order)
+
+    @classmethod
+    def build(cls, x, y, z, leaf_size=64):
+        """
+        Build the tree over the stars with a finite position.
+
+        Parameters:
+        - x, y, z (np.ndarray): Cartesian star positions, one entry per catalog row.
+        - leaf_size (int): Maximum number of stars in a leaf.
+
+        Returns:
+        - StarIndex: The built tree.
+        """
+        points = np.column_stack((x, y, z)).astype(np.float64)
+
+        # Stars without a usable parallax have no position and are left out
+        order = np.flatnonzero(np.isfinite(points).all(axis=1))
+        points = points[order]
+        n = len(order)
+
+        depth = max(0, math.ceil(math.log2(n / leaf_size))) if n else 0
+        node_count = 2 ** (depth + 1) - 1
+        lower = np.full((node_count, 3), np.inf)
+        upper = np.full((node_count, 3), -np.inf)
+
+        # Split every node at the median of its widest axis, one level at a time
+        for node in range(node_count):
+            start, end = node_range(node, n)
+            if start == end:
+                continue
+            node_points = points[start:end]
+            lower[node] = node_points.min(axis=0)
+            upper[node] = node_points.max(axis=0)
+            if node >= 2 ** depth - 1:
+                continue
+            axis = int(np.argmax(upper[node] - lower[node]))
+            mid = (start + end) // 2 - start
+            if 0 < mid < end - start:
+                partition = np.argpartition(node_points[:, axis], mid)
+                points[start:end] = node_points[partition]
+                order[start:end] = order[start:end][partition]
+
+        return cls(points, order, lower, upper, depth, leaf_size)
+
+
+def node_range(node, n):
+    """
+    Range of tree positions covered by a node of the implicit tree.
+
+    Parameters:
+    - node (int): Breadth-first node number.
+    - n (int): Number of points in the tree.
+
+    Returns:
+    - tuple: (start, end) positions, end exclusive.
+    """
+    level = (node + 1).bit_length() - 1
+    start, end = 0, n
+    # Follow the path from the root, each bit choosing the lower or upper half
+    path = node + 1 - (1 << level)
+    for bit in range(level - 1, -1, -1):
+        mid = (start + end) // 2
+        if (path >> bit) & 1:
+            start = mid
+        else:
+            end = mid
+    return start, end
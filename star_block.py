@@ -0,0 +1,193 @@
+"""
+Compact column block holding the stars of one sky, and the pandas-free pipeline over it.
+
+recalculate_star_positions works on a DataFrame: the catalog rows come with
+every Gaia column, each stage adds full-length float64 columns (x_relative,
+y_relative, z_relative, relative_brightness_normalized, ...) and the projection
+builds a second DataFrame, so a sky peaks at around 400 bytes per star
+(benchmarks/bench_star_block.py). A StarBlock keeps only what the projection reads, and the
+inputs and intermediates live in per-thread scratch buffers that the next sky
+computed on the same thread reuses:
+
+    column                   dtype     bytes/star   storage
+    x, y, z, distance        float64   32           scratch
+    x/y projected            float64   16           scratch
+    magnitude                float64   8            from the selection
+    source_id                int64     8            result
+    x/y normalized           float64   16           result
+    brightness               float64   8            result
+
+That is 88 bytes per star, of which only the 32 bytes of the result are
+allocated per request; the measured peak, catalog pages included, is around
+120 bytes per star. Positions stay float64: with float32 the served
+coordinates, which are cached and baked into sky archives, would change.
+
+The shift relative to the planet is not computed: the projection uses the
+stars' own positions, so the shifted columns of the DataFrame pipeline were
+never read.
+"""
+import threading
+
+import numpy as np
+
+from coordinate_kernels import (
+    horizon_projection,
+    horizon_rotation,
+    planar_projection,
+    normalize_projection,
+    normalized_brightness,
+)
+
+# Skies larger than this get temporary buffers instead of growing the per-thread scratch
+MAX_SCRATCH_STARS = 1 << 20
+
+
+class ScratchBuffers(threading.local):
+    """Per-thread float64 buffers that grow to the largest sky seen and are reused afterwards."""
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, rows, n):
+        """
+        Return a (rows, n) float64 view of the thread's buffer `name`.
+
+        Parameters:
+        - name (str): Buffer name; different names never overlap.
+        - rows (int): Number of rows.
+        - n (int): Number of stars.
+
+        Returns:
+        - np.ndarray: The view, valid until the thread asks for the same buffer again.
+        """
+        if n > MAX_SCRATCH_STARS:
+            return np.empty((rows, n))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape[0] != rows or buffer.shape[1] < n:
+            buffer = np.empty((rows, n))
+            self._buffers[name] = buffer
+        return buffer[:, :n]
+
+
+scratch = ScratchBuffers()
+
+
+class StarBlock:
+    """
+    The stars of one sky, brightest first, as separate columns.
+
+    Parameters:
+    - source_id (np.ndarray): Gaia source identifiers.
+    - x, y, z (np.ndarray): ICRS Cartesian positions in parsecs.
+    - distance (np.ndarray): Distances from the Sun in parsecs.
+    - magnitude (np.ndarray): Apparent magnitudes brightness is computed from.
+    - columns (callable): Returns any other column of the selected stars by name, e.g. "pmra".
+    """
+
+    def __init__(self, source_id, x, y, z, distance, magnitude, columns=None):
+        self.source_id = source_id
+        self.x = x
+        self.y = y
+        self.z = z
+        self.distance = distance
+        self.magnitude = magnitude
+        self._columns = columns
+
+    def __len__(self):
+        return len(self.source_id)
+
+    @classmethod
+    def from_catalog(cls, catalog, rows, magnitudes):
+        """
+        Gather selected catalog rows into the thread's scratch buffers.
+
+        Parameters:
+        - catalog (Catalog): Catalog store with x, y, z and distance columns.
+        - rows (np.ndarray): Selected rows, brightest first.
+        - magnitudes (np.ndarray): Their apparent magnitudes.
+
+        Returns:
+        - StarBlock: The block, valid until the thread gathers its next block.
+        """
+        positions = scratch.get("positions", 4, len(rows))
+        for i, name in enumerate(("x", "y", "z", "distance")):
+            np.take(catalog[name], rows, out=positions[i])
+        return cls(np.asarray(catalog["source_id"][rows]), positions[0], positions[1], positions[2], positions[3],
+                   magnitudes, columns=lambda name: np.asarray(catalog[name][rows]))
+
+    @classmethod
+    def from_frame(cls, df, magnitude_column='apparent_mag'):
+        """Wrap the columns of a DataFrame of selected stars (live Gaia query) without copying them."""
+        return cls(df['SOURCE_ID'].to_numpy(), df['x'].to_numpy(), df['y'].to_numpy(), df['z'].to_numpy(),
+                   df['distance'].to_numpy(), df[magnitude_column].to_numpy(),
+                   columns=lambda name: df[name].to_numpy())
+
+    def column(self, name):
+        """Return another column of the selected stars, e.g. "pmra"."""
+        return self._columns(name)
+
+    def moved(self, x, y, z, magnitude):
+        """Return the same stars at other positions and magnitudes."""
+        return StarBlock(self.source_id, x, y, z, self.distance, magnitude, columns=self._columns)
+
+
+def project_block(block):
+    """
+    Project, normalize and compute the brightness of a block, as recalculate_star_positions does.
+
+    Parameters:
+    - block (StarBlock): The stars, brightest first.
+
+    Returns:
+    - tuple: source_id, x_normalized, y_normalized and relative_brightness arrays, not aliasing any scratch buffer.
+    """
+    n = len(block)
+    if n == 0:
+        return block.source_id, np.empty(0), np.empty(0), np.empty(0, dtype=np.asarray(block.magnitude).dtype)
+
+    # Project onto the z = R plane, R being the largest distance from the Sun
+    projected = scratch.get("projected", 2, n)
+    planar_projection(block.x, block.y, block.z, np.nanmax(block.distance), out=projected)
+
+    # Normalize by the mean modulus straight into the result
+    normalized = np.empty((2, n))
+    x_normalized, y_normalized, _ = normalize_projection(projected[0], projected[1], out=normalized)
+
+    # Brightness relative to the first (brightest) star, normalized between 0 and 1
+    brightness = normalized_brightness(block.magnitude, block.magnitude[0])
+
+    return block.source_id, x_normalized, y_normalized, brightness
+
+
+def project_block_horizon(block, planet_position, planet_ra, planet_dec):
+    """
+    Project the stars of a block that are above a planet's horizon, with the fused horizon_projection kernel.
+
+    Parameters:
+    - block (StarBlock): The stars, brightest first.
+    - planet_position (tuple): Cartesian position (x, y, z) of the planet in parsecs.
+    - planet_ra, planet_dec (float): Planet's coordinates in degrees, which orient its horizon frame.
+
+    Returns:
+    - tuple: source_id, x_normalized, y_normalized and relative_brightness arrays of the visible stars, brightest
+      first, not aliasing any scratch buffer.
+    """
+    n = len(block)
+    if n == 0:
+        return block.source_id, np.empty(0), np.empty(0), np.empty(0, dtype=np.asarray(block.magnitude).dtype)
+
+    # The kernel rotates a (3, n) array; the block's columns are gathered into one scratch buffer
+    positions = scratch.get("positions_icrs", 3, n)
+    for i, column in enumerate((block.x, block.y, block.z)):
+        positions[i] = column
+    visible, x_normalized, y_normalized, _ = horizon_projection(
+        positions, planet_position, horizon_rotation(planet_ra, planet_dec), out=scratch.get("horizon", 3, n)
+    )
+    if len(visible) == 0:
+        return block.source_id[:0], x_normalized, y_normalized, np.empty(0, dtype=np.asarray(block.magnitude).dtype)
+
+    # Brightness relative to the brightest visible star, normalized between 0 and 1 over the visible stars
+    magnitude = np.asarray(block.magnitude)[visible]
+    brightness = normalized_brightness(magnitude, magnitude[0])
+
+    return np.asarray(block.source_id)[visible], x_normalized, y_normalized, brightness
@@ -0,0 +1,152 @@
+"""
+Wire formats of a computed sky: the default JSON object and a packed binary layout.
+
+The binary payload is a 24-byte little-endian header followed by one array per
+field, each starting on a boundary its element size divides, so a browser or
+Godot client can wrap them in typed arrays without copying:
+
+    offset  type      field
+    0       char[4]   magic b"STAR"
+    4       uint8     format version (1)
+    5       uint8     encoding: 0 = float32, 1 = int16 quantized
+    6       uint16    reserved (0)
+    8       uint32    star count n
+    12      float32   x/y step: coordinate = value * step (1.0 for float32)
+    16      float32   brightness step (1.0 for float32)
+    20      uint32    reserved (0)
+    24      int64[n]  source_id
+    ...     x[n], y[n], brightness[n] as float32 or int16
+
+In the int16 encoding the coordinates are rounded to a multiple of the x/y step
+(the largest finite |x| or |y| divided by 32767) and brightness to a multiple
+of 1/32767, so every value is within half a step of the float32 one. Missing
+values (NaN or infinite) are stored as -32768.
+"""
+import struct
+
+import numpy as np
+
+MEDIA_TYPE = "application/x-star-positions"
+
+MAGIC = b"STAR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sBBHIffI")
+
+ENCODINGS = {"float32": 0, "int16": 1}
+
+INT16_LEVELS = 32767
+INT16_MISSING = -32768
+
+
+def negotiate(accept):
+    """
+    Pick the response format from an HTTP Accept header.
+
+    Parameters:
+    - accept (str): Value of the Accept header, possibly None.
+
+    Returns:
+    - str: None for the default JSON, otherwise the binary encoding ("float32" or "int16"),
+      chosen with the media type parameter, e.g. "application/x-star-positions; encoding=int16".
+    """
+    for media_range in (accept or "").split(","):
+        media_type, *parameters = (part.strip() for part in media_range.split(";"))
+        if media_type.lower() != MEDIA_TYPE:
+            continue
+        options = dict(parameter.partition("=")[::2] for parameter in parameters)
+        encoding = options.get("encoding", "float32").strip().lower()
+        if encoding in ENCODINGS:
+            return encoding
+    return None
+
+
+def to_json_dict(source_id, x, y, brightness):
+    """
+    Build the default JSON response {source_id: [x_normalized, y_normalized, relative_brightness]}.
+
+    Parameters:
+    - source_id (np.ndarray): Gaia source identifiers.
+    - x, y (np.ndarray): Normalized projected coordinates.
+    - brightness (np.ndarray): Normalized relative brightness.
+
+    Returns:
+    - dict: One entry per star.
+    """
+    values = np.column_stack((x, y, brightness)).tolist()
+    return dict(zip(np.asarray(source_id).tolist(), values))
+
+
+def _quantize(values, step):
+    """Round `values` to int16 multiples of `step`, marking non-finite values as missing."""
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    quantized = np.full(values.shape, INT16_MISSING, dtype="<i2")
+    if step > 0:
+        quantized[finite] = np.clip(np.rint(values[finite] / step), -INT16_LEVELS, INT16_LEVELS)
+    else:
+        quantized[finite] = 0
+    return quantized
+
+
+def encode_binary(source_id, x, y, brightness, encoding="float32"):
+    """
+    Pack a computed sky into the binary layout described in the module docstring.
+
+    Parameters:
+    - source_id (np.ndarray): Gaia source identifiers.
+    - x, y (np.ndarray): Normalized projected coordinates.
+    - brightness (np.ndarray): Normalized relative brightness, between 0 and 1.
+    - encoding (str): "float32" or "int16".
+
+    Returns:
+    - bytes: The payload.
+    """
+    count = len(source_id)
+    if encoding == "int16":
+        # One step covers the widest finite coordinate, so nothing is clipped
+        coordinates = np.concatenate((np.abs(x), np.abs(y)))
+        coordinates = coordinates[np.isfinite(coordinates)]
+        xy_step = float(coordinates.max()) / INT16_LEVELS if len(coordinates) else 0.0
+        brightness_step = 1.0 / INT16_LEVELS
+        xy_step = float(np.float32(xy_step))
+        arrays = [_quantize(x, xy_step), _quantize(y, xy_step), _quantize(brightness, brightness_step)]
+    elif encoding == "float32":
+        xy_step = brightness_step = 1.0
+        arrays = [np.asarray(values, dtype="<f4") for values in (x, y, brightness)]
+    else:
+        raise ValueError(f"Unknown encoding {encoding!r}, expected one of {sorted(ENCODINGS)}")
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, ENCODINGS[encoding], 0, count, xy_step, brightness_step, 0)
+    ids = np.asarray(source_id, dtype="<i8")
+    return b"".join([header, ids.tobytes()] + [array.tobytes() for array in arrays])
+
+
+def decode_binary(payload):
+    """
+    Unpack a payload written by encode_binary.
+
+    Parameters:
+    - payload (bytes): The binary response body.
+
+    Returns:
+    - dict: "source_id" (int64) and "x", "y", "brightness" (float32, NaN where missing) arrays,
+      plus the "encoding" and the "xy_step" and "brightness_step" precision of the values.
+    """
+    magic, version, encoding_code, _, count, xy_step, brightness_step, _ = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Not a star positions payload of a supported version")
+    encoding = {code: name for name, code in ENCODINGS.items()}[encoding_code]
+
+    offset = HEADER.size
+    source_id = np.frombuffer(payload, dtype="<i8", count=count, offset=offset)
+    offset += 8 * count
+
+    dtype = "<f4" if encoding == "float32" else "<i2"
+    decoded = {"source_id": source_id, "encoding": encoding, "xy_step": xy_step, "brightness_step": brightness_step}
+    for name, step in (("x", xy_step), ("y", xy_step), ("brightness", brightness_step)):
+        values = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        if encoding == "int16":
+            values = np.where(values == INT16_MISSING, np.nan, values * np.float32(step)).astype(np.float32)
+        decoded[name] = values
+    return decoded